@@ -0,0 +1,19 @@
+import asyncio
+import os
+from api import create_cache
+from api.aio import AsyncCacheServer, check_config, load_config
+from api.resp import RespServer
+
+
+async def main(host, port):
+    config = load_config(os.getenv('APP_ENV', 'development'))
+    check_config(config)
+    cache = create_cache(config)
+    if config.get('RESP_PORT', 0):
+        await RespServer(cache).start(config.get('RESP_HOST', '0.0.0.0'), config['RESP_PORT'])
+    server = AsyncCacheServer(cache)
+    async with await server.start(host, port) as listener:
+        await listener.serve_forever()
+
+if __name__ == '__main__':
+    asyncio.run(main(os.getenv('HOST', '0.0.0.0'), int(os.getenv('PORT', 8080))))
@@ -1,9 +1,19 @@
+import atexit
+import importlib
 from flask import Flask
 from flask_restful import Api
 from flask_cors import CORS
 from instance.config import config
-from .cache import EvictionStrategies, Cache
-from .api import CacheApi
+from .cache import EvictionStrategies, Cache, ConcurrentCache, SharedMemoryCache, ReadThroughCache
+from .cache.persistence import load_snapshot, SnapshotWriter
+from .cache.aof import replay_log, OperationLog
+from .cache.replication import ReplicationServer, ReplicaClient
+from .cache.feed import InvalidationFeed
+from .resp import start_resp_server
+from .api import (
+    CacheApi, CacheTtlApi, CacheTouchApi, CacheBatchGetApi, CacheBatchSetApi, CacheBatchDeleteApi,
+    CacheInvalidateApi, CacheScanApi, InvalidationApi, MetricsApi, ReplicationApi
+)
 
 
 def create_app(config_name):
@@ -26,15 +36,146 @@ def create_app(config_name):
     app.config.from_pyfile('config.py')
     
     # Initialize the cache using the config params
-    cache = Cache(
-        app.config['NUMBER_OF_SLOTS'], 
-        app.config['TIME_TO_LIVE'], 
-        EvictionStrategies(app.config['EVICTION_POLICY'])
-    )
-    CacheApi.initialize_cache(cache)
+    cache = create_cache(app.config)
+    replica_of = app.config.get('REPLICA_OF', '')
+    CacheApi.initialize_cache(cache, app.config.get('XFETCH_BETA', 0), read_only=bool(replica_of))
+
+    # Replicate a primary, which makes the cache read-only, or stream the
+    # changes of the cache to the replicas if a port is set
+    ReplicationApi.replication = None
+    if replica_of:
+        host, port = replica_of.rsplit(':', 1)
+        ReplicationApi.replication = ReplicaClient(cache, host, int(port))
+    elif app.config.get('REPLICATION_PORT', 0):
+        ReplicationApi.replication = ReplicationServer(
+            cache, app.config.get('REPLICATION_HOST', '0.0.0.0'), app.config['REPLICATION_PORT']
+        )
+    if ReplicationApi.replication is not None:
+        ReplicationApi.replication.start()
+        atexit.register(ReplicationApi.replication.stop)
+
+    # Publish the changed keys to the near-caching clients
+    CacheApi.feed = None
+    if app.config.get('INVALIDATION_FEED_SIZE', 0):
+        CacheApi.feed = InvalidationFeed(cache, app.config['INVALIDATION_FEED_SIZE'])
+        CacheApi.feed.start()
+
+    # Serve the cache to Redis clients too if a port is set
+    if app.config.get('RESP_PORT', 0):
+        start_resp_server(
+            cache, app.config.get('RESP_HOST', '0.0.0.0'), app.config['RESP_PORT'],
+            read_only=bool(replica_of)
+        )
 
     # Set the routes
     
     api.add_resource(CacheApi, '/object/<string:key>')
+    api.add_resource(CacheTtlApi, '/object/<string:key>/ttl')
+    api.add_resource(CacheTouchApi, '/object/<string:key>/touch')
+    api.add_resource(CacheBatchGetApi, '/objects/mget')
+    api.add_resource(CacheBatchSetApi, '/objects/mset')
+    api.add_resource(CacheBatchDeleteApi, '/objects/mdelete')
+    api.add_resource(CacheInvalidateApi, '/objects/invalidate')
+    api.add_resource(CacheScanApi, '/objects/scan')
+    api.add_resource(InvalidationApi, '/invalidations')
+    api.add_resource(MetricsApi, '/metrics')
+    api.add_resource(ReplicationApi, '/replication')
+
+    return app
+
+
+def create_cache(config):
+    """Creates the cache described by the config parameters and starts its
+    background expiry sweeper if one is configured.
+
+    input:
+        config: a mapping of the configuration parameters
+    """
+
+    shared_memory_path = config.get('SHARED_MEMORY_PATH', '')
+    if shared_memory_path:
+        check_shared_memory_config(config)
+    args = (
+        config['NUMBER_OF_SLOTS'],
+        config['TIME_TO_LIVE'],
+        EvictionStrategies(config['EVICTION_POLICY']),
+        config.get('MAX_BYTES', 0)
+    )
+    cache_options = {
+        'compression_threshold': config.get('COMPRESSION_THRESHOLD', 0),
+        'compression_codec': config.get('COMPRESSION_CODEC', 'gzip'),
+        'stale_grace': config.get('STALE_GRACE', 0),
+        'ttl_jitter': config.get('TTL_JITTER', 0),
+        'prefix_index': config.get('PREFIX_INDEX', False),
+        'sliding_expiration': config.get('SLIDING_EXPIRATION', False),
+    }
+    segments = config.get('CACHE_SEGMENTS', 1)
+    if shared_memory_path:
+        # the shared memory cache stores the values uncompressed
+        cache = SharedMemoryCache(shared_memory_path, *args[:3], args[3] or 64 * 1024 * 1024)
+    elif segments > 1:
+        cache = ConcurrentCache(*args, segments=segments, **cache_options)
+    else:
+        cache = Cache(*args, **cache_options)
+
+    # Restore the operation log, which is more recent than the snapshot if
+    # both are kept, or else the last snapshot, and save new ones periodically
+    snapshot_path = config.get('SNAPSHOT_PATH', '')
+    aof_path = config.get('AOF_PATH', '')
+    replayed = replay_log(cache, aof_path) if aof_path else 0
+    if snapshot_path:
+        if not replayed:
+            load_snapshot(cache, snapshot_path)
+        snapshot_writer = SnapshotWriter(cache, snapshot_path, config.get('SNAPSHOT_INTERVAL', 300))
+        snapshot_writer.start()
+        atexit.register(snapshot_writer.stop)
+
+    # Append the changes to the operation log
+    if aof_path:
+        operation_log = OperationLog(
+            cache, aof_path,
+            config.get('AOF_FSYNC_INTERVAL', 1),
+            config.get('AOF_COMPACT_MIN_SIZE', 64 * 1024 * 1024)
+        )
+        operation_log.start()
+        atexit.register(operation_log.stop)
+
+    sweep_interval = config.get('EXPIRY_SWEEP_INTERVAL', 0)
+    if sweep_interval > 0:
+        cache.start_sweeper(
+            sweep_interval,
+            config.get('EXPIRY_SWEEP_SAMPLES', 20),
+            config.get('EXPIRY_SWEEP_BUDGET_MS', 5)
+        )
+
+    # Load the missing keys from the origin through the configured loaders
+    loaders = config.get('READ_THROUGH_LOADERS', {})
+    if loaders:
+        cache = ReadThroughCache(cache, beta=config.get('XFETCH_BETA', 0))
+        for prefix, path in loaders.items():
+            module_name, function_name = path.split(':')
+            cache.add_loader(prefix, getattr(importlib.import_module(module_name), function_name))
+    return cache
+
 
-    return app
\ No newline at end of file
+# The options that SharedMemoryCache does not support. The ones of the first
+# line need the observers of the cache, which it does not have since it is
+# changed by many processes
+SHARED_MEMORY_UNSUPPORTED_OPTIONS = (
+    'AOF_PATH', 'REPLICATION_PORT', 'INVALIDATION_FEED_SIZE',
+    'COMPRESSION_THRESHOLD', 'STALE_GRACE', 'TTL_JITTER', 'PREFIX_INDEX', 'SLIDING_EXPIRATION',
+)
+
+
+def check_shared_memory_config(config):
+    """Raises ValueError if config enables an option that the shared memory
+    cache does not support
+
+    input:
+        config: a mapping of the configuration parameters
+    """
+    enabled = [name for name in SHARED_MEMORY_UNSUPPORTED_OPTIONS if config.get(name)]
+    if config.get('CACHE_SEGMENTS', 1) > 1:
+        enabled.append('CACHE_SEGMENTS')
+    if enabled:
+        raise ValueError(f'{", ".join(enabled)} cannot be used with SHARED_MEMORY_PATH')
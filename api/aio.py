@@ -0,0 +1,161 @@
+import asyncio
+import json
+from urllib.parse import urlsplit, parse_qs, unquote
+from .cache import AsyncCache
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 507: 'Insufficient Storage',
+}
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# The options of the configuration that only the Flask app implements
+UNSUPPORTED_OPTIONS = ('REPLICATION_PORT', 'REPLICA_OF', 'INVALIDATION_FEED_SIZE')
+
+
+class AsyncCacheServer:
+    """An asyncio HTTP/1.1 server serving the /object/{key} API
+
+    It is a fast path for the basic contract of CacheApi, without Flask:
+    GET, POST, PUT and DELETE on /object/{key} with the optional ttl query
+    parameter. Nothing else of the Flask app is served: no ETag and 304
+    responses, no X-Cache-TTL header, no tags, delta or If-Match, and none
+    of the ttl, touch, batch, scan, invalidation, metrics and replication
+    endpoints. Connections are kept alive and pipelined requests are
+    answered in order. Request bodies must have a Content-Length.
+
+    Methods:
+        start(host, port):
+            starts listening and returns the asyncio server
+        handle_connection(reader, writer):
+            serves the requests of one connection
+    """
+    def __init__(self, cache):
+        """
+        Parameters:
+            cache : Cache, ConcurrentCache, SharedMemoryCache or ReadThroughCache
+                The cache served
+        """
+        self.cache = AsyncCache(cache)
+
+    async def start(self, host='0.0.0.0', port=8080):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    headers = await read_headers(reader)
+                except ValueError:
+                    writer.write(response(400, {"message": "Bad request"}, False))
+                    break
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if version == 'HTTP/1.0':
+                    keep_alive = headers.get('connection', '').lower() == 'keep-alive'
+                if 'transfer-encoding' in headers:
+                    writer.write(response(411, {"message": "Content-Length is required"}, False))
+                    break
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_SIZE:
+                    writer.write(response(413, {"message": "Invalid Content-Length"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, target, body)
+                writer.write(response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body):
+        """Runs a request and returns its status and its payload, which is
+        either the cached bytes or an object to serialize
+        """
+        url = urlsplit(target)
+        if not url.path.startswith('/object/') or '/' in url.path[len('/object/'):]:
+            return 404, {"message": "The requested URL was not found on the server"}
+        key = unquote(url.path[len('/object/'):])
+
+        if method == 'GET':
+            entry = await self.cache.get_entry(key)
+            if entry:
+                return 200, entry.json_str
+            return 404, {"message": f"Object at {key} is not found or expired"}
+
+        if method in ('POST', 'PUT'):
+            ttl = parse_qs(url.query).get('ttl', [None])[-1]
+            if ttl is not None:
+                try:
+                    ttl = int(ttl)
+                except ValueError:
+                    return 400, {"message": {"ttl": f"invalid literal for int() with base 10: '{ttl}'"}}
+            ttl = ttl if ttl and ttl >= 0 else None
+            try:
+                json.loads(body.decode('utf-8'))
+            except ValueError:
+                return 400, {"message": "The body is not a valid JSON document"}
+            if await self.cache.set_entry(key, body, ttl):
+                return 200, {"message": "success"}
+            return 507, {"message": "The server has no storage"}
+
+        if method == 'DELETE':
+            if await self.cache.delete_entry(key):
+                return 200, {"message": "success"}
+            return 404, {"message": f"Object at {key} is not found or expired"}
+
+        return 405, {"message": "The method is not allowed for the requested URL."}
+
+
+# Reads the header lines of a request and returns them by lower-case name
+async def read_headers(reader):
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+
+
+# Returns the bytes of a JSON response. Cached bytes are sent as they are
+def response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        body = payload.encode('utf-8')
+    elif isinstance(payload, bytes):
+        body = payload
+    else:
+        body = json.dumps(payload).encode('utf-8')
+    head = (
+        f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+        f'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+    )
+    return head.encode('latin-1') + body
+
+
+def load_config(config_name):
+    """Returns the parameters of a configuration of instance/config.py as a dict"""
+    from instance.config import config
+    config_class = config[config_name]
+    return {name: getattr(config_class, name) for name in dir(config_class) if name.isupper()}
+
+
+def check_config(config):
+    """Raises ValueError if config enables the replication or the
+    invalidation feed, which the asyncio server does not implement
+    """
+    enabled = [name for name in UNSUPPORTED_OPTIONS if config.get(name)]
+    if enabled:
+        raise ValueError(f'{", ".join(enabled)} require the Flask app, not the asyncio server')
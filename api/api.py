@@ -1,24 +1,63 @@
 import json
+from math import inf
+from time import monotonic
+from flask import Response
 from flask_restful import Resource, request, reqparse, abort
+from .cache import PreconditionFailed
+from .cache.compression import CompressedValue
+from .metrics import timed, render_metrics
 
 # For parsing query paramters
 parser = reqparse.RequestParser()
-parser.add_argument('ttl', type=int)
+parser.add_argument('ttl', type=int, location='args')
+parser.add_argument('delta', type=float, location='args')
+parser.add_argument('tags', type=str, location='args')
+
+# For parsing the time to live of the expire requests
+expire_parser = reqparse.RequestParser()
+expire_parser.add_argument('ttl', type=int, required=True, location='args')
+
+# For parsing the query parameters of the prefix scans
+scan_parser = reqparse.RequestParser()
+scan_parser.add_argument('prefix', type=str, default='', location='args')
+scan_parser.add_argument('cursor', type=str, location='args')
+scan_parser.add_argument('count', type=int, default=100, location='args')
+
+# For parsing the query parameters of the invalidation feed
+feed_parser = reqparse.RequestParser()
+feed_parser.add_argument('after', type=int, location='args')
+feed_parser.add_argument('timeout', type=float, default=0, location='args')
+
+# The max number of seconds a request of the invalidation feed waits for a
+# change, and the number of seconds the clients wait between two requests
+# instead when the server has a single thread, which a waiting request
+# would hold from every other client
+FEED_MAX_WAIT = 30
+FEED_POLL_INTERVAL = 1
 
 class  CacheApi(Resource):
     
     # A class proprty used to hold the cached items
     cache = None
+    # The beta of the early refresh hint, 0 disables it
+    refresh_beta = 0
+    # Whether the writes are rejected, on replicas
+    read_only = False
+    # The InvalidationFeed of the near-caching clients, None if disabled
+    feed = None
 
     @classmethod
-    def initialize_cache(cls, cache_instance):
+    def initialize_cache(cls, cache_instance, refresh_beta=0, read_only=False):
         """This class method is used to initialize the cache with an instance
         created using the parameters provided in the app config.  
         """
 
         cls.cache = cache_instance
+        cls.refresh_beta = refresh_beta
+        cls.read_only = read_only
 
 
+    @timed('get')
     def get(self, key):
         """Returns the object stored at {key} if the object is not expired.
         ---
@@ -31,34 +70,105 @@ class  CacheApi(Resource):
                 required: true
         responses:
             200:
-                description: JSON object
+                description: JSON object. The X-Cache-Refresh header is set
+                    to 1 if the client should recompute the object now,
+                    before it expires. The X-Cache-TTL header has the
+                    remaining time to live in seconds, unless the object
+                    never expires, and the X-Cache-Sequence header the
+                    sequence number of the invalidation feed before the
+                    object was read
                 examples:
                     {"first": "Steve", "last": "Moody"}
+            304:
+                description: No body, if the object has one of the etags
+                    of the If-None-Match header
             404:
                 description: An error message
                 exapmples:
                     {"message": "Object at {key} is not found or expired"}
         """
 
+        # the sequence is read first, so the changes after it may be missing
+        # from the object and are sent to the client by the feed
+        sequence = self.feed.sequence if self.feed is not None else None
         entry = self.cache.get_entry(key)
         if entry:
-            return json.loads(entry.json_str), 200
+            if request.if_none_match and (
+                request.if_none_match.star_tag or
+                entry.etag in _request_etags(request.if_none_match, include_weak=True)
+            ):
+                response = Response(status=304)
+                response.set_etag(entry.etag)
+                return self._entry_headers(response, entry, sequence)
+            # compressed bytes are sent as they are to the clients accepting
+            # their encoding, and decompressed for the others. The encoding
+            # is appended to the etag of the compressed bytes
+            value = entry.value
+            if isinstance(value, CompressedValue):
+                encoding = value.codec.content_encoding
+                if encoding and request.accept_encodings[encoding]:
+                    response = Response(bytes(value), status=200, mimetype='application/json')
+                    response.headers['Content-Encoding'] = encoding
+                    response.vary.add('Accept-Encoding')
+                    response.set_etag(f'{entry.etag}-{encoding}')
+                    return self._entry_headers(response, entry, sequence)
+                value = value.decompress()
+            # the cached bytes are sent as they are, without parsing them
+            response = Response(value, status=200, mimetype='application/json')
+            response.set_etag(entry.etag)
+            return self._entry_headers(response, entry, sequence)
         abort(404, message=f"Object at {key} is not found or expired")
 
 
+    def _entry_headers(self, response, entry, sequence):
+        """This private method sets the remaining time to live of the object,
+        the sequence of the invalidation feed, and tells the client to
+        recompute the object early, with the probability of XFetch (see
+        CacheEntry.should_refresh)
+        """
+        if entry.expires_at != inf:
+            response.headers['X-Cache-TTL'] = f'{max(0.0, entry.expires_at - monotonic()):.3f}'
+        if sequence is not None:
+            response.headers['X-Cache-Sequence'] = str(sequence)
+        if self.refresh_beta and entry.should_refresh(self.refresh_beta):
+            response.headers['X-Cache-Refresh'] = '1'
+        return response
+
     def _update(self, key):
         """This private method implemets inserting and updating items in 
         the cache. Both post and put methods call it.
         """
-        ttl = parser.parse_args().get('ttl', None)
+        _check_writable()
+        args = parser.parse_args()
+        ttl = args.get('ttl', None)
         ttl = ttl if ttl and ttl >= 0 else None
-        obj_json_str  = json.dumps(request.get_json())
-        cached = self.cache.set_entry(key, obj_json_str, ttl)
+        delta = args.get('delta', None)
+        delta = delta if delta and delta > 0 else 0.0
+        # the body is validated once and cached as raw UTF-8 bytes
+        obj_json_bytes = request.get_data()
+        try:
+            json.loads(obj_json_bytes.decode('utf-8'))
+        except ValueError:
+            abort(400, message="The body is not a valid JSON document")
+        # with If-Match, the object is replaced only if it has one of the etags
+        if_match = None
+        if request.if_match:
+            if_match = {'*'} if request.if_match.star_tag else _request_etags(request.if_match)
+        try:
+            cached = self.cache.set_entry(
+                key, obj_json_bytes, ttl, if_match=if_match, delta=delta, tags=_parse_tags(args)
+            )
+        except PreconditionFailed:
+            abort(412, message=f"Object at {key} does not match the If-Match header")
+        except NotImplementedError as error:
+            # the shared memory cache has no tags
+            abort(400, message=str(error))
         if cached:
             return {"message": "success"}, 200
         return {"message": "The server has no storage"}, 507
 
 
+    @timed('post')
     def post(self, key):
         """Inserts the {object} provided in the body of the request into a slot
         in memory at {key}. If {ttl} is not specified it will use server’s 
@@ -75,6 +185,18 @@ class  CacheApi(Resource):
                 in: query
                 type: integer
                 required: false
+            - name: delta
+                in: query
+                type: number
+                required: false
+                description: the number of seconds it took to compute the
+                    object, used for the early refresh hint
+            - name: tags
+                in: query
+                type: string
+                required: false
+                description: comma-separated tags of the object, see
+                    /objects/invalidate
             - name: body
                 in: body
                 type: object
@@ -89,11 +211,19 @@ class  CacheApi(Resource):
                 exapmples:
                     {"message": "The server has no storage"}
             400:
-                description: An error message if ttl is not an integer
+                description: An error message if ttl is not an integer,
+                    the body is not a valid JSON document or tags are given
+                    to a cache without tags (SHARED_MEMORY_PATH)
+            412:
+                description: An error message if the If-Match header is
+                    set and the object has none of its etags
+            403:
+                description: An error message if the node is a replica
         """
 
         return self._update(key)
         
+    @timed('put')
     def put(self, key):
         """Inserts the {object} provided in the body of the request into a slot
         in memory at {key}. If {ttl} is not specified it will use server’s 
@@ -110,6 +240,18 @@ class  CacheApi(Resource):
                 in: query
                 type: integer
                 required: false
+            - name: delta
+                in: query
+                type: number
+                required: false
+                description: the number of seconds it took to compute the
+                    object, used for the early refresh hint
+            - name: tags
+                in: query
+                type: string
+                required: false
+                description: comma-separated tags of the object, see
+                    /objects/invalidate
             - name: body
                 in: body
                 type: object
@@ -123,11 +265,21 @@ class  CacheApi(Resource):
                 description: An error message
                 exapmples:
                     {"message": "The server has no storage"}
+            400:
+                description: An error message if ttl is not an integer,
+                    the body is not a valid JSON document or tags are given
+                    to a cache without tags (SHARED_MEMORY_PATH)
+            412:
+                description: An error message if the If-Match header is
+                    set and the object has none of its etags
+            403:
+                description: An error message if the node is a replica
         """
 
         return self._update(key)
 
 
+    @timed('delete')
     def delete(self, key):
         """Deletes the object stored at slot {key}
         ---
@@ -147,8 +299,476 @@ class  CacheApi(Resource):
                 description: An error message
                 exapmples:
                     {"message": "Object at {key} is not found or expired"}
+            403:
+                description: An error message if the node is a replica
         """
+        _check_writable()
         deleted = self.cache.delete_entry(key)
         if deleted:
             return {"message": "success"}, 200
-        abort(404, message=f"Object at {key} is not found or expired")
\ No newline at end of file
+        abort(404, message=f"Object at {key} is not found or expired")
+
+class CacheTtlApi(Resource):
+
+    @timed('ttl')
+    def get(self, key):
+        """Returns the remaining time to live of the object stored at {key},
+        without its value
+        ---
+        path:
+            /object/{key}/ttl
+        parameters:
+            - name: key
+                in: path
+                type: string
+                required: true
+        responses:
+            200:
+                description: JSON object with the remaining time to live in
+                    seconds, null if the object never expires
+                examples:
+                    {"ttl": 42.5}
+            404:
+                description: An error message
+                exapmples:
+                    {"message": "Object at {key} is not found or expired"}
+        """
+
+        remaining = CacheApi.cache.get_ttl(key)
+        if remaining is None:
+            abort(404, message=f"Object at {key} is not found or expired")
+        return {"ttl": None if remaining == inf else remaining}, 200
+
+    @timed('expire')
+    def put(self, key):
+        """Sets the time to live of the object stored at {key} to {ttl}
+        seconds from now, without sending the object again. ttl=0 means the
+        object never expires
+        ---
+        path:
+            /object/{key}/ttl
+        parameters:
+            - name: key
+                in: path
+                type: string
+                required: true
+            - name: ttl
+                in: query
+                type: integer
+                required: true
+        responses:
+            200:
+                description: JSON object
+                examples:
+                    {"message": "success"}
+            400:
+                description: An error message if ttl is missing, not an
+                    integer or negative
+            403:
+                description: An error message if the node is a replica
+            404:
+                description: An error message
+                exapmples:
+                    {"message": "Object at {key} is not found or expired"}
+        """
+
+        _check_writable()
+        ttl = expire_parser.parse_args()['ttl']
+        if ttl < 0:
+            abort(400, message="The ttl must not be negative")
+        if not CacheApi.cache.expire(key, ttl):
+            abort(404, message=f"Object at {key} is not found or expired")
+        return {"message": "success"}, 200
+
+
+class CacheTouchApi(Resource):
+
+    @timed('touch')
+    def post(self, key):
+        """Restarts the time to live of the object stored at {key}, without
+        sending the object again
+        ---
+        path:
+            /object/{key}/touch
+        parameters:
+            - name: key
+                in: path
+                type: string
+                required: true
+        responses:
+            200:
+                description: JSON object
+                examples:
+                    {"message": "success"}
+            403:
+                description: An error message if the node is a replica
+            404:
+                description: An error message
+                exapmples:
+                    {"message": "Object at {key} is not found or expired"}
+        """
+
+        _check_writable()
+        if not CacheApi.cache.touch(key):
+            abort(404, message=f"Object at {key} is not found or expired")
+        return {"message": "success"}, 200
+
+# A private helper rejecting the writes to a replica
+def _check_writable():
+    if CacheApi.read_only:
+        abort(403, message="This node is a read-only replica")
+
+# A private helper returning the tags of the comma-separated tags parameter
+def _parse_tags(args):
+    tags = args.get('tags', None)
+    return tuple(tag for tag in tags.split(',') if tag) if tags else ()
+
+# A private helper returning the etags of an If-Match or If-None-Match
+# header, without the encoding suffix of the etags of compressed responses
+def _request_etags(etags, include_weak=False):
+    return {etag.split('-', 1)[0] for etag in etags.as_set(include_weak)}
+
+# A private helper parsing the body of the batch requests. It returns the
+# value of field, which must be an instance of expected_type
+def _parse_batch_body(field, expected_type):
+    try:
+        body = json.loads(request.get_data().decode('utf-8'))
+    except ValueError:
+        abort(400, message="The body is not a valid JSON document")
+    value = body.get(field) if isinstance(body, dict) else None
+    if not isinstance(value, expected_type):
+        abort(400, message=f"The body must have a '{field}' {expected_type.__name__}")
+    if expected_type is list and not all(isinstance(key, str) for key in value):
+        abort(400, message=f"The '{field}' must be strings")
+    return value
+
+
+class CacheBatchGetApi(Resource):
+
+    @timed('mget')
+    def post(self):
+        """Returns the objects stored at {keys}. Each result has the status the
+        single key request would have and the object if it is found
+        ---
+        path:
+            /objects/mget
+        parameters:
+            - name: body
+                in: body
+                type: object
+                required: true
+                examples:
+                    {"keys": ["key_a", "key_b"]}
+        responses:
+            200:
+                description: JSON object
+                examples:
+                    {"results": {
+                        "key_a": {"status": 200, "value": {"data": "Hello"}},
+                        "key_b": {"status": 404}}}
+            400:
+                description: An error message if the body is not valid
+        """
+
+        keys = _parse_batch_body('keys', list)
+        entries = CacheApi.cache.get_entries(keys)
+        # the cached bytes are inserted in the response without parsing them
+        results = []
+        for key, entry in entries.items():
+            result = b'{"status": 404}'
+            if entry:
+                json_bytes = entry.json_str
+                if isinstance(json_bytes, str):
+                    json_bytes = json_bytes.encode('utf-8')
+                result = b'{"status": 200, "value": ' + json_bytes + b'}'
+            results.append(json.dumps(key).encode('utf-8') + b': ' + result)
+        body = b'{"results": {' + b', '.join(results) + b'}}'
+        return Response(body, status=200, mimetype='application/json')
+
+
+class CacheBatchSetApi(Resource):
+
+    @timed('mset')
+    def post(self):
+        """Inserts the {objects} provided in the body of the request. If {ttl} is
+        not specified it will use server’s default TTL from the config, if
+        ttl=0 it means store indefinitely. Each result has the status the
+        single key request would have
+        ---
+        path:
+            /objects/mset
+        parameters:
+            - name: ttl
+                in: query
+                type: integer
+                required: false
+            - name: tags
+                in: query
+                type: string
+                required: false
+                description: comma-separated tags of the objects
+            - name: body
+                in: body
+                type: object
+                required: true
+                examples:
+                    {"objects": {"key_a": {"data": "Hello"}}}
+        responses:
+            200:
+                description: JSON object
+                examples:
+                    {"results": {"key_a": {"status": 200}, "key_b": {"status": 507}}}
+            400:
+                description: An error message if the body is not valid or
+                    tags are given to a cache without tags
+            403:
+                description: An error message if the node is a replica
+        """
+
+        _check_writable()
+        args = parser.parse_args()
+        ttl = args.get('ttl', None)
+        ttl = ttl if ttl and ttl >= 0 else None
+        objects = _parse_batch_body('objects', dict)
+        entries = {key: json.dumps(obj).encode('utf-8') for key, obj in objects.items()}
+        try:
+            cached = CacheApi.cache.set_entries(entries, ttl, _parse_tags(args))
+        except NotImplementedError as error:
+            abort(400, message=str(error))
+        return {"results": {
+            key: {"status": 200 if success else 507} for key, success in cached.items()
+        }}, 200
+
+
+class CacheBatchDeleteApi(Resource):
+
+    @timed('mdelete')
+    def post(self):
+        """Deletes the objects stored at {keys}. Each result has the status the
+        single key request would have
+        ---
+        path:
+            /objects/mdelete
+        parameters:
+            - name: body
+                in: body
+                type: object
+                required: true
+                examples:
+                    {"keys": ["key_a", "key_b"]}
+        responses:
+            200:
+                description: JSON object
+                examples:
+                    {"results": {"key_a": {"status": 200}, "key_b": {"status": 404}}}
+            400:
+                description: An error message if the body is not valid
+            403:
+                description: An error message if the node is a replica
+        """
+
+        _check_writable()
+        keys = _parse_batch_body('keys', list)
+        deleted = CacheApi.cache.delete_entries(keys)
+        return {"results": {
+            key: {"status": 200 if success else 404} for key, success in deleted.items()
+        }}, 200
+
+
+class CacheInvalidateApi(Resource):
+
+    @timed('invalidate')
+    def post(self):
+        """Deletes the objects having one of {tags} or a key starting with one
+        of {prefixes}, without scanning the whole cache
+        ---
+        path:
+            /objects/invalidate
+        parameters:
+            - name: body
+                in: body
+                type: object
+                required: true
+                examples:
+                    {"tags": ["tenant_1"], "prefixes": ["session:"]}
+        responses:
+            200:
+                description: JSON object with the number of objects deleted
+                examples:
+                    {"deleted": 42}
+            400:
+                description: An error message if the body is not valid or
+                    tags are given to a cache without tags
+            403:
+                description: An error message if the node is a replica
+        """
+
+        _check_writable()
+        try:
+            body = json.loads(request.get_data().decode('utf-8'))
+        except ValueError:
+            abort(400, message="The body is not a valid JSON document")
+        if not isinstance(body, dict):
+            abort(400, message="The body must be a JSON object")
+        groups = {field: body.get(field, []) for field in ('tags', 'prefixes')}
+        if not all(
+            isinstance(values, list) and all(isinstance(value, str) for value in values)
+            for values in groups.values()
+        ):
+            abort(400, message="The 'tags' and 'prefixes' must be lists of strings")
+        try:
+            deleted = sum(CacheApi.cache.delete_tag(tag) for tag in groups['tags'])
+        except NotImplementedError as error:
+            abort(400, message=str(error))
+        deleted += sum(CacheApi.cache.delete_prefix(prefix) for prefix in groups['prefixes'])
+        return {"deleted": deleted}, 200
+
+
+class CacheScanApi(Resource):
+
+    @timed('scan')
+    def get(self):
+        """Returns a page of the keys starting with {prefix}, in key order.
+        The next page is requested with the cursor of the previous one.
+        Without PREFIX_INDEX, the first page sorts the matching keys and
+        the next pages resume in them, so keys added during the scan may
+        be missed. The shared memory cache sorts them on every page
+        ---
+        path:
+            /objects/scan
+        parameters:
+            - name: prefix
+                in: query
+                type: string
+                required: false
+            - name: cursor
+                in: query
+                type: string
+                required: false
+                description: the cursor returned with the previous page
+            - name: count
+                in: query
+                type: integer
+                required: false
+                description: the max number of keys of the page, from 1 to
+                    1000, 100 by default
+        responses:
+            200:
+                description: JSON object with the keys of the page and the
+                    cursor of the next page, null after the last page
+                examples:
+                    {"keys": ["tenant_1:a", "tenant_1:b"], "cursor": "tenant_1:b"}
+            400:
+                description: An error message if count is not an integer
+        """
+
+        args = scan_parser.parse_args()
+        count = min(max(args['count'], 1), 1000)
+        pairs = CacheApi.cache.scan(args['prefix'] or '', args['cursor'] or None, count)
+        keys = [key for key, _ in pairs]
+        return {"keys": keys, "cursor": keys[-1] if len(keys) == count else None}, 200
+
+
+class InvalidationApi(Resource):
+
+    def get(self):
+        """Returns the keys changed after the sequence number {after}, waiting
+        up to {timeout} seconds for a change if there is none (long polling).
+        Clients keeping local copies of the objects drop the copies of these
+        keys. A single-threaded server does not wait, and returns the number
+        of seconds to wait before the next request instead
+        ---
+        path:
+            /invalidations
+        parameters:
+            - name: after
+                in: query
+                type: integer
+                required: false
+                description: the sequence of the last change seen. Without
+                    it, only the current sequence is returned
+            - name: timeout
+                in: query
+                type: number
+                required: false
+                description: the max number of seconds to wait, up to 30,
+                    ignored by a single-threaded server
+        responses:
+            200:
+                description: JSON object with the epoch of the feed, which
+                    changes when the server restarts, the sequence of the
+                    last change, and the changed keys. reset is true
+                    instead of the keys if some changes are lost, and the
+                    client must drop all its copies. poll_interval is the
+                    number of seconds to wait before the next request, on
+                    a single-threaded server
+                examples:
+                    {"epoch": "5f0c2a9e1b7d4c3a", "sequence": 1042, "keys": ["key_a"]}
+            404:
+                description: An error message if the feed is disabled
+        """
+
+        feed = CacheApi.feed
+        if feed is None:
+            abort(404, message="The invalidation feed is disabled")
+        args = feed_parser.parse_args()
+        threaded = request.environ.get('wsgi.multithread', False)
+        timeout = min(max(args['timeout'], 0), FEED_MAX_WAIT) if threaded else 0
+        sequence, keys = feed.changes(args['after'], timeout)
+        if keys is None:
+            body = {"epoch": feed.epoch, "sequence": sequence, "reset": True}
+        else:
+            body = {"epoch": feed.epoch, "sequence": sequence, "keys": keys}
+        if not threaded:
+            body["poll_interval"] = FEED_POLL_INTERVAL
+        return body, 200
+
+
+class MetricsApi(Resource):
+
+    def get(self):
+        """Returns the metrics of the cache and of the requests in the
+        Prometheus text format
+        ---
+        path:
+            /metrics
+        responses:
+            200:
+                description: The counters of the cache operations, the size
+                    of the cache, and the number and latency histograms of
+                    the requests by handler
+        """
+
+        return Response(
+            render_metrics(CacheApi.cache), status=200,
+            mimetype='text/plain; version=0.0.4'
+        )
+
+
+class ReplicationApi(Resource):
+
+    # The ReplicationServer of a primary or the ReplicaClient of a replica
+    replication = None
+
+    def get(self):
+        """Returns the replication state of the node
+        ---
+        path:
+            /replication
+        responses:
+            200:
+                description: JSON object. A primary has the address, the
+                    number of operations sent and the number of operations
+                    queued of its replicas. A replica has its connection
+                    state, its number of applied operations and its lag, in
+                    operations and in seconds, measured on the primary
+                examples:
+                    {"role": "replica", "primary": "10.0.0.1:7000",
+                     "connected": true, "synced": true, "applied": 1042,
+                     "lag_operations": 0, "lag_seconds": 0.0,
+                     "last_heartbeat_seconds_ago": 0.2}
+        """
+
+        if self.replication is None:
+            return {"role": "none"}, 200
+        return self.replication.status(), 200
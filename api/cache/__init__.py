@@ -1 +1,5 @@
-from .main import EvictionStrategies, CacheEntry, Cache
\ No newline at end of file
+from .main import EvictionStrategies, CacheEntry, Cache, PreconditionFailed
+from .concurrent import ConcurrentCache
+from .shared import SharedMemoryCache
+from .aio import AsyncCache
+from .loader import ReadThroughCache
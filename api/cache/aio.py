@@ -0,0 +1,60 @@
+import asyncio
+from .loader import ReadThroughCache
+
+
+class AsyncCache:
+    """An asyncio facade of a cache
+
+    It exposes the operations of Cache, ConcurrentCache or SharedMemoryCache
+    as coroutines. The operations are in-memory and take microseconds, so
+    they run directly on the event loop rather than in an executor, where
+    the hand-off would cost more than the operation itself. The reads of a
+    ReadThroughCache are the exception: a miss calls the loader, which can
+    block on the origin, so they run in the default executor of the loop
+    and the other connections are served meanwhile.
+
+    Methods:
+        get_entry(key), set_entry(key, json_str, ttl=None), delete_entry(key), get_ttl(key),
+        touch(key), expire(key, ttl), get_entries(keys), set_entries(entries, ttl=None),
+        delete_entries(keys):
+            See Cache
+    """
+    def __init__(self, cache):
+        """
+        Parameters:
+            cache : Cache, ConcurrentCache, SharedMemoryCache or ReadThroughCache
+                The wrapped cache
+        """
+        self.cache = cache
+        self._loading = isinstance(cache, ReadThroughCache)
+
+    async def get_entry(self, key):
+        if self._loading:
+            return await asyncio.get_running_loop().run_in_executor(None, self.cache.get_entry, key)
+        return self.cache.get_entry(key)
+
+    async def set_entry(self, key, json_str, ttl=None):
+        return self.cache.set_entry(key, json_str, ttl)
+
+    async def delete_entry(self, key):
+        return self.cache.delete_entry(key)
+
+    async def get_ttl(self, key):
+        return self.cache.get_ttl(key)
+
+    async def touch(self, key):
+        return self.cache.touch(key)
+
+    async def expire(self, key, ttl):
+        return self.cache.expire(key, ttl)
+
+    async def get_entries(self, keys):
+        if self._loading:
+            return await asyncio.get_running_loop().run_in_executor(None, self.cache.get_entries, keys)
+        return self.cache.get_entries(keys)
+
+    async def set_entries(self, entries, ttl=None):
+        return self.cache.set_entries(entries, ttl)
+
+    async def delete_entries(self, keys):
+        return self.cache.delete_entries(keys)
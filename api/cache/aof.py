@@ -0,0 +1,253 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+from time import monotonic, time
+from .main import SET, DELETE
+from .persistence import (
+    RECORD, RECORD_V1, decode_record, encode_record, monotonic_clock, wall_clock
+)
+
+logger = logging.getLogger(__name__)
+
+# An operation log is the magic string followed by operations. An operation
+# is one byte, S for a set or D for a delete, followed by a snapshot record
+# (see persistence.py). The record of a delete has an empty value. T is a
+# change of the deadline of an entry, followed by the length of the key and
+# the new wall-clock expiry time, then the key. The logs of version 1 have
+# the records of version 1 and no T, and are rewritten on start
+LOG_MAGIC = b'IMCAOF02'
+LOG_MAGIC_V1 = b'IMCAOF01'
+DEADLINE = struct.Struct('<Id')
+
+
+def encode_operation(operation, key, entry):
+    """Returns the bytes of an operation of the log"""
+    if operation == SET:
+        return b'S' + encode_record(key, entry)
+    key_bytes = key.encode('utf-8')
+    if operation == DELETE:
+        return b'D' + RECORD.pack(len(key_bytes), 0, 0, 0.0, 0.0) + key_bytes
+    return b'T' + DEADLINE.pack(len(key_bytes), wall_clock(entry.expires_at)) + key_bytes
+
+
+def decode_deadline(buffer, offset):
+    """Decodes the key and the wall-clock expiry time of a T operation of
+    buffer at offset, and returns them with the offset of the next
+    operation, or None if the operation is not complete
+    """
+    if offset + DEADLINE.size > len(buffer):
+        return None
+    key_length, expires_at = DEADLINE.unpack_from(buffer, offset)
+    start = offset + DEADLINE.size
+    if start + key_length > len(buffer):
+        return None
+    return bytes(buffer[start:start + key_length]).decode('utf-8'), expires_at, start + key_length
+
+
+def replay_log(cache, path):
+    """Applies the operations of a log file to cache, skipping the entries
+    that expired since they were written. The file is memory-mapped and read
+    as a stream of operations. An incomplete last operation, left by a crash
+    in the middle of a write, is cut from the file
+
+    Parameters:
+        cache : Cache or ConcurrentCache
+            The cache to fill
+        path : str
+            The path of the log
+
+    Returns:
+        int
+            The number of operations applied
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < len(LOG_MAGIC):
+        return 0
+    count = 0
+    now = time()
+    with open(path, 'rb') as log, \
+            mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        magic = buffer[:len(LOG_MAGIC)]
+        if magic not in (LOG_MAGIC, LOG_MAGIC_V1):
+            raise ValueError(f'{path} is not an operation log')
+        record = RECORD if magic == LOG_MAGIC else RECORD_V1
+        end = len(buffer)
+        offset = len(magic)
+        while offset < end:
+            code = buffer[offset:offset + 1]
+            if code == b'T' and record is RECORD:
+                decoded = decode_deadline(buffer, offset + 1)
+                if decoded is None:
+                    break
+                key, expires_at, next_offset = decoded
+                if expires_at and expires_at < now:
+                    cache.delete_entry(key)
+                else:
+                    cache.expire(key, expires_at=monotonic_clock(expires_at))
+                count += 1
+                offset = next_offset
+                continue
+            decoded = decode_record(buffer, offset + 1, record)
+            if decoded is None or code not in (b'S', b'D'):
+                break
+            key, value, expires_at, delta, tags, next_offset = decoded
+            if code == b'D':
+                cache.delete_entry(key)
+            elif expires_at and expires_at < now:
+                cache.delete_entry(key)
+            else:
+                cache.set_entry(key, value, expires_at=monotonic_clock(expires_at), delta=delta, tags=tags)
+            count += 1
+            offset = next_offset
+    if offset < end:
+        logger.warning('truncating the incomplete end of the operation log %s', path)
+        os.truncate(path, offset)
+    return count
+
+
+def read_magic(path):
+    """Returns the magic string at the start of a log file"""
+    with open(path, 'rb') as log:
+        return log.read(len(LOG_MAGIC))
+
+
+class OperationLog(threading.Thread):
+    """A background thread appending the changes of a cache to a log file
+
+    The changes are queued by an observer of the cache, so writing to the
+    cache does not wait for the disk. The thread writes the queued changes
+    in batches and fsyncs the file at most every fsync_interval seconds
+    (group commit), so at most the changes of the last interval are lost
+    on a crash. When the file grows past twice its size after the last
+    compaction, and past compact_min_size, it is rewritten from the
+    entries of the cache.
+
+    Methods:
+        flush():
+            waits until the changes queued so far are written and synced
+        stop():
+            stops the thread after syncing the queued changes
+    """
+    def __init__(self, cache, path, fsync_interval=1, compact_min_size=64 * 1024 * 1024):
+        """
+        Parameters:
+            cache : Cache or ConcurrentCache
+                The cache to log
+            path : str
+                The path of the log
+            fsync_interval : float
+                The max number of seconds between a change and its fsync,
+                0 to fsync every batch of changes
+            compact_min_size : int
+                The size in bytes under which the log is not compacted
+        """
+        super().__init__(name='cache-operation-log', daemon=True)
+        self._cache = cache
+        self._path = path
+        self._fsync_interval = fsync_interval
+        self._compact_min_size = compact_min_size
+        self._condition = threading.Condition()
+        self._queue = []
+        self._queued = 0
+        self._synced = 0
+        self._flush_requested = False
+        self._stopped = False
+        self._file = None
+        self._compacted_size = 0
+
+    def start(self):
+        """Opens the log, writing the entries of the cache first if it is
+        empty or of version 1, then registers the observer and starts the
+        thread
+        """
+        if not os.path.exists(self._path) or read_magic(self._path) != LOG_MAGIC:
+            self._compact()
+        else:
+            self._file = open(self._path, 'ab')
+            self._compacted_size = self._file.tell()
+        self._cache.add_observer(self.observe)
+        super().start()
+
+    def observe(self, operation, key, entry):
+        with self._condition:
+            self._queue.append((operation, key, entry))
+            self._queued += 1
+            self._condition.notify()
+
+    def run(self):
+        last_fsync = monotonic()
+        dirty = False
+        while True:
+            with self._condition:
+                while not (self._queue or self._stopped or self._flush_requested):
+                    timeout = None
+                    if dirty:
+                        timeout = max(0, last_fsync + self._fsync_interval - monotonic())
+                    if not self._condition.wait(timeout):
+                        break
+                batch, self._queue = self._queue, []
+                written = self._queued
+                stopping = self._stopped
+                flushing = self._flush_requested
+                self._flush_requested = False
+
+            if batch:
+                self._file.write(b''.join(
+                    encode_operation(operation, key, entry) for operation, key, entry in batch
+                ))
+                dirty = True
+            if dirty and (stopping or flushing or monotonic() - last_fsync >= self._fsync_interval):
+                try:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError:
+                    logger.exception('failed to sync the operation log %s', self._path)
+                last_fsync = monotonic()
+                dirty = False
+            with self._condition:
+                if not dirty:
+                    self._synced = written
+                self._condition.notify_all()
+            if stopping:
+                self._file.close()
+                return
+            if not dirty and self._file.tell() > max(self._compact_min_size, 2 * self._compacted_size):
+                self._compact()
+
+    def flush(self):
+        """Waits until the changes queued so far are written and synced"""
+        with self._condition:
+            target = self._queued
+            while self._synced < target and self.is_alive():
+                self._flush_requested = True
+                self._condition.notify_all()
+                self._condition.wait(0.1)
+
+    # A private method rewriting the log from the entries of the cache. The
+    # changes made while the entries are read are queued and appended to the
+    # new log, where replaying them again gives the same state
+    def _compact(self):
+        temporary_path = f'{self._path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb', buffering=1024 * 1024) as log:
+            log.write(LOG_MAGIC)
+            for key, entry in self._cache.items():
+                log.write(b'S' + encode_record(key, entry))
+            log.flush()
+            os.fsync(log.fileno())
+        os.replace(temporary_path, self._path)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._path, 'ab')
+        self._compacted_size = self._file.tell()
+
+    def stop(self):
+        """Stops the thread after syncing the queued changes"""
+        self._cache.remove_observer(self.observe)
+        with self._condition:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._condition.notify_all()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,83 @@
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CompressedValue(bytes):
+    """The compressed bytes of a cached value
+
+    The codec is an attribute of the class, with one subclass per codec,
+    so a compressed value takes no more memory than plain bytes.
+    """
+    __slots__ = ()
+    codec = None
+
+    def decompress(self):
+        return self.codec.decompress(self)
+
+
+class Codec:
+    """A class used to represent a compression codec
+
+    Attributes:
+        name: str
+            the name of the codec in the configuration
+        content_encoding: str or None
+            the HTTP content coding of the compressed bytes, if they can be
+            sent as they are to clients accepting it
+
+    Methods:
+        compress(value):
+            returns the compressed value, as a CompressedValue
+        decompress(value):
+            returns the decompressed bytes
+    """
+    def __init__(self, name, compress, decompress, content_encoding=None):
+        self.name = name
+        self.content_encoding = content_encoding
+        self._compress = compress
+        self.decompress = decompress
+        self._value_type = type(f'{name.capitalize()}Value', (CompressedValue,), {
+            '__slots__': (), 'codec': self
+        })
+
+    def compress(self, value):
+        return self._value_type(self._compress(value))
+
+
+# gzip is written with zlib, which is faster than the gzip module, and its
+# bytes are a valid gzip stream with an empty header
+def _gzip_compress(value):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(value) + compressor.flush()
+
+def _gzip_decompress(value):
+    return zlib.decompress(value, 31)
+
+
+CODECS = {
+    'gzip': Codec('gzip', _gzip_compress, _gzip_decompress, 'gzip'),
+    'zlib': Codec('zlib', zlib.compress, zlib.decompress),
+    'lzma': Codec('lzma', lzma.compress, lzma.decompress),
+}
+if zstandard is not None:
+    CODECS['zstd'] = Codec(
+        'zstd',
+        zstandard.compress,
+        zstandard.decompress,
+        'zstd'
+    )
+
+
+def get_codec(name):
+    """Returns the codec called name. It raises ValueError if the codec is
+    unknown, or if it is zstd and the zstandard package is not installed
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f'unknown or unavailable compression codec: {name}')
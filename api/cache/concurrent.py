@@ -0,0 +1,205 @@
+import heapq
+from itertools import islice
+from .main import EvictionStrategies, Cache
+from .sweeper import ExpirySweeper
+
+class ConcurrentCache:
+    """A class used to represent a cache shared by many threads
+
+    The keys are spread over a number of segments by hash. Each segment is a
+    Cache with its own lock, container, expiry index and eviction policy, so
+    threads working on keys of different segments do not wait for each
+    other. The capacity is split evenly between the segments, so a segment
+    may be full, and evict or reject entries, while the whole cache is not.
+
+    It has the same methods and attributes as Cache.
+    """
+    def __init__(
+        self,
+        max_slots = 10000,
+        default_ttl = 3600,
+        eviction_strategy = EvictionStrategies.REJECT,
+        max_bytes = 0,
+        segments = 16,
+        compression_threshold = 0,
+        compression_codec = 'gzip',
+        stale_grace = 0,
+        ttl_jitter = 0,
+        prefix_index = False,
+        sliding_expiration = False
+    ):
+        """
+        Parameters:
+            max_slots, default_ttl, eviction_strategy, max_bytes,
+            compression_threshold, compression_codec, stale_grace,
+            ttl_jitter, prefix_index, sliding_expiration:
+                See Cache
+            segments : integer
+                The number of segments. It is capped by max_slots (and
+                max_bytes) so every segment has at least one slot
+        """
+        max_slots = max_slots if max_slots > 0 else 10000
+        max_bytes = max_bytes if max_bytes > 0 else 0
+        segments = max(1, min(segments, max_slots, max_bytes or max_slots))
+        self._max_slots = max_slots
+        self._max_bytes = max_bytes
+        self._segments = [
+            Cache(
+                split(max_slots, segments, i),
+                default_ttl,
+                eviction_strategy,
+                split(max_bytes, segments, i),
+                compression_threshold,
+                compression_codec,
+                stale_grace,
+                ttl_jitter,
+                prefix_index,
+                sliding_expiration
+            )
+            for i in range(segments)
+        ]
+        self._sweeper = None
+
+    def __len__(self):
+        return sum(len(segment) for segment in self._segments)
+
+    @property
+    def max_slots(self):
+        return self._max_slots
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def used_bytes(self):
+        return sum(segment.used_bytes for segment in self._segments)
+
+    @property
+    def stats(self):
+        return sum_stats(segment.stats for segment in self._segments)
+
+    @property
+    def compression_stats(self):
+        return sum_stats(segment.compression_stats for segment in self._segments)
+
+    @property
+    def default_ttl(self):
+        return self._segments[0].default_ttl
+
+    @property
+    def segments(self):
+        return self._segments
+
+    def segment(self, key):
+        """Returns the segment holding key"""
+        return self._segments[hash(key) % len(self._segments)]
+
+    @property
+    def stale_grace(self):
+        return self._segments[0].stale_grace
+
+    def get_entry(self, key, allow_stale=False):
+        return self.segment(key).get_entry(key, allow_stale)
+
+    def set_entry(self, key, json_str, ttl=None, expires_at=None, if_match=None, delta=0.0, tags=()):
+        return self.segment(key).set_entry(key, json_str, ttl, expires_at, if_match, delta, tags)
+
+    def delete_entry(self, key):
+        return self.segment(key).delete_entry(key)
+
+    def items(self):
+        return [pair for segment in self._segments for pair in segment.items()]
+
+    def get_ttl(self, key):
+        return self.segment(key).get_ttl(key)
+
+    def touch(self, key):
+        return self.segment(key).touch(key)
+
+    def expire(self, key, ttl=None, expires_at=None):
+        return self.segment(key).expire(key, ttl, expires_at)
+
+    def get_entries(self, keys):
+        results = {}
+        for segment, segment_keys in self._group(keys).items():
+            results.update(segment.get_entries(segment_keys))
+        return {key: results[key] for key in keys}
+
+    def set_entries(self, entries, ttl=None, tags=()):
+        results = {}
+        for segment, segment_keys in self._group(entries).items():
+            results.update(segment.set_entries({key: entries[key] for key in segment_keys}, ttl, tags))
+        return {key: results[key] for key in entries}
+
+    def delete_entries(self, keys):
+        results = {}
+        for segment, segment_keys in self._group(keys).items():
+            results.update(segment.delete_entries(segment_keys))
+        return {key: results[key] for key in keys}
+
+    def delete_tag(self, tag):
+        return sum(segment.delete_tag(tag) for segment in self._segments)
+
+    def delete_prefix(self, prefix):
+        return sum(segment.delete_prefix(prefix) for segment in self._segments)
+
+    def scan(self, prefix='', after=None, count=100):
+        """Returns a page of the entries with keys starting with prefix, the
+        first count of the pages of the segments merged in key order
+        """
+        pages = [segment.scan(prefix, after, count) for segment in self._segments]
+        return list(islice(heapq.merge(*pages, key=lambda pair: pair[0]), count))
+
+    # Groups keys by segment, so every segment lock is taken once
+    def _group(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.segment(key), []).append(key)
+        return groups
+
+    def reclaim_expired(self, max_entries):
+        """Removes up to max_entries expired entries, taking them from the
+        segments in turn so no segment lock is held for long
+        """
+        reclaimed = 0
+        for segment in self._segments:
+            if reclaimed >= max_entries:
+                break
+            reclaimed += segment.reclaim_expired(max_entries - reclaimed)
+        return reclaimed
+
+    def add_observer(self, observer):
+        """Registers observer on every segment. The changes of a key are
+        notified in order, but changes of keys of different segments may be
+        notified concurrently
+        """
+        for segment in self._segments:
+            segment.add_observer(observer)
+
+    def remove_observer(self, observer):
+        for segment in self._segments:
+            segment.remove_observer(observer)
+
+    def start_sweeper(self, interval, samples=20, budget_ms=5):
+        self.stop_sweeper()
+        self._sweeper = ExpirySweeper(self, interval, samples, budget_ms)
+        self._sweeper.start()
+        return self._sweeper
+
+    def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.stop()
+            self._sweeper = None
+
+"""Returns the sums of the counters of the dicts of stats"""
+def sum_stats(stats):
+    sums = {}
+    for segment_stats in stats:
+        for name, value in segment_stats.items():
+            sums[name] = sums.get(name, 0) + value
+    return sums
+
+"""Returns the share of total of the i-th of n segments"""
+def split(total, n, i):
+    return total // n + (1 if i < total % n else 0)
@@ -0,0 +1,86 @@
+import heapq
+from time import monotonic
+
+class ExpiryIndex:
+    """A class used to find expired cache entries without scanning the cache
+
+    It is a min-heap of (deadline, key) pairs where deadline is the time at
+    which the entry expires. Entries that never expire (ttl == 0) are not
+    added to the index. Records are never removed eagerly: a record is stale
+    when its key was deleted or replaced, and stale records are dropped when
+    they reach the top of the heap or when the heap is compacted.
+
+    Methods:
+        push(key, entry, container):
+            adds the deadline of entry to the index
+        first_expired(container, grace=0):
+            returns the key of an entry of container expired for more than grace seconds, or None
+        compact(container):
+            rebuilds the heap from the live entries of container
+    """
+    def __init__(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, key, entry, container):
+        """Adds the deadline of entry to the index
+
+        Parameters:
+            key : str
+                The cache key
+            entry : CacheEntry
+                The cache entry stored at key
+            container : dict
+                The cache container, used to decide when to compact the heap
+        """
+        if entry.ttl == 0:
+            return
+        heapq.heappush(self._heap, (entry.expires_at, key))
+        # Too many stale records, rebuild the heap from the live entries
+        if len(self._heap) > 2 * len(container) + 64:
+            self.compact(container)
+
+    def first_expired(self, container, grace=0):
+        """Returns the key of an expired entry of container or None if no
+        entry has expired. The returned record is removed from the index
+
+        Parameters:
+            container : dict
+                The cache container
+            grace : float
+                The number of seconds an entry must have been expired for
+
+        Returns:
+            str or None
+                The key of the entry with the earliest deadline if it has expired
+        """
+        heap = self._heap
+        now = monotonic() - grace
+        while heap:
+            entry_deadline, key = heap[0]
+            entry = container.get(key, None)
+            if entry is None or entry.expires_at != entry_deadline:
+                # stale record
+                heapq.heappop(heap)
+                continue
+            if now > entry_deadline:
+                heapq.heappop(heap)
+                return key
+            return None
+        return None
+
+    def compact(self, container):
+        """Rebuilds the heap from the live entries of container
+
+        Parameters:
+            container : dict
+                The cache container
+        """
+        self._heap = [
+            (entry.expires_at, key)
+            for key, entry in container.items() if entry.ttl != 0
+        ]
+        heapq.heapify(self._heap)
+
@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import deque
+from .main import EXTEND
+
+
+class InvalidationFeed:
+    """A ring buffer of the keys changed in a cache, for the clients keeping
+    local copies of the entries
+
+    An observer of the cache numbers every set and delete, evictions
+    included, and keeps the keys of the last size changes. A client reads
+    the changes after the last sequence number it has seen, waiting for new
+    ones if there are none (long polling). A client too far behind to get
+    all the changes it missed is told to reset, and must then drop all its
+    copies. Expired entries are not notified, since every copy expires at
+    the same time, and neither are the deadlines extended, since the copies
+    expire before their entries. The epoch, random, tells the clients when
+    the feed is a new one, after a restart of the server, so they reset
+    too.
+
+    Methods:
+        start(), stop():
+            registers or unregisters the observer of the cache
+        changes(after=None, timeout=0):
+            returns the sequence number of the last change and the keys
+            changed after the sequence number after
+    """
+    def __init__(self, cache, size=65536):
+        """
+        Parameters:
+            cache : Cache or ConcurrentCache
+                The cache observed
+            size : int
+                The number of changes kept
+        """
+        self._cache = cache
+        self._changes = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self.sequence = 0
+        self.epoch = os.urandom(8).hex()
+
+    def start(self):
+        self._cache.add_observer(self.observe)
+
+    def stop(self):
+        self._cache.remove_observer(self.observe)
+
+    def observe(self, operation, key, entry):
+        if operation == EXTEND:
+            return
+        with self._condition:
+            self.sequence += 1
+            self._changes.append(key)
+            self._condition.notify_all()
+
+    def changes(self, after=None, timeout=0):
+        """Returns the changes after the sequence number after, waiting up to
+        timeout seconds for one if there is none
+
+        Parameters:
+            after : int, optional
+                The sequence number of the last change seen by the client.
+                Without it, no change is returned, only the current sequence
+            timeout : float
+                The max number of seconds to wait for a change
+
+        Returns:
+            tuple
+                The sequence number of the last change and the list of the
+                keys changed after after, or None if some changes are no
+                longer kept
+        """
+        with self._condition:
+            if after is None:
+                return self.sequence, []
+            if after == self.sequence and timeout > 0:
+                self._condition.wait_for(lambda: self.sequence != after, timeout)
+            missed = self.sequence - after
+            if missed < 0 or missed > len(self._changes):
+                return self.sequence, None
+            # the deque is indexed from its newest end, where it is fast
+            return self.sequence, [self._changes[-i] for i in range(missed, 0, -1)]
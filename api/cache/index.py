@@ -0,0 +1,167 @@
+class PrefixIndex:
+    """A class used to find the keys starting with a prefix without scanning
+    the cache
+
+    It is a radix tree: every node holds the part of a key after its parent
+    node, and the nodes of a single child are merged with it, so the tree
+    has at most twice as many nodes as keys. The keys under a node are
+    listed in order, which lets a scan resume after the last key it
+    returned.
+
+    Methods:
+        add(key), remove(key):
+            adds or removes a key
+        iter_keys(prefix='', after=None):
+            yields the keys starting with prefix, greater than after, in order
+    """
+    def __init__(self):
+        self._root = _Node('')
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def add(self, key):
+        node = self._root
+        i = 0
+        while i < len(key):
+            child = node.children.get(key[i])
+            if child is None:
+                child = _Node(key[i:])
+                node.children[key[i]] = child
+                node = child
+                break
+            label = child.label
+            common = common_length(label, key, i)
+            if common < len(label):
+                # the label of the child is split at the end of the common part
+                middle = _Node(label[:common])
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[key[i]] = middle
+                child = middle
+            node = child
+            i += common
+        if not node.terminal:
+            node.terminal = True
+            self._length += 1
+
+    def remove(self, key):
+        path = [self._root]
+        node = self._root
+        i = 0
+        while i < len(key):
+            node = node.children.get(key[i])
+            if node is None or not key.startswith(node.label, i):
+                return
+            path.append(node)
+            i += len(node.label)
+        if not node.terminal:
+            return
+        node.terminal = False
+        self._length -= 1
+        # the nodes left without keys are removed, and a node left with a
+        # single child is merged with it
+        while len(path) > 1:
+            node = path.pop()
+            parent = path[-1]
+            if not node.terminal and not node.children:
+                del parent.children[node.label[0]]
+                node = parent
+                if len(path) == 1:
+                    break
+                path.pop()
+                parent = path[-1]
+            if not node.terminal and len(node.children) == 1 and node is not self._root:
+                (child,) = node.children.values()
+                child.label = node.label + child.label
+                parent.children[child.label[0]] = child
+            break
+
+    def iter_keys(self, prefix='', after=None):
+        """Yields the keys starting with prefix in order, from the first key
+        greater than after if it is given. The subtrees holding only keys
+        up to after are skipped without being visited
+
+        Parameters:
+            prefix : str
+                The prefix of the keys
+            after : str, optional
+                The key after which the keys are yielded
+        """
+        node = self._root
+        path = ''
+        while len(path) < len(prefix):
+            node = node.children.get(prefix[len(path)])
+            if node is None:
+                return
+            rest = prefix[len(path):]
+            if not (node.label.startswith(rest) or rest.startswith(node.label)):
+                return
+            path += node.label
+        stack = [(path, node)]
+        while stack:
+            path, node = stack.pop()
+            if after is not None and path <= after[:len(path)]:
+                if path < after[:len(path)]:
+                    continue
+                # the keys of node may be on both sides of after
+                if node.terminal and path > after:
+                    yield path
+            elif node.terminal:
+                yield path
+            for first in sorted(node.children, reverse=True):
+                child = node.children[first]
+                stack.append((path + child.label, child))
+
+
+class TagIndex:
+    """A class used to find the keys of the entries having a tag
+
+    It maps every tag to the set of its keys. Only the entries with tags
+    are indexed, so the cache does not pay for it when no tag is used.
+
+    Methods:
+        add(key, tags), remove(key, tags):
+            adds or removes key from the sets of tags
+        keys(tag):
+            returns the keys having tag
+    """
+    def __init__(self):
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, tags):
+        for tag in tags:
+            self._keys.setdefault(tag, set()).add(key)
+
+    def remove(self, key, tags):
+        for tag in tags:
+            keys = self._keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys[tag]
+
+    def keys(self, tag):
+        return list(self._keys.get(tag, ()))
+
+
+class _Node:
+    __slots__ = ('label', 'children', 'terminal')
+
+    def __init__(self, label):
+        self.label = label
+        self.children = {}
+        self.terminal = False
+
+
+"""Returns the length of the common prefix of label and key[start:]"""
+def common_length(label, key, start):
+    length = min(len(label), len(key) - start)
+    for i in range(length):
+        if label[i] != key[start + i]:
+            return i
+    return length
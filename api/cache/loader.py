@@ -0,0 +1,150 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import monotonic
+from .main import CacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class ReadThroughCache:
+    """A facade of a cache loading the missing entries from an origin
+
+    A loader is a callable registered for a key prefix. On a miss of a key
+    having a loader, get_entry calls it and caches the value it returns.
+    Concurrent misses of the same key wait for a single call of the loader
+    (single flight) instead of all calling the origin. An entry expired for
+    less than the stale_grace of the cache is returned as it is while a
+    background thread reloads it (stale-while-revalidate), once at a time.
+    The time the loader takes is recorded as the delta of the entry, and an
+    entry is also reloaded in the background before it expires when its
+    should_refresh(beta) is True (probabilistic early expiration). Keys
+    without a loader, and the other operations, are passed to the cache.
+
+    Methods:
+        add_loader(prefix, loader, ttl=None):
+            registers the loader of the keys starting with prefix
+        get_entry(key):
+            returns the entry for key, loading it if it is missing
+        get_entries(keys):
+            returns a dict of the entries for keys, like get_entry
+    """
+    def __init__(self, cache, refresh_workers=4, beta=1.0):
+        """
+        Parameters:
+            cache : Cache, ConcurrentCache or SharedMemoryCache
+                The wrapped cache
+            refresh_workers : integer
+                The number of threads reloading stale entries
+            beta : float
+                The beta of CacheEntry.should_refresh, 0 disables early
+                reloads
+        """
+        self.cache = cache
+        self.beta = beta
+        self._loaders = {}
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(refresh_workers, thread_name_prefix='cache-refresh')
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def __len__(self):
+        return len(self.cache)
+
+    def add_loader(self, prefix, loader, ttl=None):
+        """Registers the loader of the keys starting with prefix. The loader
+        with the longest matching prefix is used
+
+        Parameters:
+            prefix : str
+                The key prefix, '' for every key
+            loader : callable
+                Called as loader(key), it returns the JSON string or bytes
+                to cache for key, or None if the origin has no value
+            ttl : int, optional
+                The time to live of the loaded entries. The cache default
+                is used if it is not provided
+        """
+        self._loaders[prefix] = (loader, ttl)
+
+    def get_entry(self, key):
+        """Returns the entry for key, loading it if it is missing and has a
+        loader. It raises the exception of the loader if the load fails
+
+        Parameters:
+            key : str
+                The cache key
+
+        Returns:
+            CacheEntry or None
+                The cache entry, possibly stale, or None if neither the
+                cache nor the origin has a value
+        """
+        # every call looks the key up once, so it is counted once in the
+        # stats of the cache
+        loader = self._loader(key)
+        if loader is None:
+            return self.cache.get_entry(key)
+        entry = self.cache.get_entry(key, allow_stale=True)
+        if entry is not None and monotonic() <= entry.expires_at:
+            if self.beta and entry.should_refresh(self.beta):
+                self._flight(key, loader, background=True)
+            return entry
+        if entry is not None:
+            # serve the stale entry while it is reloaded in the background
+            self._flight(key, loader, background=True)
+            return entry
+        return self._flight(key, loader).result()
+
+    def get_entries(self, keys):
+        loaded = {key for key in keys if self._loader(key) is not None}
+        entries = self.cache.get_entries([key for key in keys if key not in loaded])
+        for key in loaded:
+            entries[key] = self.get_entry(key)
+        return {key: entries[key] for key in keys}
+
+    # A private method returning the loader and ttl of key or None
+    def _loader(self, key):
+        match = None
+        for prefix in self._loaders:
+            if key.startswith(prefix) and (match is None or len(prefix) > len(match)):
+                match = prefix
+        return None if match is None else self._loaders[match]
+
+    # A private method returning the future of the load of key. Only the
+    # first caller starts a load, the others get its future
+    def _flight(self, key, loader, background=False):
+        with self._flights_lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._flights[key] = future
+        if background:
+            self._refresher.submit(self._load, key, loader, future)
+        else:
+            self._load(key, loader, future)
+        return future
+
+    # A private method calling the loader of key and caching its value. The
+    # entry returned is built from the value rather than read back, which
+    # would count a hit, and even if the cache has no room for it
+    def _load(self, key, loader, future):
+        load, ttl = loader
+        try:
+            started = monotonic()
+            value = load(key)
+            delta = monotonic() - started
+            entry = None
+            if value is not None:
+                self.cache.set_entry(key, value, ttl, delta=delta)
+                entry = CacheEntry(value, ttl or self.cache.default_ttl, delta)
+            future.set_result(entry)
+        except Exception as error:
+            logger.exception('failed to load %s', key)
+            future.set_exception(error)
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
@@ -1,53 +1,136 @@
-from datetime import datetime
+import sys
+import threading
+from bisect import bisect_right
+from hashlib import blake2b
+from collections import OrderedDict
 from enum import Enum
+from math import ceil, inf, log
+from random import random
+from time import monotonic
+from .compression import CompressedValue, get_codec
+from .expiry import ExpiryIndex
+from .index import PrefixIndex, TagIndex
+from .policies import (
+    RejectPolicy, OldestFirstPolicy, NewestFirstPolicy,
+    LRUPolicy, LFUPolicy, WTinyLFUPolicy
+)
+from .sweeper import ExpirySweeper
+
+# The counters of the operations of a cache, see Cache.stats
+STATS = ('hits', 'stale_hits', 'misses', 'sets', 'rejections', 'deletes', 'evictions', 'expired')
+
+# The operations notified to the observers of a cache. EXPIRE and EXTEND
+# change the deadline of an entry only, EXTEND to a later one
+SET = 'set'
+DELETE = 'delete'
+EXPIRE = 'expire'
+EXTEND = 'extend'
+
+# The number of bytes an entry uses beyond its key and value: the
+# CacheEntry with its deadline and etag, and its slots in the container
+# and in the expiry heap, as measured with tracemalloc on CPython 3.11.
+# The LFU and W-TinyLFU policies use about 100 more bytes per entry
+ENTRY_OVERHEAD = 300
+
+# The number of scans without the prefix index whose sorted keys are kept,
+# so their next pages resume in them instead of sorting the keys again
+SCAN_SNAPSHOTS = 4
+
+# With sliding expiration, a read extends the deadline of an entry to its
+# full ttl once less than this fraction of the ttl remains, so a hot entry
+# is not copied on every read
+SLIDE_FRACTION = 0.9
+
+class PreconditionFailed(Exception):
+    """Raised by set_entry when the entry does not match if_match"""
 
 class EvictionStrategies(Enum):
     """A class to represent the list of eviction policies as Enum
 
-    Possible values: OLDEST_FIRST, NEWEST_FIRST, REJECT
-    Underlying values: 'OLDEST_FIRST', 'NEWEST_FIRST', 'REJECT'
+    Possible values: OLDEST_FIRST, NEWEST_FIRST, REJECT, LRU, LFU, W_TINYLFU
+    Underlying values: 'OLDEST_FIRST', 'NEWEST_FIRST', 'REJECT', 'LRU', 'LFU', 'W_TINYLFU'
     """
     OLDEST_FIRST = 'OLDEST_FIRST'
     NEWEST_FIRST = 'NEWEST_FIRST'
     REJECT = 'REJECT'
+    LRU = 'LRU'
+    LFU = 'LFU'
+    W_TINYLFU = 'W_TINYLFU'
 
 class CacheEntry:
     """A class used to represent a cache entry
 
+    It uses __slots__ so an entry has no __dict__, and its times come from
+    the monotonic clock so expiry is not affected by changes of the system
+    time.
+
     Attributes:  
-        json_str: str
-            the string represantion of the json object cached
+        json_str: str or bytes
+            the json object cached, as a string or as UTF-8 bytes. A
+            compressed value is decompressed each time it is read
+        value: str, bytes or CompressedValue
+            the value as it is stored, compressed or not
+        etag: str
+            a hash of the stored value, as 16 hexadecimal digits. It is
+            computed on first use, which set_entry does before caching it,
+            and kept as an int, which takes half the memory of the string
         ttl: integer
             the time to live in seconds
-        creation_time: float
-            a timestamp representing the time of creation of the cache entry
+        expires_at: float
+            the monotonic time after which the entry is expired. It is
+            infinite if the entry never expires (ttl == 0)
+        delta: float
+            the number of seconds it took to compute the value, 0 if unknown
+        tags: tuple of str
+            the tags of the entry, used to delete entries together
         is_expired: bool
             an indicator if the item has expired or not
 
     Methods:
+        should_refresh(beta=1.0):
+            returns True if the value should be recomputed before it expires
     """
-    def __init__(self, json_str, ttl):
-        self._json_str = json_str
-        self._ttl = int(ttl)
-        self._creation_time = datetime.utcnow().timestamp()
+    __slots__ = ('value', 'ttl', 'expires_at', '_etag', 'delta', 'tags')
+
+    def __init__(self, json_str, ttl, delta=0.0, tags=()):
+        self.value = json_str
+        self.ttl = int(ttl)
+        self.expires_at = monotonic() + self.ttl if self.ttl else inf
+        self._etag = None
+        self.delta = delta
+        self.tags = tags
+
+    def should_refresh(self, beta=1.0):
+        """Returns True if the value should be recomputed now, before it
+        expires. It is the probabilistic early expiration of XFetch: the
+        probability grows as the entry gets closer to its deadline, and
+        sooner for values that take longer to compute (delta), so a single
+        caller recomputes a hot entry before all the callers miss it
 
-    @property
-    def json_str(self):
-        return self._json_str
+        Parameters:
+            beta : float
+                Values above 1 favor earlier refreshes, 0 disables them
+        """
+        return monotonic() - self.delta * beta * log(1.0 - random()) >= self.expires_at
 
     @property
-    def ttl(self):
-        return self._ttl
+    def etag(self):
+        if self._etag is None:
+            value = self.value
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            self._etag = int.from_bytes(blake2b(value, digest_size=8).digest(), 'big')
+        return f'{self._etag:016x}'
 
     @property
-    def creation_time(self):
-        return self._creation_time
+    def json_str(self):
+        if isinstance(self.value, CompressedValue):
+            return self.value.decompress()
+        return self.value
 
     @property
     def is_expired(self):
-        if self.ttl == 0:
-            return False
-        return datetime.utcnow().timestamp() > self.creation_time + self.ttl
+        return monotonic() > self.expires_at
 
 class Cache:
     """A class used to represent the cache
@@ -57,21 +140,71 @@ class Cache:
             the max number of entries allowed in the cache
         default_ttl: integer 
             the default time to live in seconds
+        max_bytes: integer
+            the max number of bytes used by the keys and values of the
+            entries. 0 means there is no limit
+        used_bytes: integer
+            the number of bytes used by the keys and values of the entries
+        stale_grace: float
+            the number of seconds expired entries are kept, and returned
+            by get_entry(key, allow_stale=True), before they are reclaimed
+        stats: dict
+            the number of hits, hits on expired entries served within the
+            stale grace (stale_hits), misses, inserted entries (sets), rejected
+            entries, deleted entries, entries evicted by the eviction
+            policy and expired entries reclaimed since the cache was created
+        compression_stats: dict
+            the number of values compressed, the number of values left
+            uncompressed because they did not shrink, and the number of
+            bytes before and after compression of the compressed values
 
     Methods:
-        get_entry(key):
+        get_entry(key, allow_stale=False):
             returns the value for key in the cache if it exists and not expired.
             Otherwise, it will return None
-        set_entry(key, json_str, ttl=None):
+        set_entry(key, json_str, ttl=None, expires_at=None, if_match=None, delta=0.0, tags=()):
             inserts the value for key in the cache if possible. It returns True if successful and False otherwise. It will work according to the eviction policy of the cache
         delete_entry(key):
             removes the entry for key from the cache. It returns True if successful and False otherwise
+        items():
+            returns the (key, entry) pairs of the entries that are not expired
+        get_ttl(key):
+            returns the remaining time to live in seconds of the entry for key
+        touch(key):
+            restarts the time to live of the entry for key
+        expire(key, ttl=None, expires_at=None):
+            sets the remaining time to live, or the deadline, of the entry for key
+        get_entries(keys):
+            returns a dict of the values for keys, like get_entry
+        set_entries(entries, ttl=None, tags=()):
+            inserts the values of the dict entries, like set_entry, and returns a dict of the results
+        delete_entries(keys):
+            removes the entries for keys, like delete_entry, and returns a dict of the results
+        delete_tag(tag), delete_prefix(prefix):
+            removes the entries with a tag or with keys starting with a prefix and returns their number
+        scan(prefix='', after=None, count=100):
+            returns up to count (key, entry) pairs of the keys starting with prefix, in key order
+        reclaim_expired(max_entries):
+            removes up to max_entries expired entries from the cache and returns their number
+        start_sweeper(interval, samples, budget_ms):
+            starts a background thread that reclaims expired entries periodically
+        stop_sweeper():
+            stops the background sweeper if it is running
+        add_observer(observer), remove_observer(observer):
+            registers or unregisters a callable notified of every change of the cache
     """
     def __init__(
         self, 
         max_slots = 10000, 
         default_ttl = 3600, 
-        eviction_strategy =  EvictionStrategies.REJECT
+        eviction_strategy =  EvictionStrategies.REJECT,
+        max_bytes = 0,
+        compression_threshold = 0,
+        compression_codec = 'gzip',
+        stale_grace = 0,
+        ttl_jitter = 0,
+        prefix_index = False,
+        sliding_expiration = False
     ):
         """
         Parameters:
@@ -83,15 +216,75 @@ class Cache:
                 number is provided the default value of 3600 will be used
             eviction_strategy : EvictionStrategies
                 The Eviction policy when cache is full. It takes values from
-                enum EvictionStrategies = (OLDEST_FIRST, NEWEST_FIRST, REJECT) and
-                it defaults to EvictionStrategies.REJECT  
+                enum EvictionStrategies = (OLDEST_FIRST, NEWEST_FIRST, REJECT,
+                LRU, LFU, W_TINYLFU) and it defaults to EvictionStrategies.REJECT
+            max_bytes : integer
+                The max number of bytes used by the entries, their keys and
+                values, and ENTRY_OVERHEAD bytes each. When a new entry does
+                not fit, entries are evicted according to the eviction
+                policy. If a non positive number is provided there is no
+                limit
+            compression_threshold : integer
+                The size in bytes from which values are compressed. If a non
+                positive number is provided values are not compressed
+            compression_codec : str
+                The codec compressing the values, gzip, zlib, lzma or zstd
+                if the zstandard package is installed
+            stale_grace : float
+                The number of seconds expired entries can still be read with
+                allow_stale. They are evicted first when the cache is full
+            ttl_jitter : float
+                The max fraction of the time to live removed at random from
+                the entries, so entries written together do not expire
+                together. 0 disables it
+            prefix_index : bool
+                Whether the keys are indexed in a PrefixIndex, so delete_prefix
+                and scan visit the matching keys only instead of all the keys
+            sliding_expiration : bool
+                Whether get_entry restarts the time to live of the entries
+                it returns, so the entries expire ttl seconds after their
+                last read instead of their last write
         """
         self.max_slots = max_slots
+        self.stale_grace = max(0, stale_grace)
+        self._sliding_expiration = sliding_expiration
+        self._ttl_jitter = min(max(0, ttl_jitter), 1)
         self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._used_bytes = 0
+        self._compression_threshold = max(0, compression_threshold)
+        self._codec = get_codec(compression_codec)
+        # the counters of STATS are updated while the cache lock is held, so
+        # they need no synchronization of their own. They are attributes,
+        # which are faster to increment than the items of a dict
+        self._hits = self._stale_hits = self._misses = self._sets = self._rejections = 0
+        self._deletes = self._evictions = self._expired = 0
+        self._compression_stats = {
+            'compressed': 0, 'uncompressed': 0, 'bytes_in': 0, 'bytes_out': 0
+        }
+
+        # use an ordered dictionary as a container for the cache. Entries are
+        # kept in creation order so the oldest and newest entries are always
+        # at the ends of the container
+        self._container = OrderedDict()
         self._eviction_strategy = self._set_eviction_strategy(eviction_strategy)
-        
-        # use a dictionary as a container for the cache
-        self._container = {}
+        # a min-heap on the entries deadlines to find expired entries
+        # without scanning the container
+        self._expiry_index = ExpiryIndex()
+        # the secondary indexes of the keys, by prefix and by tag
+        self._prefix_index = PrefixIndex() if prefix_index else None
+        self._tag_index = TagIndex()
+        # the sorted keys of the recent scans without the prefix index, by
+        # prefix, the most recent last
+        self._scan_snapshots = OrderedDict()
+        # the sweeper thread mutates the container concurrently with the
+        # request handlers
+        self._lock = threading.RLock()
+        self._sweeper = None
+        self._observers = []
+
+    def __len__(self):
+        return len(self._container)
 
     @property
     def max_slots(self):
@@ -101,6 +294,28 @@ class Cache:
     def max_slots(self, max_slots):
         self._max_slots = max_slots if max_slots > 0 else 10000
 
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes if max_bytes > 0 else 0
+
+    @property
+    def used_bytes(self):
+        return self._used_bytes
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {name: getattr(self, f'_{name}') for name in STATS}
+
+    @property
+    def compression_stats(self):
+        with self._lock:
+            return dict(self._compression_stats)
+
     @property
     def default_ttl(self):
         return self._default_ttl
@@ -109,64 +324,157 @@ class Cache:
     def default_ttl(self, default_ttl):
         self._default_ttl = default_ttl if default_ttl > 0 else 3600
 
-    def get_entry(self, key):
+    def get_entry(self, key, allow_stale=False):
         """Returns the value for key in the cache if it exists and not expired.
         Otherwise, it will return None
 
         Parameters:
             key : str
                 The cache key
+            allow_stale : bool
+                If True, an entry expired for less than stale_grace seconds
+                is returned too
 
         Returns:
             CacheEntry or None
                 The cache entry associated with key or None
         """
-        cached_entry = self._container.get(key, None)
-        if cached_entry and not cached_entry.is_expired:
-            return cached_entry
+        now = monotonic()
+        deadline = now - (self.stale_grace if allow_stale else 0)
+        with self._lock:
+            cached_entry = self._container.get(key, None)
+            if cached_entry is not None and deadline <= cached_entry.expires_at:
+                if now > cached_entry.expires_at:
+                    self._stale_hits += 1
+                else:
+                    self._hits += 1
+                self._eviction_strategy.on_access(key)
+                if (
+                    self._sliding_expiration and cached_entry.ttl and
+                    now <= cached_entry.expires_at < now + SLIDE_FRACTION * cached_entry.ttl
+                ):
+                    cached_entry = self._retime(key, cached_entry, cached_entry.ttl)
+                return cached_entry
+            self._misses += 1
         return None
 
-    def set_entry(self, key, json_str, ttl=None):
+    def set_entry(self, key, json_str, ttl=None, expires_at=None, if_match=None, delta=0.0, tags=()):
         """Inserts the value for key in the cache if possible. 
         It returns True if successful and False otherwise 
         
         If the key already exists, it will replace the old value.
         Otherwise, it will use a free slot if one exists. If the cache
-        is full, the eviction strategy will kick in
+        is full, either in slots or in bytes, the eviction strategy will
+        kick in until the new entry fits. Values from the compression
+        threshold are stored compressed if it makes them smaller. With a
+        ttl jitter, the entry expires at a random time before its ttl
 
         Parameters:
             key: str
                 The cache key
-            json_str: str
-                The string representation of json object to be cached
+            json_str: str or bytes
+                The string representation of json object to be cached,
+                or its UTF-8 encoding
             ttl: int, optional
                 The time to live in seconds. The cache default will be
                 use if this is not provided
+            expires_at: float, optional
+                The monotonic time after which the entry is expired, used
+                instead of ttl when restoring an entry. math.inf means the
+                entry never expires
+            if_match: collection of str, optional
+                The etags of which the current entry must have one for the
+                value to be replaced, or '*' for any current entry
+            delta: float, optional
+                The number of seconds it took to compute the value, used
+                by CacheEntry.should_refresh
+            tags: collection of str, optional
+                The tags of the entry, see delete_tag
 
         Returns:
             bool
                 True if the entry is inserted and Flase otherwise 
+
+        Raises:
+            PreconditionFailed
+                If if_match is given and no current entry matches it
         """
         
-        ttl = ttl or self._default_ttl;
-        new_cache_entry = CacheEntry(json_str, ttl)
+        if self._compression_threshold and len(json_str) >= self._compression_threshold:
+            json_str = self._compress(json_str)
+
+        if expires_at is None:
+            ttl = ttl or self._default_ttl;
+            new_cache_entry = CacheEntry(json_str, ttl, delta)
+            if self._ttl_jitter:
+                new_cache_entry.expires_at -= random() * self._ttl_jitter * new_cache_entry.ttl
+        else:
+            new_cache_entry = restored_entry(json_str, expires_at)
+            new_cache_entry.delta = delta
+        if tags:
+            new_cache_entry.tags = tuple(tags)
+        # the etag is computed outside the lock
+        new_cache_entry.etag
+
+        new_size = entry_size(key, new_cache_entry)
+        if self._max_bytes and new_size > self._max_bytes:
+            with self._lock:
+                self._rejections += 1
+            return False
+
+        with self._lock:
+            # If entry already exists and the new value fits, replace old value
+            # and move it to the newest end of the container
+            old_cache_entry = self._container.get(key, None)
+            if if_match is not None and not etag_matches(old_cache_entry, if_match):
+                raise PreconditionFailed(key)
+            if old_cache_entry is not None:
+                old_size = entry_size(key, old_cache_entry)
+                if not self._max_bytes or self._used_bytes - old_size + new_size <= self._max_bytes:
+                    self._container[key] = new_cache_entry
+                    self._container.move_to_end(key)
+                    self._used_bytes += new_size - old_size
+                    self._expiry_index.push(key, new_cache_entry, self._container)
+                    if old_cache_entry.tags or tags:
+                        self._tag_index.remove(key, old_cache_entry.tags)
+                        self._tag_index.add(key, new_cache_entry.tags)
+                    self._eviction_strategy.on_update(key)
+                    self._sets += 1
+                    self._notify(SET, key, new_cache_entry)
+                    return True
+                # Otherwise, the old value is dropped and the new one is
+                # inserted as a new entry
+                self._remove(key, notify=False)
+
+            # While the cache is full, expired entries are evicted first and
+            # the eviction policy is used otherwise
+            while len(self._container) >= self._max_slots or (
+                self._max_bytes and self._used_bytes + new_size > self._max_bytes
+            ):
+                key_to_evict = self._expiry_index.first_expired(self._container)
+                if key_to_evict is not None:
+                    self._expired += 1
+                else:
+                    key_to_evict = self._eviction_strategy.victim(key)
+                    if key_to_evict is None:
+                        self._rejections += 1
+                        if old_cache_entry is not None:
+                            self._notify(DELETE, key, None)
+                        return False
+                    self._evictions += 1
+                self._remove(key_to_evict)
 
-        # If entry already exists, replace old value
-        if key in self._container:
-            self._container[key] = new_cache_entry
-            return True
-        # If a free slot exists, use it
-        if len(self._container.keys()) < self._max_slots:
-            self._container[key] = new_cache_entry
-            return True
-        
-        # Otherwise, use eviction policy
-        key_to_evict = self._eviction_strategy(self._container.items())
-        if key_to_evict:
-            del self._container[key_to_evict]
             self._container[key] = new_cache_entry
+            self._used_bytes += new_size
+            self._expiry_index.push(key, new_cache_entry, self._container)
+            if self._prefix_index is not None:
+                self._prefix_index.add(key)
+            if tags:
+                self._tag_index.add(key, new_cache_entry.tags)
+            self._eviction_strategy.on_insert(key)
+            self._sets += 1
+            self._notify(SET, key, new_cache_entry)
             return True
-        return False
 
     def delete_entry(self, key):
         """Removes the entry for key from the cache. It returns True if successful and False
@@ -181,60 +489,373 @@ class Cache:
                 True if the entry is deleted and Flase if the entry
                 does not exist or expired
         """
-        cached_entry = self._container.get(key, None)
-        if not cached_entry:
-            return False
-        del self._container[key]
-        return not cached_entry.is_expired
+        with self._lock:
+            cached_entry = self._remove(key)
+            deleted = cached_entry is not None and not cached_entry.is_expired
+            if deleted:
+                self._deletes += 1
+        return deleted
+
+    def items(self):
+        """Returns the (key, entry) pairs of the entries that are not
+        expired. The pairs are copied under the cache lock and the entries
+        are not modified once cached, so it is a point-in-time view
 
-    # A private method to set eviction strategy
-    def _set_eviction_strategy(self, eviction_strategy):
-        if eviction_strategy == EvictionStrategies.OLDEST_FIRST:
-            return oldest_first
-        if eviction_strategy == EvictionStrategies.NEWEST_FIRST:
-            return newest_first
-        return reject
+        Returns:
+            list of tuple
+                The (key, CacheEntry) pairs, in the container order
+        """
+        with self._lock:
+            pairs = list(self._container.items())
+        now = monotonic()
+        return [(key, entry) for key, entry in pairs if now <= entry.expires_at]
 
-"""An implementation of reject strategy
+    def get_ttl(self, key):
+        """Returns the remaining time to live of the entry for key. Unlike
+        get_entry, it does not count as an access for the eviction policy
 
-It returns the key of the first expired entry it encounters or None
-if no expired entry exists
-"""
-def reject(container):
-    for key,entry in container:
-        print(key, entry)
-        if entry.is_expired:
-            return key
-    return None
+        Parameters:
+            key : str
+                The cache key
 
-"""An implementation of oldest_first strategy
+        Returns:
+            float or None
+                The remaining time to live in seconds, math.inf if the entry
+                never expires, or None if the entry does not exist or expired
+        """
+        with self._lock:
+            cached_entry = self._container.get(key, None)
+        if cached_entry is None:
+            return None
+        remaining = cached_entry.expires_at - monotonic()
+        return remaining if remaining >= 0 else None
 
-It returns the key of the first expired entry it encounters or the key
-of the oldest entry in the cache
-"""
-def oldest_first(container):
-    oldest_key = None
-    oldest_creation_time = datetime.utcnow().timestamp()
-    for key,entry in container:
-        if entry.is_expired:
-            return key
-        if entry.creation_time < oldest_creation_time:
-            oldest_creation_time = entry.creation_time
-            oldest_key = key
-    return oldest_key
-
-"""An implementation of newest_first strategy
-
-It returns the key of the first expired entry it encounters or the key
-of the newest entry in the cache
+    def touch(self, key):
+        """Restarts the time to live of the entry for key, without sending
+        its value again
+
+        Parameters:
+            key : str
+                The cache key
+
+        Returns:
+            bool
+                True if the entry exists and is not expired, False otherwise
+        """
+        with self._lock:
+            cached_entry = self._container.get(key, None)
+            if cached_entry is None or cached_entry.is_expired:
+                return False
+            self._retime(key, cached_entry, cached_entry.ttl)
+            return True
+
+    def expire(self, key, ttl=None, expires_at=None):
+        """Sets the time to live of the entry for key, from now, without
+        sending its value again
+
+        Parameters:
+            key : str
+                The cache key
+            ttl : int
+                The new time to live in seconds. 0 means the entry never
+                expires
+            expires_at: float, optional
+                The monotonic time after which the entry is expired, used
+                instead of ttl when restoring a deadline. math.inf means the
+                entry never expires
+
+        Returns:
+            bool
+                True if the entry exists and is not expired, False otherwise
+        """
+        with self._lock:
+            cached_entry = self._container.get(key, None)
+            if cached_entry is None or cached_entry.is_expired:
+                return False
+            self._retime(key, cached_entry, max(0, ttl or 0), expires_at)
+            return True
+
+    def get_entries(self, keys):
+        """Returns the values for keys, in one pass under the cache lock
+
+        Parameters:
+            keys : list of str
+                The cache keys
+
+        Returns:
+            dict
+                The CacheEntry or None associated with each key
+        """
+        with self._lock:
+            return {key: self.get_entry(key) for key in keys}
+
+    def set_entries(self, entries, ttl=None, tags=()):
+        """Inserts the values for many keys, in one pass under the cache lock
+
+        Parameters:
+            entries : dict
+                The string representation of the json object to be cached
+                for each key
+            ttl: int, optional
+                The time to live in seconds of all the entries
+            tags: collection of str, optional
+                The tags of all the entries
+
+        Returns:
+            dict
+                The result of set_entry for each key
+        """
+        with self._lock:
+            return {
+                key: self.set_entry(key, json_str, ttl, tags=tags) for key, json_str in entries.items()
+            }
+
+    def delete_entries(self, keys):
+        """Removes the entries for keys, in one pass under the cache lock
+
+        Parameters:
+            keys : list of str
+                The cache keys
+
+        Returns:
+            dict
+                The result of delete_entry for each key
+        """
+        with self._lock:
+            return {key: self.delete_entry(key) for key in keys}
+
+    def delete_tag(self, tag):
+        """Removes the entries having tag, found in the tag index in a
+        time proportional to their number
+
+        Parameters:
+            tag : str
+                The tag
+
+        Returns:
+            int
+                The number of entries deleted, without the expired ones
+        """
+        with self._lock:
+            return sum(self.delete_entry(key) for key in self._tag_index.keys(tag))
+
+    def delete_prefix(self, prefix):
+        """Removes the entries with keys starting with prefix. With the
+        prefix index, only the matching keys are visited. Otherwise all the
+        keys are, once, so the call is O(n) in the size of the cache
+
+        Parameters:
+            prefix : str
+                The prefix of the keys
+
+        Returns:
+            int
+                The number of entries deleted, without the expired ones
+        """
+        with self._lock:
+            if self._prefix_index is not None:
+                keys = list(self._prefix_index.iter_keys(prefix))
+            else:
+                keys = [key for key in self._container if key.startswith(prefix)]
+            return sum(self.delete_entry(key) for key in keys)
+
+    def scan(self, prefix='', after=None, count=100):
+        """Returns the entries with keys starting with prefix, in key order,
+        a page at a time: the next page starts after the last key of the
+        previous one. With the prefix index, only the keys of the page are
+        visited. Otherwise the first page sorts the matching keys, O(n log
+        n), and the next pages resume in these sorted keys, kept for the
+        SCAN_SNAPSHOTS most recent prefixes. The keys added after the first
+        page may then be missed, and the pages of a scan whose keys were
+        dropped sort the keys again
+
+        Parameters:
+            prefix : str
+                The prefix of the keys
+            after : str, optional
+                The key after which the page starts
+            count : int
+                The max number of entries of the page
+
+        Returns:
+            list of tuple
+                The (key, CacheEntry) pairs of the entries that are not expired
+        """
+        pairs = []
+        now = monotonic()
+        with self._lock:
+            if self._prefix_index is not None:
+                keys = self._prefix_index.iter_keys(prefix, after)
+            else:
+                keys = self._scan_snapshot(prefix, after)
+            for key in keys:
+                if len(pairs) >= count:
+                    break
+                entry = self._container.get(key)
+                if entry is not None and now <= entry.expires_at:
+                    pairs.append((key, entry))
+        return pairs
+
+    def reclaim_expired(self, max_entries):
+        """Removes up to max_entries expired entries from the cache, the ones
+        with the earliest deadlines first. Entries expired for less than
+        stale_grace seconds are kept
+
+        Parameters:
+            max_entries : int
+                The max number of entries to remove
+
+        Returns:
+            int
+                The number of entries removed
+        """
+        reclaimed = 0
+        with self._lock:
+            while reclaimed < max_entries:
+                key = self._expiry_index.first_expired(self._container, self.stale_grace)
+                if key is None:
+                    break
+                self._remove(key, notify=False)
+                reclaimed += 1
+            self._expired += reclaimed
+        return reclaimed
+
+    def start_sweeper(self, interval, samples=20, budget_ms=5):
+        """Starts a background thread that reclaims expired entries every
+        interval seconds. See ExpirySweeper for the parameters
+
+        Returns:
+            ExpirySweeper
+                The running sweeper
+        """
+        self.stop_sweeper()
+        self._sweeper = ExpirySweeper(self, interval, samples, budget_ms)
+        self._sweeper.start()
+        return self._sweeper
+
+    def stop_sweeper(self):
+        """Stops the background sweeper if it is running"""
+        if self._sweeper:
+            self._sweeper.stop()
+            self._sweeper = None
+
+    def add_observer(self, observer):
+        """Registers a callable notified of every change of the cache
+
+        It is called as observer(operation, key, entry) while the cache lock
+        is held, so the notifications are in the order of the changes and the
+        observer must return quickly. operation is SET, with the new entry,
+        DELETE, with None, for deletions and evictions, or EXPIRE or EXTEND,
+        with the entry holding the new deadline, when only the deadline of an
+        entry changed, EXTEND when it is later than before. Expired entries
+        reclaimed by the cache are not notified, since they are expired
+        everywhere at the same time
+
+        Parameters:
+            observer : callable
+                The observer
+        """
+        with self._lock:
+            self._observers = self._observers + [observer]
+
+    def remove_observer(self, observer):
+        """Unregisters an observer registered with add_observer"""
+        with self._lock:
+            self._observers = [o for o in self._observers if o != observer]
+
+    # A private method returning the compressed value of json_str, or
+    # json_str if compressing it does not make it smaller
+    def _compress(self, json_str):
+        value = json_str.encode('utf-8') if isinstance(json_str, str) else bytes(json_str)
+        compressed = self._codec.compress(value)
+        with self._lock:
+            if len(compressed) >= len(value):
+                self._compression_stats['uncompressed'] += 1
+                return json_str
+            self._compression_stats['compressed'] += 1
+            self._compression_stats['bytes_in'] += len(value)
+            self._compression_stats['bytes_out'] += len(compressed)
+        return compressed
+
+    # A private method replacing the entry of key with a copy expiring ttl
+    # seconds from now, or at expires_at, since the cached entries are never
+    # modified. The observers are told the deadline changed, not the value
+    def _retime(self, key, cached_entry, ttl, expires_at=None):
+        if expires_at is None:
+            new_cache_entry = CacheEntry(cached_entry.value, ttl)
+        else:
+            new_cache_entry = restored_entry(cached_entry.value, expires_at)
+        new_cache_entry.delta = cached_entry.delta
+        new_cache_entry.tags = cached_entry.tags
+        new_cache_entry._etag = cached_entry._etag
+        self._container[key] = new_cache_entry
+        self._expiry_index.push(key, new_cache_entry, self._container)
+        extended = new_cache_entry.expires_at >= cached_entry.expires_at
+        self._notify(EXTEND if extended else EXPIRE, key, new_cache_entry)
+        return new_cache_entry
+
+    # A private method returning an iterator of the sorted keys starting
+    # with prefix after after, from the snapshot of the scan of prefix. The
+    # first page of a scan takes the snapshot
+    def _scan_snapshot(self, prefix, after):
+        snapshot = None if after is None else self._scan_snapshots.get(prefix)
+        if snapshot is None:
+            snapshot = sorted(key for key in self._container if key.startswith(prefix))
+            self._scan_snapshots[prefix] = snapshot
+            while len(self._scan_snapshots) > SCAN_SNAPSHOTS:
+                self._scan_snapshots.popitem(last=False)
+        self._scan_snapshots.move_to_end(prefix)
+        start = 0 if after is None else bisect_right(snapshot, after)
+        return (snapshot[i] for i in range(start, len(snapshot)))
+
+    # A private method notifying the observers of a change
+    def _notify(self, operation, key, entry):
+        for observer in self._observers:
+            observer(operation, key, entry)
+
+    # A private method removing key from the container and the eviction
+    # policy. It returns the removed entry or None
+    def _remove(self, key, notify=True):
+        cached_entry = self._container.pop(key, None)
+        if cached_entry is not None:
+            self._used_bytes -= entry_size(key, cached_entry)
+            self._eviction_strategy.on_delete(key)
+            if self._prefix_index is not None:
+                self._prefix_index.remove(key)
+            if cached_entry.tags:
+                self._tag_index.remove(key, cached_entry.tags)
+            if notify:
+                self._notify(DELETE, key, None)
+        return cached_entry
+
+    # A private method to set eviction strategy
+    def _set_eviction_strategy(self, eviction_strategy):
+        policies = {
+            EvictionStrategies.OLDEST_FIRST: OldestFirstPolicy,
+            EvictionStrategies.NEWEST_FIRST: NewestFirstPolicy,
+            EvictionStrategies.LRU: LRUPolicy,
+            EvictionStrategies.LFU: LFUPolicy,
+            EvictionStrategies.W_TINYLFU: WTinyLFUPolicy,
+        }
+        policy = policies.get(eviction_strategy, RejectPolicy)
+        return policy(self._container, self._max_slots)
+
+"""Returns a cache entry expiring at the monotonic time expires_at"""
+def restored_entry(json_str, expires_at):
+    if expires_at == inf:
+        return CacheEntry(json_str, 0)
+    cache_entry = CacheEntry(json_str, max(1, ceil(expires_at - monotonic())))
+    cache_entry.expires_at = expires_at
+    return cache_entry
+
+"""Returns True if entry exists, is not expired and has one of the etags of
+if_match, or if_match has '*'
 """
-def newest_first(container):
-    newest_key = None
-    newest_creation_time = 0.0
-    for key,entry in container:
-        if entry.is_expired:
-            return key
-        if entry.creation_time > newest_creation_time:
-            newest_creation_time = entry.creation_time
-            newest_key = key
-    return newest_key
\ No newline at end of file
+def etag_matches(entry, if_match):
+    if entry is None or entry.is_expired:
+        return False
+    return '*' in if_match or entry.etag in if_match
+
+"""Returns the number of bytes used by a cache entry, its key and its value"""
+def entry_size(key, entry):
+    return sys.getsizeof(key) + sys.getsizeof(entry.value) + ENTRY_OVERHEAD
@@ -0,0 +1,212 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from math import inf
+from time import monotonic, time
+
+logger = logging.getLogger(__name__)
+
+# A snapshot is the magic string followed by records. A record is the
+# length of the key, the length of the value, the length of the tags, the
+# wall-clock expiry time (0 if the entry never expires) and the compute
+# time (delta) of the entry, followed by the key, the value and the tags
+# as a JSON list (empty if the entry has no tags)
+SNAPSHOT_MAGIC = b'IMCSNAP2'
+RECORD = struct.Struct('<IIIdd')
+# The records of version 1 have no tags and no delta. They are still loaded
+SNAPSHOT_MAGIC_V1 = b'IMCSNAP1'
+RECORD_V1 = struct.Struct('<IId')
+
+
+def encode_record(key, entry):
+    """Returns the bytes of the record of a cache entry. The monotonic
+    deadline of the entry is stored as a wall-clock time so the record
+    stays valid after a restart
+    """
+    key_bytes = key.encode('utf-8')
+    value = entry.json_str
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    tags = json.dumps(entry.tags).encode('utf-8') if entry.tags else b''
+    return RECORD.pack(
+        len(key_bytes), len(value), len(tags), wall_clock(entry.expires_at), entry.delta
+    ) + key_bytes + value + tags
+
+
+def decode_record(buffer, offset, record=RECORD):
+    """Decodes the record of buffer at offset, with the format record (RECORD
+    or RECORD_V1)
+
+    Returns:
+        tuple or None
+            The key, the value, the wall-clock expiry time, the delta and
+            the tags of the record, and the offset of the next record, or
+            None if the record is not complete
+    """
+    end = len(buffer)
+    if offset + record.size > end:
+        return None
+    if record is RECORD_V1:
+        key_length, value_length, expires_at = record.unpack_from(buffer, offset)
+        tags_length, delta = 0, 0.0
+    else:
+        key_length, value_length, tags_length, expires_at, delta = record.unpack_from(buffer, offset)
+    start = offset + record.size
+    value_start = start + key_length
+    tags_start = value_start + value_length
+    next_offset = tags_start + tags_length
+    if next_offset > end:
+        return None
+    key = bytes(buffer[start:value_start]).decode('utf-8')
+    tags = decode_tags(buffer[tags_start:next_offset])
+    return key, buffer[value_start:tags_start], expires_at, delta, tags, next_offset
+
+
+"""Returns the tags of a record, encoded as a JSON list or empty"""
+def decode_tags(data):
+    return tuple(json.loads(bytes(data))) if data else ()
+
+
+def iter_records(buffer, offset, record=RECORD):
+    """Yields the (key, value, wall-clock expiry time, delta, tags) of the
+    records of buffer from offset, as long as the records are complete
+    """
+    while True:
+        decoded = decode_record(buffer, offset, record)
+        if decoded is None:
+            return
+        *fields, offset = decoded
+        yield tuple(fields)
+
+
+def wall_clock(expires_at):
+    """Converts a monotonic deadline to a wall-clock time, 0 if it is infinite"""
+    if expires_at == inf:
+        return 0.0
+    return time() + (expires_at - monotonic())
+
+
+def monotonic_clock(expires_at):
+    """Converts a wall-clock time, 0 for never, to a monotonic deadline"""
+    if expires_at == 0.0:
+        return inf
+    return monotonic() + (expires_at - time())
+
+
+def write_snapshot(cache, path):
+    """Writes the entries of cache that are not expired to a snapshot file.
+    The file is written next to path then renamed, so path always holds a
+    complete snapshot
+
+    Parameters:
+        cache : Cache, ConcurrentCache or SharedMemoryCache
+            The cache to save
+        path : str
+            The path of the snapshot
+
+    Returns:
+        int
+            The number of entries written
+    """
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    count = 0
+    with open(temporary_path, 'wb', buffering=1024 * 1024) as snapshot:
+        snapshot.write(SNAPSHOT_MAGIC)
+        for key, entry in cache.items():
+            snapshot.write(encode_record(key, entry))
+            count += 1
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temporary_path, path)
+    return count
+
+
+def load_snapshot(cache, path):
+    """Loads the entries of a snapshot file into cache, skipping the ones
+    that expired since the snapshot was written. The file is memory-mapped
+    and read as a stream of records. The snapshots of version 1 are loaded
+    too, their entries without tags and delta
+
+    Parameters:
+        cache : Cache, ConcurrentCache or SharedMemoryCache
+            The cache to fill
+        path : str
+            The path of the snapshot
+
+    Returns:
+        int
+            The number of entries loaded
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < len(SNAPSHOT_MAGIC):
+        return 0
+    count = 0
+    now = time()
+    with open(path, 'rb') as snapshot, \
+            mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        magic = buffer[:len(SNAPSHOT_MAGIC)]
+        if magic not in (SNAPSHOT_MAGIC, SNAPSHOT_MAGIC_V1):
+            raise ValueError(f'{path} is not a snapshot file')
+        record = RECORD if magic == SNAPSHOT_MAGIC else RECORD_V1
+        for key, value, expires_at, delta, tags in iter_records(buffer, len(magic), record):
+            if expires_at and expires_at < now:
+                continue
+            if cache.set_entry(key, value, expires_at=monotonic_clock(expires_at), delta=delta, tags=tags):
+                count += 1
+    return count
+
+
+class SnapshotWriter(threading.Thread):
+    """A background thread writing a snapshot of a cache periodically
+
+    Attributes:
+        last_count: int
+            the number of entries of the last snapshot
+
+    Methods:
+        snapshot():
+            writes a snapshot now
+        stop():
+            stops the thread, after writing a last snapshot
+    """
+    def __init__(self, cache, path, interval):
+        """
+        Parameters:
+            cache : Cache, ConcurrentCache or SharedMemoryCache
+                The cache to save
+            path : str
+                The path of the snapshot
+            interval : float
+                The number of seconds between two snapshots
+        """
+        super().__init__(name='cache-snapshot-writer', daemon=True)
+        self._cache = cache
+        self._path = path
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._snapshot_lock = threading.Lock()
+        self.last_count = 0
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.snapshot()
+
+    def snapshot(self):
+        """Writes a snapshot now and returns the number of entries written"""
+        with self._snapshot_lock:
+            try:
+                self.last_count = write_snapshot(self._cache, self._path)
+            except OSError:
+                logger.exception('failed to write the snapshot %s', self._path)
+        return self.last_count
+
+    def stop(self):
+        """Stops the thread, after writing a last snapshot"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.snapshot()
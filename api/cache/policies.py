@@ -0,0 +1,233 @@
+from collections import OrderedDict
+
+class EvictionPolicy:
+    """The base class of eviction policies
+
+    A policy is notified of every change to the cache container through its
+    hooks and chooses the entry to evict when the cache is full. Expired
+    entries are always evicted first by the cache, so a policy is only asked
+    for a victim when no entry has expired. The hooks of the base class do
+    nothing, which is enough for the policies relying on the creation order
+    of the container.
+
+    Methods:
+        on_insert(key):
+            called after a new key is added to the container
+        on_update(key):
+            called after the value of an existing key is replaced
+        on_access(key):
+            called after a key is read
+        on_delete(key):
+            called after a key is removed from the container
+        victim(candidate):
+            returns the key to evict to make room for candidate or None
+    """
+    def __init__(self, container, max_slots):
+        """
+        Parameters:
+            container : OrderedDict
+                The cache container, in creation order
+            max_slots : int
+                The max number of entries allowed in the cache
+        """
+        self._container = container
+        self._max_slots = max_slots
+
+    def on_insert(self, key):
+        pass
+
+    def on_update(self, key):
+        pass
+
+    def on_access(self, key):
+        pass
+
+    def on_delete(self, key):
+        pass
+
+    def victim(self, candidate):
+        return None
+
+class RejectPolicy(EvictionPolicy):
+    """Never evicts a live entry, new keys are rejected when the cache is full"""
+
+class OldestFirstPolicy(EvictionPolicy):
+    """Evicts the oldest entry, which is the first one of the container"""
+    def victim(self, candidate):
+        return next(iter(self._container), None)
+
+class NewestFirstPolicy(EvictionPolicy):
+    """Evicts the newest entry, which is the last one of the container"""
+    def victim(self, candidate):
+        return next(reversed(self._container), None)
+
+class LRUPolicy(EvictionPolicy):
+    """Evicts the least recently used entry
+
+    The container itself is kept in recency order: reads move the key to the
+    end of the container, the same way updates do, so the least recently
+    used entry is the first one. It costs no memory beyond the container.
+    """
+    def on_access(self, key):
+        self._container.move_to_end(key)
+
+    def victim(self, candidate):
+        return next(iter(self._container), None)
+
+class LFUPolicy(EvictionPolicy):
+    """Evicts the least frequently used entry
+
+    Keys are grouped in buckets by access count. Every bucket is kept in
+    recency order so ties are broken by evicting the least recently used
+    key. All the operations are O(1).
+    """
+    def __init__(self, container, max_slots):
+        super().__init__(container, max_slots)
+        self._frequencies = {}
+        self._buckets = {}
+        self._min_frequency = 0
+
+    def on_insert(self, key):
+        self._frequencies[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._min_frequency = 1
+
+    def on_update(self, key):
+        self.on_access(key)
+
+    def on_access(self, key):
+        frequency = self._frequencies[key]
+        self._remove_from_bucket(key, frequency)
+        if self._min_frequency == frequency and frequency not in self._buckets:
+            self._min_frequency = frequency + 1
+        self._frequencies[key] = frequency + 1
+        self._buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    def on_delete(self, key):
+        frequency = self._frequencies.pop(key, None)
+        if frequency is not None:
+            self._remove_from_bucket(key, frequency)
+
+    def victim(self, candidate):
+        if not self._buckets:
+            return None
+        # deletions may have emptied the bucket of the min frequency
+        if self._min_frequency not in self._buckets:
+            self._min_frequency = min(self._buckets)
+        return next(iter(self._buckets[self._min_frequency]))
+
+    def _remove_from_bucket(self, key, frequency):
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+
+class CountMinSketch:
+    """A compact approximation of the access frequency of keys
+
+    It uses 4 rows of 4-bit counters (stored in bytes and saturating at 15),
+    each row being about 4 times wider than the capacity of the cache to
+    limit collisions.
+    The estimate of a key is the min of its counters. When the number of
+    increments reaches the sample size, all the counters are halved so the
+    sketch keeps track of recent popularity.
+    """
+    _SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5)
+    _MAX_COUNT = 15
+    # maps every counter to its half, so a row is halved by bytearray.translate
+    _HALVE_TABLE = bytes(count >> 1 for count in range(256))
+
+    def __init__(self, capacity):
+        width = 1
+        while width < max(4 * capacity, 16):
+            width <<= 1
+        self._mask = width - 1
+        self._rows = [bytearray(width) for _ in self._SEEDS]
+        self._sample_size = 10 * width
+        self._additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        return [((h * seed) & 0xFFFFFFFFFFFFFFFF) >> 32 & self._mask for seed in self._SEEDS]
+
+    def increment(self, key):
+        added = False
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < self._MAX_COUNT:
+                row[index] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self._sample_size:
+                self._reset()
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def _reset(self):
+        for row in self._rows:
+            row[:] = row.translate(self._HALVE_TABLE)
+        self._additions //= 2
+
+class WTinyLFUPolicy(EvictionPolicy):
+    """An implementation of the W-TinyLFU policy
+
+    New keys enter a small LRU window (1% of the slots). The rest of the
+    cache is a segmented LRU made of a probation and a protected segment
+    (80% of the main area). A key read while on probation is promoted to
+    the protected segment. When the cache is full, the key leaving the
+    window competes with the probation victim and the one with the lower
+    estimated frequency, according to a count-min sketch, is evicted.
+    """
+    def __init__(self, container, max_slots):
+        super().__init__(container, max_slots)
+        self._window_capacity = max(1, max_slots // 100)
+        self._protected_capacity = int((max_slots - self._window_capacity) * 0.8)
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._sketch = CountMinSketch(max_slots)
+
+    def on_insert(self, key):
+        self._sketch.increment(key)
+        self._window[key] = None
+        # the window overflows into the probation segment
+        if len(self._window) > self._window_capacity:
+            window_key, _ = self._window.popitem(last=False)
+            self._probation[window_key] = None
+
+    def on_update(self, key):
+        self.on_access(key)
+
+    def on_access(self, key):
+        self._sketch.increment(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self._protected_capacity:
+                protected_key, _ = self._protected.popitem(last=False)
+                self._probation[protected_key] = None
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+
+    def on_delete(self, key):
+        self._window.pop(key, None)
+        self._probation.pop(key, None)
+        self._protected.pop(key, None)
+
+    def victim(self, candidate):
+        main_victim = next(iter(self._probation), None)
+        if main_victim is None:
+            main_victim = next(iter(self._protected), None)
+        window_victim = next(iter(self._window), None)
+        if main_victim is None:
+            return window_victim
+        if window_victim is None or len(self._window) < self._window_capacity:
+            return main_victim
+        # the window is full: its LRU key moves to the main area when
+        # candidate is inserted, unless it loses against the main victim
+        if self._sketch.estimate(window_victim) > self._sketch.estimate(main_victim):
+            return main_victim
+        return window_victim
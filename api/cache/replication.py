@@ -0,0 +1,331 @@
+import logging
+import socket
+import struct
+import threading
+from collections import deque
+from time import monotonic, time
+from .aof import DEADLINE, encode_operation
+from .persistence import RECORD, decode_tags, encode_record, monotonic_clock
+
+logger = logging.getLogger(__name__)
+
+# The replication stream is the magic string, which is the version of the
+# stream, followed by frames starting with one byte. S, D and T are the
+# sets, deletes and deadline changes of the operation log (see aof.py), with
+# absolute wall-clock expiry times. E ends the initial snapshot and H is a
+# heartbeat, both followed by the lag of the replica measured on the primary
+# alone, as the age in seconds of the oldest operation still queued for the
+# replica, and the sequence number of the last operation queued for it, which
+# is the number of frames the replica has applied once it is in sync
+STREAM_MAGIC = b'IMCREPL2'
+HEARTBEAT = struct.Struct('<dQ')
+
+
+class ReplicationServer(threading.Thread):
+    """A background thread streaming the changes of a cache to replicas
+
+    Every replica connecting to the server gets a snapshot of the cache,
+    then the changes made since the snapshot started, in order. The changes
+    are queued per replica by an observer of the cache, so the writes do not
+    wait for the replicas. A replica whose queue grows past max_pending is
+    disconnected, and resynchronizes from a new snapshot when it reconnects.
+
+    Methods:
+        status():
+            returns the address, the synchronization state, the number of
+            queued operations and the age of the oldest one of every replica
+        stop():
+            closes the listener and the connections of the replicas
+    """
+    def __init__(self, cache, host='127.0.0.1', port=0, heartbeat_interval=0.5, max_pending=1000000):
+        """
+        Parameters:
+            cache : Cache or ConcurrentCache
+                The primary cache
+            host, port : str, int
+                The address of the listener, port 0 picks a free port
+            heartbeat_interval : float
+                The max number of seconds between two heartbeats
+            max_pending : int
+                The max number of operations queued for a replica
+        """
+        super().__init__(name='cache-replication-server', daemon=True)
+        self._cache = cache
+        self._heartbeat_interval = heartbeat_interval
+        self._max_pending = max_pending
+        self._listener = socket.create_server((host, port))
+        self.address = self._listener.getsockname()[:2]
+        self._replicas = []
+        self._replicas_lock = threading.Lock()
+        self._stopped = False
+
+    def run(self):
+        while not self._stopped:
+            try:
+                connection, address = self._listener.accept()
+            except OSError:
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = ReplicaStream(self, connection, address)
+            with self._replicas_lock:
+                self._replicas.append(stream)
+            stream.start()
+
+    def status(self):
+        with self._replicas_lock:
+            replicas = list(self._replicas)
+        return {
+            'role': 'primary',
+            'replicas': [stream.status() for stream in replicas],
+        }
+
+    def stop(self):
+        self._stopped = True
+        self._listener.close()
+        with self._replicas_lock:
+            replicas = list(self._replicas)
+        for stream in replicas:
+            stream.close()
+
+    # A private method called by a stream when its replica is gone
+    def _remove(self, stream):
+        with self._replicas_lock:
+            if stream in self._replicas:
+                self._replicas.remove(stream)
+
+
+class ReplicaStream(threading.Thread):
+    """A thread sending the snapshot and the changes of a cache to one
+    replica. It is created by ReplicationServer
+    """
+    def __init__(self, server, connection, address):
+        super().__init__(name=f'cache-replica-{address[0]}:{address[1]}', daemon=True)
+        self._server = server
+        self._connection = connection
+        self._address = address
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._sent = 0
+        self._synced = False
+        self._closed = False
+
+    def observe(self, operation, key, entry):
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._queue) >= self._server._max_pending:
+                logger.warning('replica %s:%s is too slow, disconnecting it', *self._address)
+                self._closed = True
+            else:
+                self._queue.append((operation, key, entry, monotonic()))
+            self._condition.notify()
+
+    def status(self):
+        with self._condition:
+            return {
+                'address': f'{self._address[0]}:{self._address[1]}',
+                'synced': self._synced,
+                'sent': self._sent,
+                'pending': len(self._queue),
+                'lag_seconds': monotonic() - self._queue[0][3] if self._queue else 0.0,
+            }
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def run(self):
+        cache = self._server._cache
+        # the changes made while the snapshot is read are queued, and sent
+        # after it, where applying them again gives the same state
+        try:
+            cache.add_observer(self.observe)
+            self._connection.sendall(STREAM_MAGIC)
+            snapshot = []
+            for key, entry in cache.items():
+                snapshot.append(b'S' + encode_record(key, entry))
+                if len(snapshot) >= 1000:
+                    self._send(snapshot)
+                    snapshot = []
+            self._send(snapshot)
+            self._send_heartbeat(b'E')
+            with self._condition:
+                self._synced = True
+            while True:
+                with self._condition:
+                    if not (self._queue or self._closed):
+                        self._condition.wait(self._server._heartbeat_interval)
+                    if self._closed:
+                        break
+                    batch = list(self._queue)
+                    self._queue.clear()
+                if batch:
+                    self._send([encode_operation(*operation[:3]) for operation in batch])
+                self._send_heartbeat(b'H')
+        except OSError:
+            logger.info('replica %s:%s disconnected', *self._address)
+        except NotImplementedError as error:
+            logger.error('replica %s:%s cannot be served: %s', *self._address, error)
+        finally:
+            cache.remove_observer(self.observe)
+            with self._condition:
+                self._closed = True
+            self._connection.close()
+            self._server._remove(self)
+
+    def _send(self, frames):
+        if frames:
+            self._connection.sendall(b''.join(frames))
+            with self._condition:
+                self._sent += len(frames)
+
+    def _send_heartbeat(self, code):
+        with self._condition:
+            sequence = self._sent + len(self._queue)
+            lag = monotonic() - self._queue[0][3] if self._queue else 0.0
+        self._connection.sendall(code + HEARTBEAT.pack(lag, sequence))
+
+
+class ReplicaClient(threading.Thread):
+    """A background thread replicating a primary cache into a local cache
+
+    It connects to the ReplicationServer of the primary, applies its
+    snapshot then its changes to the cache, and reconnects after a
+    disconnection, starting again from a new snapshot. The entries keep the
+    absolute expiry times of the primary, so both must have synchronized
+    clocks.
+
+    Methods:
+        status():
+            returns the connection state and the lag of the replica
+        stop():
+            stops the thread
+    """
+    def __init__(self, cache, host, port, reconnect_delay=1):
+        """
+        Parameters:
+            cache : Cache or ConcurrentCache
+                The replica cache
+            host, port : str, int
+                The address of the ReplicationServer of the primary
+            reconnect_delay : float
+                The number of seconds between two connection attempts
+        """
+        super().__init__(name='cache-replica-client', daemon=True)
+        self._cache = cache
+        self._address = (host, port)
+        self._reconnect_delay = reconnect_delay
+        self._stopped = threading.Event()
+        self._socket = None
+        self.connected = False
+        self.synced = False
+        self.applied = 0
+        self._heartbeat_time = None
+        self.lag_operations = None
+        self.lag_seconds = None
+
+    def status(self):
+        """Returns the state of the replica, as of its last heartbeat.
+        lag_operations is the number of operations queued by the primary
+        that the replica had not applied yet, and lag_seconds the age of
+        the oldest of them, both measured on the primary alone so the clocks
+        of the primary and the replica are never compared
+        """
+        return {
+            'role': 'replica',
+            'primary': f'{self._address[0]}:{self._address[1]}',
+            'connected': self.connected,
+            'synced': self.synced,
+            'applied': self.applied,
+            'lag_operations': self.lag_operations,
+            'lag_seconds': self.lag_seconds,
+            'last_heartbeat_seconds_ago': (
+                None if self._heartbeat_time is None else monotonic() - self._heartbeat_time
+            ),
+        }
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with socket.create_connection(self._address, timeout=10) as connection:
+                    connection.settimeout(None)
+                    self._socket = connection
+                    self.connected = True
+                    self._replicate(connection.makefile('rb'))
+            except OSError as error:
+                if not self._stopped.is_set():
+                    logger.info('replication from %s:%s stopped: %s', *self._address, error)
+            finally:
+                self.connected = False
+                self.synced = False
+            self._stopped.wait(self._reconnect_delay)
+
+    def stop(self):
+        self._stopped.set()
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.is_alive():
+            self.join()
+
+    # A private method applying the frames of a stream until it is closed
+    def _replicate(self, stream):
+        cache = self._cache
+        # the entries of an earlier connection may have been deleted since
+        stale_keys = {key for key, _ in cache.items()}
+        if read_exactly(stream, len(STREAM_MAGIC)) != STREAM_MAGIC:
+            raise ConnectionError('the primary streams another version of the replication')
+        # the number of frames applied from this connection
+        applied = 0
+        while True:
+            code = stream.read(1)
+            if not code:
+                raise ConnectionError('the primary closed the connection')
+            if code in (b'H', b'E'):
+                lag, sequence = HEARTBEAT.unpack(read_exactly(stream, HEARTBEAT.size))
+                self._heartbeat_time = monotonic()
+                self.lag_operations = sequence - applied
+                self.lag_seconds = lag
+                if code == b'E':
+                    cache.delete_entries(list(stale_keys))
+                    stale_keys = set()
+                    self.synced = True
+                continue
+            if code == b'T':
+                key_length, expires_at = DEADLINE.unpack(read_exactly(stream, DEADLINE.size))
+                key = read_exactly(stream, key_length).decode('utf-8')
+                if not expires_at or expires_at > time():
+                    cache.expire(key, expires_at=monotonic_clock(expires_at))
+                else:
+                    cache.delete_entry(key)
+                applied += 1
+                self.applied += 1
+                continue
+            key_length, value_length, tags_length, expires_at, delta = RECORD.unpack(
+                read_exactly(stream, RECORD.size)
+            )
+            key = read_exactly(stream, key_length).decode('utf-8')
+            value = read_exactly(stream, value_length)
+            tags = decode_tags(read_exactly(stream, tags_length))
+            if code == b'S':
+                stale_keys.discard(key)
+                if not expires_at or expires_at > time():
+                    cache.set_entry(
+                        key, value, expires_at=monotonic_clock(expires_at), delta=delta, tags=tags
+                    )
+            elif code == b'D':
+                cache.delete_entry(key)
+            else:
+                raise ConnectionError(f'unexpected frame {code!r}')
+            applied += 1
+            self.applied += 1
+
+
+def read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError('the primary closed the connection')
+    return data
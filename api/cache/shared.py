@@ -0,0 +1,543 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from hashlib import blake2b
+from math import inf
+from time import monotonic
+from .main import STATS, EvictionStrategies, CacheEntry, PreconditionFailed, restored_entry, etag_matches
+from .sweeper import ExpirySweeper
+
+# The file starts with a header followed by the free lists of the slab
+# classes, the hash table and the arena holding the keys and values
+MAGIC = b'IMCSHM01'
+HEADER = struct.Struct('<8sQQQQQQQQQd')
+(
+    TABLE_SLOTS, MAX_SLOTS, ARENA_SIZE, COUNT, TOMBSTONES,
+    USED_BYTES, ARENA_TOP, SEQUENCE, CURSOR, MIN_DEADLINE
+) = range(8, 88, 8)
+U64 = struct.Struct('<Q')
+F64 = struct.Struct('<d')
+SLAB_CLASSES = 40
+FREE_LISTS = HEADER.size
+TABLE = 512
+
+# A slot of the hash table: key hash, chunk offset, expiry deadline and
+# creation sequence number. Offsets 0 and 1 mark empty and deleted slots
+SLOT = struct.Struct('<QQdQ')
+EMPTY = 0
+TOMBSTONE = 1
+
+# A chunk of the arena: slab class, key length, value length and ttl,
+# followed by the key and the value. A free chunk stores the offset of
+# the next free chunk of its class at NEXT_FREE
+CHUNK = struct.Struct('<BxxxIII')
+NEXT_FREE = 8
+MIN_CHUNK_SIZE = 64
+
+class SharedMemoryCache:
+    """A class used to represent a cache shared by many processes
+
+    The whole dataset lives in a memory-mapped file, ideally on a tmpfs
+    like /dev/shm, so the pre-forked gunicorn workers that open the same
+    path read and write the same entries. The file holds a fixed-size open
+    addressing hash table (linear probing) and a slab arena: values are
+    stored in chunks whose size is a power of 2, and freed chunks are kept
+    in a free list per size. Every operation holds an exclusive flock on
+    the file. Deadlines come from the monotonic clock, which is shared by
+    all the processes of the host.
+
+    When the cache is full, all the expired entries are reclaimed first.
+    If there is still no room, OLDEST_FIRST and NEWEST_FIRST evict the
+    oldest or newest entry, taken among the entries of the same chunk size
+    when the arena is the limit. Both need a scan of the table, so a full
+    cache is slower than with Cache. The earliest deadline is kept in the
+    header so the scan is skipped when no entry can have expired. Other
+    eviction strategies are not supported.
+
+    It has the same methods and attributes as Cache. get_entry returns a
+    CacheEntry holding a copy of the cached bytes. Expired entries are never
+    returned, stale_grace is always 0, and the compute time (delta) of the
+    entries is not stored. The counters of stats are those of the operations
+    of the current process, and the values are never compressed. The keys
+    are not indexed: delete_prefix and scan read the whole table, and tags
+    are not supported. Neither is sliding expiration, but touch and expire
+    are.
+    """
+    stale_grace = 0
+
+    def __init__(
+        self,
+        path,
+        max_slots = 10000,
+        default_ttl = 3600,
+        eviction_strategy = EvictionStrategies.REJECT,
+        max_bytes = 64 * 1024 * 1024
+    ):
+        """
+        Parameters:
+            path : str
+                The path of the file holding the cache. It is created and
+                initialized by the first process opening it
+            max_slots, default_ttl, eviction_strategy:
+                See Cache. eviction_strategy must be one of REJECT,
+                OLDEST_FIRST or NEWEST_FIRST
+            max_bytes : integer
+                The size of the arena holding the keys and values
+        """
+        if eviction_strategy not in (
+            EvictionStrategies.REJECT,
+            EvictionStrategies.OLDEST_FIRST,
+            EvictionStrategies.NEWEST_FIRST
+        ):
+            raise ValueError(f'{eviction_strategy.value} is not supported by SharedMemoryCache')
+        self._path = path
+        self._eviction_strategy = eviction_strategy
+        self._default_ttl = default_ttl if default_ttl > 0 else 3600
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._sweeper = None
+        self._stats = dict.fromkeys(STATS, 0)
+        self._open(
+            max_slots if max_slots > 0 else 10000,
+            max_bytes if max_bytes > 0 else 64 * 1024 * 1024
+        )
+
+    def _open(self, max_slots, max_bytes):
+        self._pid = os.getpid()
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                table_slots = 8
+                while table_slots < 2 * max_slots:
+                    table_slots <<= 1
+                arena = TABLE + table_slots * SLOT.size
+                os.ftruncate(self._fd, arena + max_bytes)
+                self._mm = mmap.mmap(self._fd, arena + max_bytes)
+                HEADER.pack_into(
+                    self._mm, 0, MAGIC, table_slots, max_slots, max_bytes,
+                    0, 0, 0, arena, 0, 0, inf
+                )
+            else:
+                self._mm = mmap.mmap(self._fd, 0)
+                if self._mm[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f'{self._path} is not a cache file')
+                if self._get(MAX_SLOTS) != max_slots or self._get(ARENA_SIZE) != max_bytes:
+                    raise ValueError(f'{self._path} was created with a different capacity')
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._table_slots = self._get(TABLE_SLOTS)
+        self._arena = TABLE + self._table_slots * SLOT.size
+        self._arena_end = self._arena + self._get(ARENA_SIZE)
+
+    def close(self):
+        """Stops the sweeper and unmaps the file"""
+        self.stop_sweeper()
+        self._mm.close()
+        os.close(self._fd)
+
+    # A reentrant lock shared by the threads and the processes
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                # a flock is shared by the processes sharing a file
+                # description, so a forked process opens the file again
+                if self._pid != os.getpid():
+                    os.close(self._fd)
+                    self._pid = os.getpid()
+                    self._fd = os.open(self._path, os.O_RDWR)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return self._get(COUNT)
+
+    @property
+    def max_slots(self):
+        return self._get(MAX_SLOTS)
+
+    @property
+    def max_bytes(self):
+        return self._get(ARENA_SIZE)
+
+    @property
+    def used_bytes(self):
+        return self._get(USED_BYTES)
+
+    @property
+    def stats(self):
+        with self._thread_lock:
+            return dict(self._stats)
+
+    @property
+    def compression_stats(self):
+        return {'compressed': 0, 'uncompressed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    @property
+    def default_ttl(self):
+        return self._default_ttl
+
+    def get_entry(self, key, allow_stale=False):
+        key_bytes = key.encode('utf-8')
+        with self._locked():
+            index, _ = self._lookup(key_bytes, key_hash(key_bytes))
+            if index is None:
+                self._stats['misses'] += 1
+                return None
+            _, offset, expires_at, _ = SLOT.unpack_from(self._mm, TABLE + index * SLOT.size)
+            if monotonic() > expires_at:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            _, key_length, value_length, ttl = CHUNK.unpack_from(self._mm, offset)
+            start = offset + CHUNK.size + key_length
+            value = self._mm[start:start + value_length]
+        entry = CacheEntry(value, ttl)
+        entry.expires_at = expires_at
+        return entry
+
+    def set_entry(self, key, json_str, ttl=None, expires_at=None, if_match=None, delta=0.0, tags=()):
+        if tags:
+            raise NotImplementedError('SharedMemoryCache does not support tags')
+        key_bytes = key.encode('utf-8')
+        value = json_str if isinstance(json_str, bytes) else json_str.encode('utf-8')
+        if expires_at is None:
+            ttl = int(ttl or self._default_ttl)
+            expires_at = monotonic() + ttl if ttl else inf
+        else:
+            ttl = restored_entry(b'', expires_at).ttl
+        slab_class = chunk_class(CHUNK.size + len(key_bytes) + len(value))
+        if MIN_CHUNK_SIZE << slab_class > self._get(ARENA_SIZE):
+            with self._thread_lock:
+                self._stats['rejections'] += 1
+            return False
+        h = key_hash(key_bytes)
+
+        with self._locked():
+            if if_match is not None and not etag_matches(self.get_entry(key), if_match):
+                raise PreconditionFailed(key)
+            # If entry already exists, it is replaced by a new entry
+            index, _ = self._lookup(key_bytes, h)
+            if index is not None:
+                self._delete_slot(index)
+            offset = self._make_room(slab_class)
+            if offset is None:
+                self._stats['rejections'] += 1
+                return False
+
+            _, free_index = self._lookup(key_bytes, h)
+            slot_offset = TABLE + free_index * SLOT.size
+            if U64.unpack_from(self._mm, slot_offset + 8)[0] == TOMBSTONE:
+                self._add(TOMBSTONES, -1)
+            CHUNK.pack_into(self._mm, offset, slab_class, len(key_bytes), len(value), ttl)
+            start = offset + CHUNK.size
+            self._mm[start:start + len(key_bytes)] = key_bytes
+            self._mm[start + len(key_bytes):start + len(key_bytes) + len(value)] = value
+            sequence = self._get(SEQUENCE)
+            SLOT.pack_into(self._mm, slot_offset, h, offset, expires_at, sequence)
+            if expires_at < F64.unpack_from(self._mm, MIN_DEADLINE)[0]:
+                F64.pack_into(self._mm, MIN_DEADLINE, expires_at)
+            self._set(SEQUENCE, sequence + 1)
+            self._add(COUNT, 1)
+            self._add(USED_BYTES, MIN_CHUNK_SIZE << slab_class)
+            self._stats['sets'] += 1
+
+            if self._get(COUNT) + self._get(TOMBSTONES) > self._table_slots * 3 // 4:
+                self._rehash()
+        return True
+
+    def delete_entry(self, key):
+        key_bytes = key.encode('utf-8')
+        with self._locked():
+            index, _ = self._lookup(key_bytes, key_hash(key_bytes))
+            if index is None:
+                return False
+            expires_at = SLOT.unpack_from(self._mm, TABLE + index * SLOT.size)[2]
+            self._delete_slot(index)
+            deleted = monotonic() <= expires_at
+            if deleted:
+                self._stats['deletes'] += 1
+        return deleted
+
+    def items(self, batch_size=1000):
+        """Returns the (key, entry) pairs of the entries that are not
+        expired. The table is read in batches of slots so the lock is not
+        held for long, so entries changed meanwhile may be missed
+        """
+        pairs = []
+        for start in range(0, self._table_slots, batch_size):
+            with self._locked():
+                now = monotonic()
+                for index in range(start, min(start + batch_size, self._table_slots)):
+                    _, offset, expires_at, _ = SLOT.unpack_from(self._mm, TABLE + index * SLOT.size)
+                    if offset <= TOMBSTONE or now > expires_at:
+                        continue
+                    _, key_length, value_length, ttl = CHUNK.unpack_from(self._mm, offset)
+                    start_key = offset + CHUNK.size
+                    key = self._mm[start_key:start_key + key_length].decode('utf-8')
+                    entry = CacheEntry(self._mm[start_key + key_length:start_key + key_length + value_length], ttl)
+                    entry.expires_at = expires_at
+                    pairs.append((key, entry))
+        return pairs
+
+    def get_ttl(self, key):
+        key_bytes = key.encode('utf-8')
+        with self._locked():
+            index, _ = self._lookup(key_bytes, key_hash(key_bytes))
+            if index is None:
+                return None
+            expires_at = SLOT.unpack_from(self._mm, TABLE + index * SLOT.size)[2]
+        remaining = expires_at - monotonic()
+        return remaining if remaining >= 0 else None
+
+    def touch(self, key):
+        return self._retime(key, None)
+
+    def expire(self, key, ttl=None, expires_at=None):
+        if expires_at is not None:
+            return self._retime(key, expires_at=expires_at)
+        return self._retime(key, max(0, int(ttl or 0)))
+
+    def get_entries(self, keys):
+        with self._locked():
+            return {key: self.get_entry(key) for key in keys}
+
+    def set_entries(self, entries, ttl=None, tags=()):
+        with self._locked():
+            return {key: self.set_entry(key, json_str, ttl, tags=tags) for key, json_str in entries.items()}
+
+    def delete_entries(self, keys):
+        with self._locked():
+            return {key: self.delete_entry(key) for key in keys}
+
+    def delete_tag(self, tag):
+        raise NotImplementedError('SharedMemoryCache does not support tags')
+
+    def delete_prefix(self, prefix):
+        keys = [key for key, _ in self.items() if key.startswith(prefix)]
+        return sum(self.delete_entries(keys).values())
+
+    def scan(self, prefix='', after=None, count=100):
+        pairs = sorted(
+            (pair for pair in self.items()
+             if pair[0].startswith(prefix) and (after is None or pair[0] > after)),
+            key=lambda pair: pair[0]
+        )
+        return pairs[:count]
+
+    def reclaim_expired(self, max_entries):
+        """Removes up to max_entries expired entries. The table is scanned
+        from where the previous call stopped, looking at a bounded number
+        of slots so the lock is not held for long
+        """
+        reclaimed = 0
+        now = monotonic()
+        with self._locked():
+            if now <= F64.unpack_from(self._mm, MIN_DEADLINE)[0]:
+                return 0
+            index = self._get(CURSOR)
+            for _ in range(min(self._table_slots, max(64, 16 * max_entries))):
+                if reclaimed >= max_entries:
+                    break
+                _, offset, expires_at, _ = SLOT.unpack_from(self._mm, TABLE + index * SLOT.size)
+                if offset > TOMBSTONE and now > expires_at:
+                    self._delete_slot(index)
+                    reclaimed += 1
+                index = (index + 1) % self._table_slots
+            self._set(CURSOR, index)
+            self._stats['expired'] += reclaimed
+        return reclaimed
+
+    def add_observer(self, observer):
+        """Observers are not supported: a process does not see the changes
+        made by the other processes sharing the cache
+        """
+        raise NotImplementedError('SharedMemoryCache does not support observers')
+
+    def remove_observer(self, observer):
+        pass
+
+    def start_sweeper(self, interval, samples=20, budget_ms=5):
+        self.stop_sweeper()
+        self._sweeper = ExpirySweeper(self, interval, samples, budget_ms)
+        self._sweeper.start()
+        return self._sweeper
+
+    def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.stop()
+            self._sweeper = None
+
+    # Private helpers, called with the lock held
+
+    def _get(self, field):
+        return U64.unpack_from(self._mm, field)[0]
+
+    def _set(self, field, value):
+        U64.pack_into(self._mm, field, value)
+
+    def _add(self, field, value):
+        self._set(field, self._get(field) + value)
+
+    # Returns the index of the slot of key or None, and the index of the
+    # first free slot of its probe sequence when the key is not found
+    def _lookup(self, key_bytes, h):
+        mask = self._table_slots - 1
+        index = h & mask
+        first_free = None
+        for _ in range(self._table_slots):
+            slot_h, offset, _, _ = SLOT.unpack_from(self._mm, TABLE + index * SLOT.size)
+            if offset == EMPTY:
+                return None, index if first_free is None else first_free
+            if offset == TOMBSTONE:
+                if first_free is None:
+                    first_free = index
+            elif slot_h == h:
+                key_length = CHUNK.unpack_from(self._mm, offset)[1]
+                start = offset + CHUNK.size
+                if self._mm[start:start + key_length] == key_bytes:
+                    return index, None
+            index = (index + 1) & mask
+        return None, first_free
+
+    # Sets the deadline of the entry of key to expires_at, or else to ttl
+    # seconds from now, or its own ttl if ttl is None. Returns False if the
+    # key is missing or expired
+    def _retime(self, key, ttl=None, expires_at=None):
+        key_bytes = key.encode('utf-8')
+        h = key_hash(key_bytes)
+        with self._locked():
+            index, _ = self._lookup(key_bytes, h)
+            if index is None:
+                return False
+            slot_offset = TABLE + index * SLOT.size
+            _, offset, old_expires_at, sequence = SLOT.unpack_from(self._mm, slot_offset)
+            now = monotonic()
+            if now > old_expires_at:
+                return False
+            slab_class, key_length, value_length, entry_ttl = CHUNK.unpack_from(self._mm, offset)
+            if expires_at is None:
+                ttl = entry_ttl if ttl is None else ttl
+                expires_at = now + ttl if ttl else inf
+            else:
+                ttl = restored_entry(b'', expires_at).ttl
+            CHUNK.pack_into(self._mm, offset, slab_class, key_length, value_length, ttl)
+            SLOT.pack_into(self._mm, slot_offset, h, offset, expires_at, sequence)
+            if expires_at < F64.unpack_from(self._mm, MIN_DEADLINE)[0]:
+                F64.pack_into(self._mm, MIN_DEADLINE, expires_at)
+        return True
+
+    def _delete_slot(self, index):
+        slot_offset = TABLE + index * SLOT.size
+        offset = U64.unpack_from(self._mm, slot_offset + 8)[0]
+        U64.pack_into(self._mm, slot_offset + 8, TOMBSTONE)
+        self._free(offset)
+        self._add(COUNT, -1)
+        self._add(TOMBSTONES, 1)
+
+    def _alloc(self, slab_class):
+        head = FREE_LISTS + slab_class * 8
+        offset = U64.unpack_from(self._mm, head)[0]
+        if offset:
+            U64.pack_into(self._mm, head, U64.unpack_from(self._mm, offset + NEXT_FREE)[0])
+            return offset
+        top = self._get(ARENA_TOP)
+        if top + (MIN_CHUNK_SIZE << slab_class) > self._arena_end:
+            return None
+        self._set(ARENA_TOP, top + (MIN_CHUNK_SIZE << slab_class))
+        return top
+
+    def _free(self, offset):
+        slab_class = self._mm[offset]
+        head = FREE_LISTS + slab_class * 8
+        U64.pack_into(self._mm, offset + NEXT_FREE, U64.unpack_from(self._mm, head)[0])
+        U64.pack_into(self._mm, head, offset)
+        self._add(USED_BYTES, -(MIN_CHUNK_SIZE << slab_class))
+
+    # Returns the offset of a free chunk of slab_class once a slot is
+    # available, evicting entries if needed, or None
+    def _make_room(self, slab_class):
+        while True:
+            if self._get(COUNT) < self._get(MAX_SLOTS):
+                offset = self._alloc(slab_class)
+                if offset is not None:
+                    return offset
+                arena_full = True
+            else:
+                arena_full = False
+
+            reject = self._eviction_strategy == EvictionStrategies.REJECT
+            if reject and monotonic() <= F64.unpack_from(self._mm, MIN_DEADLINE)[0]:
+                return None
+            reclaimed, victim = self._scan(slab_class if arena_full else None)
+            if reclaimed:
+                continue
+            if reject or victim is None:
+                return None
+            self._delete_slot(victim)
+            self._stats['evictions'] += 1
+
+    # Reclaims all the expired entries in one pass over the table, which
+    # also updates the earliest deadline and finds the oldest or newest
+    # live entry, among the entries of slab_class if it is not None.
+    # Returns the number of reclaimed entries and the index of that entry
+    def _scan(self, slab_class):
+        oldest = self._eviction_strategy == EvictionStrategies.OLDEST_FIRST
+        now = monotonic()
+        expired = []
+        min_deadline = inf
+        victim, victim_sequence = None, None
+        with memoryview(self._mm) as view:
+            slots = SLOT.iter_unpack(view[TABLE:self._arena])
+            for index, (_, offset, expires_at, sequence) in enumerate(slots):
+                if offset <= TOMBSTONE:
+                    continue
+                if now > expires_at:
+                    expired.append(index)
+                    continue
+                if expires_at < min_deadline:
+                    min_deadline = expires_at
+                if slab_class is not None and self._mm[offset] != slab_class:
+                    continue
+                if victim is None or (sequence < victim_sequence if oldest else sequence > victim_sequence):
+                    victim, victim_sequence = index, sequence
+            del slots
+        self._stats['expired'] += len(expired)
+        for index in expired:
+            self._delete_slot(index)
+        F64.pack_into(self._mm, MIN_DEADLINE, min_deadline)
+        return len(expired), victim
+
+    # Rebuilds the table without the deleted slots
+    def _rehash(self):
+        mask = self._table_slots - 1
+        with memoryview(self._mm) as view:
+            slots = [slot for slot in SLOT.iter_unpack(view[TABLE:self._arena]) if slot[1] > TOMBSTONE]
+        self._mm[TABLE:self._arena] = bytes(self._arena - TABLE)
+        for slot in slots:
+            index = slot[0] & mask
+            while U64.unpack_from(self._mm, TABLE + index * SLOT.size + 8)[0] != EMPTY:
+                index = (index + 1) & mask
+            SLOT.pack_into(self._mm, TABLE + index * SLOT.size, *slot)
+        self._set(TOMBSTONES, 0)
+
+"""Returns a hash of the key which is the same in every process"""
+def key_hash(key_bytes):
+    return int.from_bytes(blake2b(key_bytes, digest_size=8).digest(), 'little')
+
+"""Returns the slab class of a chunk of size bytes"""
+def chunk_class(size):
+    slab_class = 0
+    while MIN_CHUNK_SIZE << slab_class < size:
+        slab_class += 1
+    return slab_class
@@ -0,0 +1,73 @@
+import logging
+import threading
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+class ExpirySweeper(threading.Thread):
+    """A background thread that reclaims the memory of expired cache entries
+
+    Every interval seconds it runs a sweep made of short cycles. A cycle
+    removes at most `samples` expired entries while holding the cache lock,
+    so requests are never blocked for long. Like the active expiry of Redis,
+    another cycle follows as long as the previous one was full, which means
+    more expired entries are likely waiting, and the time budget of the
+    sweep is not exhausted.
+
+    Attributes:
+        last_reclaimed: int
+            the number of entries reclaimed by the last sweep
+        total_reclaimed: int
+            the number of entries reclaimed since the sweeper started
+
+    Methods:
+        sweep():
+            runs one sweep and returns the number of reclaimed entries
+        stop():
+            stops the thread and waits for it to finish
+    """
+    def __init__(self, cache, interval, samples=20, budget_ms=5):
+        """
+        Parameters:
+            cache : Cache
+                The cache to sweep
+            interval : float
+                The number of seconds between two sweeps
+            samples : int
+                The max number of entries reclaimed per cycle
+            budget_ms : float
+                The time budget of a sweep in milliseconds
+        """
+        super().__init__(name='cache-expiry-sweeper', daemon=True)
+        self._cache = cache
+        self._interval = interval
+        self._samples = max(int(samples), 1)
+        self._budget = budget_ms / 1000
+        self._stopped = threading.Event()
+        self.last_reclaimed = 0
+        self.total_reclaimed = 0
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.sweep()
+
+    def sweep(self):
+        """Runs one sweep and returns the number of reclaimed entries"""
+        start = perf_counter()
+        reclaimed = 0
+        while True:
+            cycle_reclaimed = self._cache.reclaim_expired(self._samples)
+            reclaimed += cycle_reclaimed
+            if cycle_reclaimed < self._samples or perf_counter() - start > self._budget:
+                break
+        self.last_reclaimed = reclaimed
+        self.total_reclaimed += reclaimed
+        if reclaimed:
+            logger.debug('expiry sweep reclaimed %d entries', reclaimed)
+        return reclaimed
+
+    def stop(self):
+        """Stops the thread and waits for it to finish"""
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
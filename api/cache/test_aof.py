@@ -0,0 +1,159 @@
+import json
+import os
+from math import inf
+from time import sleep
+from .main import EvictionStrategies, Cache
+from .concurrent import ConcurrentCache
+from .aof import LOG_MAGIC, LOG_MAGIC_V1, OperationLog, replay_log
+from .persistence import RECORD_V1
+
+def test_log_replay(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    log = OperationLog(cache, path, fsync_interval=0)
+    log.start()
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=30)
+    cache.set_entry('key_b', b'[1, 2]')
+    cache.set_entry('key_b', b'[3]')
+    cache.set_entry('key_c', b'{}')
+    cache.delete_entry('key_c')
+    log.stop()
+
+    restored = ConcurrentCache(10, 60, EvictionStrategies.REJECT, segments=2)
+    assert replay_log(restored, path) == 5
+    assert len(restored) == 2
+    assert restored.get_entry('key_a').json_str == json.dumps({"data": "key_a"}).encode()
+    assert restored.get_entry('key_b').json_str == b'[3]'
+    assert abs(restored.get_ttl('key_a') - cache.get_ttl('key_a')) < 0.1
+
+def test_log_records_deadline_changes(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT, sliding_expiration=True)
+    log = OperationLog(cache, path, fsync_interval=0)
+    log.start()
+    cache.set_entry('key_a', b'x' * 1000, ttl=30, tags=('tag',))
+    cache.set_entry('key_b', b'1', ttl=30)
+    log.flush()
+    size = os.path.getsize(path)
+    cache.expire('key_a', 100)
+    cache.expire('key_b', 0)
+    log.stop()
+    # the value is not written again
+    assert os.path.getsize(path) - size < 100
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert replay_log(restored, path) == 4
+    assert abs(restored.get_ttl('key_a') - cache.get_ttl('key_a')) < 0.1
+    assert restored.get_ttl('key_b') == inf
+    assert restored.get_entry('key_a').tags == ('tag',)
+
+def test_log_keeps_tags_and_delta(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    log = OperationLog(cache, path, fsync_interval=0)
+    log.start()
+    cache.set_entry('key_a', b'1', delta=0.25, tags=('tenant_1',))
+    log.stop()
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    replay_log(restored, path)
+    assert restored.get_entry('key_a').tags == ('tenant_1',)
+    assert restored.get_entry('key_a').delta == 0.25
+
+def test_log_of_version_1_is_rewritten(tmp_path):
+    path = tmp_path / 'aof'
+    path.write_bytes(LOG_MAGIC_V1 + b'S' + RECORD_V1.pack(5, 1, 0.0) + b'key_a1')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    assert replay_log(cache, str(path)) == 1
+    log = OperationLog(cache, str(path), fsync_interval=0)
+    log.start()
+    cache.set_entry('key_b', b'2', tags=('tenant_1',))
+    log.stop()
+    assert path.read_bytes()[:len(LOG_MAGIC)] == LOG_MAGIC
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert replay_log(restored, str(path)) == 2
+    assert restored.get_entry('key_a').json_str == b'1'
+    assert restored.get_entry('key_b').tags == ('tenant_1',)
+
+def test_log_records_evictions(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(2, 60, EvictionStrategies.OLDEST_FIRST)
+    log = OperationLog(cache, path, fsync_interval=0)
+    log.start()
+    for key in ('key_a', 'key_b', 'key_c'):
+        cache.set_entry(key, b'1')
+    log.flush()
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    replay_log(restored, path)
+    assert sorted(key for key, _ in restored.items()) == ['key_b', 'key_c']
+    log.stop()
+
+def test_log_starts_with_the_entries_of_the_cache(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    cache.set_entry('key_a', b'1')
+    log = OperationLog(cache, path)
+    log.start()
+    log.stop()
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert replay_log(restored, path) == 1
+    assert restored.get_entry('key_a').json_str == b'1'
+
+def test_log_skips_expired_entries(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    log = OperationLog(cache, path, fsync_interval=0)
+    log.start()
+    cache.set_entry('key_a', b'1', ttl=1)
+    cache.set_entry('key_b', b'2', ttl=30)
+    log.stop()
+    sleep(1.1)
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    replay_log(restored, path)
+    assert restored.get_entry('key_a') is None
+    assert restored.get_entry('key_b').json_str == b'2'
+
+def test_replay_truncates_incomplete_operation(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    log = OperationLog(cache, path, fsync_interval=0)
+    log.start()
+    cache.set_entry('key_a', b'1')
+    cache.set_entry('key_b', b'2')
+    log.stop()
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as file:
+        file.truncate(size - 1)
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert replay_log(restored, path) == 1
+    assert restored.get_entry('key_b') is None
+    # the log can be appended again
+    log = OperationLog(restored, path, fsync_interval=0)
+    log.start()
+    restored.set_entry('key_c', b'3')
+    log.stop()
+    assert replay_log(Cache(10, 60, EvictionStrategies.REJECT), path) == 2
+
+def test_log_compaction(tmp_path):
+    path = str(tmp_path / 'aof')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    log = OperationLog(cache, path, fsync_interval=0, compact_min_size=1024)
+    log.start()
+    for i in range(500):
+        cache.set_entry('key_a', json.dumps({"value": i}))
+        if i % 50 == 0:
+            log.flush()
+    log.stop()
+    assert os.path.getsize(path) < 3072
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    replay_log(restored, path)
+    assert len(restored) == 1
+    assert restored.get_entry('key_a').json_str == json.dumps({"value": 499}).encode()
+    with open(path, 'rb') as file:
+        assert file.read(len(LOG_MAGIC)) == LOG_MAGIC
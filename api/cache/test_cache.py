@@ -1,6 +1,12 @@
+import gc
 import json
+import tracemalloc
+import pytest
+from hashlib import blake2b
+from math import inf
 from time import sleep
-from .main import EvictionStrategies, Cache
+from .main import EvictionStrategies, Cache, PreconditionFailed
+from .policies import CountMinSketch
 
 def test_contructor():
     cache = Cache(2, 5, EvictionStrategies.REJECT);
@@ -94,4 +100,381 @@ def test_oldest_first_policy():
     rv = cache.get_entry('key_c')
     assert rv.json_str == json.dumps({"data": "key_c"})
     rv = cache.get_entry('key_a')
-    assert rv == None
\ No newline at end of file
+    assert rv == None
+
+def test_oldest_first_policy_after_update():
+    cache = Cache(2, 5, EvictionStrategies.OLDEST_FIRST);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=0)
+    # updating key_a makes key_b the oldest entry
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=0)
+
+    rv = cache.get_entry('key_a')
+    assert rv.json_str == json.dumps({"data": "key_a"})
+    rv = cache.get_entry('key_b')
+    assert rv == None
+
+def test_reject_policy_reclaims_expired_entry():
+    cache = Cache(2, 5, EvictionStrategies.REJECT);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=1)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=5)
+    sleep(1.1)
+    rv = cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=5)
+    assert rv == True
+    assert cache.get_entry('key_b').json_str == json.dumps({"data": "key_b"})
+
+def test_newest_first_policy_prefers_expired_entry():
+    cache = Cache(2, 5, EvictionStrategies.NEWEST_FIRST);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=1)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=5)
+    sleep(1.1)
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=5)
+    assert cache.get_entry('key_b').json_str == json.dumps({"data": "key_b"})
+    assert cache.get_entry('key_c').json_str == json.dumps({"data": "key_c"})
+
+def test_reclaim_expired():
+    cache = Cache(10, 5, EvictionStrategies.REJECT);
+    for key in ('key_a', 'key_b', 'key_c'):
+        cache.set_entry(key, json.dumps({"data": key}), ttl=1)
+    cache.set_entry('key_d', json.dumps({"data": "key_d"}), ttl=5)
+    sleep(1.1)
+    assert cache.reclaim_expired(2) == 2
+    assert cache.reclaim_expired(2) == 1
+    assert cache.reclaim_expired(2) == 0
+    assert cache.get_entry('key_d').json_str == json.dumps({"data": "key_d"})
+
+def test_sweeper():
+    cache = Cache(10, 5, EvictionStrategies.REJECT);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=1)
+    sweeper = cache.start_sweeper(0.1, samples=1)
+    sleep(1.5)
+    cache.stop_sweeper()
+    assert sweeper.total_reclaimed == 1
+    assert cache.delete_entry('key_a') == False
+
+def test_lru_policy():
+    cache = Cache(2, 5, EvictionStrategies.LRU);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=0)
+    # reading key_a makes key_b the least recently used entry
+    cache.get_entry('key_a')
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=0)
+
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "key_a"})
+    assert cache.get_entry('key_b') == None
+
+def test_lfu_policy():
+    cache = Cache(2, 5, EvictionStrategies.LFU);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=0)
+    cache.get_entry('key_a')
+    cache.get_entry('key_a')
+    cache.get_entry('key_b')
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=0)
+
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "key_a"})
+    assert cache.get_entry('key_b') == None
+    # key_c has the lowest frequency now
+    cache.set_entry('key_d', json.dumps({"data": "key_d"}), ttl=0)
+    assert cache.get_entry('key_c') == None
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "key_a"})
+
+def test_lfu_policy_after_delete():
+    cache = Cache(2, 5, EvictionStrategies.LFU);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=0)
+    cache.get_entry('key_b')
+    cache.delete_entry('key_a')
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=0)
+    cache.get_entry('key_c')
+    cache.get_entry('key_c')
+    cache.set_entry('key_d', json.dumps({"data": "key_d"}), ttl=0)
+
+    assert cache.get_entry('key_b') == None
+    assert cache.get_entry('key_c').json_str == json.dumps({"data": "key_c"})
+
+def test_w_tinylfu_policy_keeps_hot_entries():
+    cache = Cache(100, 5, EvictionStrategies.W_TINYLFU);
+    for i in range(100):
+        cache.set_entry(f'hot_{i}', json.dumps({"data": i}), ttl=0)
+    for _ in range(3):
+        for i in range(100):
+            cache.get_entry(f'hot_{i}')
+    # a scan of cold keys must not flush the hot ones
+    for i in range(1000):
+        assert cache.set_entry(f'cold_{i}', json.dumps({"data": i}), ttl=0) == True
+
+    hot_entries = [i for i in range(100) if cache.get_entry(f'hot_{i}')]
+    assert len(hot_entries) >= 90
+
+def test_count_min_sketch_halves_counters():
+    sketch = CountMinSketch(4)
+    for _ in range(7):
+        sketch.increment('key_a')
+    sketch.increment('key_b')
+    assert sketch.estimate('key_a') == 7
+
+    sketch._reset()
+    assert sketch.estimate('key_a') == 3
+    assert sketch.estimate('key_b') == 0
+
+def test_max_bytes():
+    value = json.dumps({"data": "x" * 100})
+    cache = Cache(10, 5, EvictionStrategies.OLDEST_FIRST, max_bytes=1100);
+    assert cache.max_bytes == 1100
+    cache.set_entry('key_a', value, ttl=0)
+    cache.set_entry('key_b', value, ttl=0)
+    assert cache.used_bytes > 0
+    # the third entry does not fit, so the oldest one is evicted
+    cache.set_entry('key_c', value, ttl=0)
+    assert cache.get_entry('key_a') == None
+    assert cache.get_entry('key_b').json_str == value
+    assert cache.used_bytes <= 1100
+
+    cache.delete_entry('key_b')
+    cache.delete_entry('key_c')
+    assert cache.used_bytes == 0
+
+def test_max_bytes_reject_policy():
+    value = json.dumps({"data": "x" * 100})
+    cache = Cache(10, 5, EvictionStrategies.REJECT, max_bytes=1100);
+    assert cache.set_entry('key_a', value, ttl=0) == True
+    assert cache.set_entry('key_b', value, ttl=0) == True
+    assert cache.set_entry('key_c', value, ttl=0) == False
+    # an entry larger than the whole cache is always rejected
+    assert cache.set_entry('key_d', json.dumps({"data": "x" * 1000})) == False
+
+@pytest.mark.parametrize('strategy', [
+    EvictionStrategies.REJECT, EvictionStrategies.OLDEST_FIRST, EvictionStrategies.LRU
+])
+def test_max_bytes_measured(strategy):
+    # the memory of the full cache, with its keys and values, is within 15%
+    # of max_bytes
+    gc.collect()
+    tracemalloc.start()
+    try:
+        cache = Cache(100000, 60, strategy, max_bytes=1000000)
+        for i in range(10000):
+            cache.set_entry(f'key_{i}', json.dumps({"data": "x" * (i % 200)}).encode())
+        gc.collect()
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert 0.85 < used / cache.max_bytes < 1.15
+
+def test_bulk_operations():
+    cache = Cache(2, 5, EvictionStrategies.REJECT);
+    rv = cache.set_entries({'key_a': '1', 'key_b': '2', 'key_c': '3'})
+    assert rv == {'key_a': True, 'key_b': True, 'key_c': False}
+    rv = cache.get_entries(['key_a', 'key_c'])
+    assert rv['key_a'].json_str == '1' and rv['key_c'] == None
+    assert cache.delete_entries(['key_a', 'key_c']) == {'key_a': True, 'key_c': False}
+
+def test_get_ttl():
+    cache = Cache(3, 5, EvictionStrategies.REJECT);
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=10)
+    assert 9 < cache.get_ttl('key_a') <= 10
+    assert cache.get_ttl('key_b') == None
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=1)
+    sleep(1.1)
+    assert cache.get_ttl('key_c') == None
+
+def test_compression():
+    value = json.dumps({"data": ["hello"] * 1000})
+    cache = Cache(3, 5, EvictionStrategies.REJECT, compression_threshold=100);
+    cache.set_entry('key_a', value)
+    cache.set_entry('key_b', json.dumps({"data": "small"}))
+    entry = cache.get_entry('key_a')
+    assert entry.json_str == value.encode('utf-8')
+    assert len(entry.value) < len(value) // 10
+    assert cache.get_entry('key_b').json_str == json.dumps({"data": "small"})
+    stats = cache.compression_stats
+    assert stats['compressed'] == 1 and stats['bytes_in'] == len(value)
+    assert stats['bytes_in'] > 10 * stats['bytes_out']
+    # values that do not shrink are stored as they are
+    cache.set_entry('key_c', bytes(range(256)))
+    assert cache.get_entry('key_c').value == bytes(range(256))
+    assert cache.compression_stats['uncompressed'] == 1
+
+def test_compression_codecs():
+    value = json.dumps({"data": ["hello"] * 1000})
+    for codec in ('gzip', 'zlib', 'lzma'):
+        cache = Cache(3, 5, EvictionStrategies.REJECT, compression_threshold=100, compression_codec=codec);
+        cache.set_entry('key_a', value)
+        assert cache.get_entry('key_a').json_str == value.encode('utf-8')
+    with pytest.raises(ValueError):
+        Cache(3, 5, EvictionStrategies.REJECT, compression_codec='unknown')
+
+def test_etag_compare_and_set():
+    cache = Cache(3, 5, EvictionStrategies.REJECT);
+    cache.set_entry('key_a', json.dumps({"data": "hello"}))
+    etag = cache.get_entry('key_a').etag
+    assert len(etag) == 16
+    cache.set_entry('key_b', json.dumps({"data": "hello"}))
+    assert cache.get_entry('key_b').etag == etag
+
+    with pytest.raises(PreconditionFailed):
+        cache.set_entry('key_a', json.dumps({"data": "Howdy!"}), if_match={'0' * 16})
+    with pytest.raises(PreconditionFailed):
+        cache.set_entry('key_c', json.dumps({"data": "Howdy!"}), if_match={'*'})
+    assert cache.set_entry('key_a', json.dumps({"data": "Howdy!"}), if_match={etag}) == True
+    assert cache.get_entry('key_a').etag != etag
+    assert cache.set_entry('key_a', json.dumps({"data": "Hey"}), if_match={'*'}) == True
+
+def test_etag_is_the_hex_digest():
+    cache = Cache(300, 5, EvictionStrategies.REJECT);
+    for i in range(256):
+        cache.set_entry(f'key_{i}', json.dumps(i))
+        digest = blake2b(json.dumps(i).encode('utf-8'), digest_size=8).hexdigest()
+        # the leading zeros of the digest are kept
+        assert cache.get_entry(f'key_{i}').etag == digest
+
+def test_ttl_jitter():
+    cache = Cache(100, 5, EvictionStrategies.REJECT, ttl_jitter=0.5);
+    for i in range(100):
+        cache.set_entry(f'key_{i}', '1', ttl=100)
+    remaining = [cache.get_ttl(f'key_{i}') for i in range(100)]
+    assert all(50 <= ttl <= 100 for ttl in remaining)
+    assert max(remaining) - min(remaining) > 10
+
+def test_should_refresh():
+    cache = Cache(3, 5, EvictionStrategies.REJECT);
+    cache.set_entry('key_a', '1', ttl=100)
+    cache.set_entry('key_b', '1', ttl=2, delta=10.0)
+    # an entry far from its expiry, or without compute time, is not refreshed
+    assert not any(cache.get_entry('key_a').should_refresh() for _ in range(100))
+    # an entry expiring soon with a long compute time is refreshed mostly
+    entry = cache.get_entry('key_b')
+    assert entry.delta == 10.0
+    assert sum(entry.should_refresh() for _ in range(100)) > 50
+    assert not any(entry.should_refresh(beta=0) for _ in range(100))
+
+def test_stats():
+    cache = Cache(2, 5, EvictionStrategies.OLDEST_FIRST);
+    cache.set_entry('key_a', '1')
+    cache.set_entry('key_b', '2', ttl=1)
+    cache.get_entry('key_a')
+    cache.get_entry('key_c')
+    cache.set_entry('key_c', '3')
+    cache.delete_entry('key_c')
+    cache.delete_entry('key_c')
+    assert cache.stats == {
+        'hits': 1, 'stale_hits': 0, 'misses': 1, 'sets': 3, 'rejections': 0,
+        'deletes': 1, 'evictions': 1, 'expired': 0
+    }
+    sleep(1.1)
+    assert cache.reclaim_expired(10) == 1
+    assert cache.stats['expired'] == 1
+    reject = Cache(1, 5, EvictionStrategies.REJECT);
+    reject.set_entry('key_a', '1')
+    reject.set_entry('key_b', '2')
+    assert reject.stats['rejections'] == 1
+
+def test_stale_hits():
+    cache = Cache(2, 5, EvictionStrategies.REJECT, stale_grace=5);
+    cache.set_entry('key_a', '1', ttl=1)
+    sleep(1.1)
+    assert cache.get_entry('key_a') == None
+    assert cache.get_entry('key_a', allow_stale=True).json_str == '1'
+    assert cache.stats['hits'] == 0
+    assert cache.stats['stale_hits'] == 1
+    assert cache.stats['misses'] == 1
+
+def test_delete_tag():
+    cache = Cache(10, 60, EvictionStrategies.OLDEST_FIRST)
+    cache.set_entry('key_a', '1', tags=('tenant_1', 'users'))
+    cache.set_entry('key_b', '2', tags=('tenant_1',))
+    cache.set_entry('key_c', '3', tags=('tenant_2',))
+    # an update replaces the tags
+    cache.set_entry('key_b', '2')
+    assert cache.delete_tag('tenant_1') == 1
+    assert sorted(key for key, _ in cache.items()) == ['key_b', 'key_c']
+    assert cache.delete_tag('users') == 0
+    assert cache.delete_tag('missing') == 0
+    # evicted entries leave the index
+    for i in range(10):
+        cache.set_entry(f'key_{i}', '1')
+    assert cache.delete_tag('tenant_2') == 0
+    assert len(cache._tag_index) == 0
+
+@pytest.mark.parametrize('prefix_index', [True, False])
+def test_prefix_scan_and_delete(prefix_index):
+    cache = Cache(100, 60, EvictionStrategies.REJECT, prefix_index=prefix_index)
+    for i in range(25):
+        cache.set_entry(f'tenant_1:{i:02}', str(i))
+    cache.set_entry('tenant_2:00', '0')
+    cache.set_entry('tenant_1:05', '5', ttl=1)
+    cache._container['tenant_1:05'].expires_at -= 2
+
+    pages = []
+    after = None
+    while True:
+        page = cache.scan('tenant_1:', after, count=10)
+        pages.append([key for key, _ in page])
+        if len(page) < 10:
+            break
+        after = page[-1][0]
+    assert [len(page) for page in pages] == [10, 10, 4]
+    assert sum(pages, []) == [f'tenant_1:{i:02}' for i in range(25) if i != 5]
+    assert cache.scan('tenant_3') == []
+
+    assert cache.delete_prefix('tenant_1:') == 24
+    assert [key for key, _ in cache.items()] == ['tenant_2:00']
+
+def test_scan_resumes_in_the_sorted_keys():
+    cache = Cache(100, 60, EvictionStrategies.REJECT)
+    for i in range(0, 20, 2):
+        cache.set_entry(f'key_{i:02}', str(i))
+    page = cache.scan('key_', None, count=4)
+    assert [key for key, _ in page] == ['key_00', 'key_02', 'key_04', 'key_06']
+    # the next pages resume in the keys sorted by the first page: deleted
+    # keys are skipped and keys added meanwhile are not returned
+    cache.delete_entry('key_08')
+    cache.set_entry('key_09', '9')
+    page = cache.scan('key_', 'key_06', count=4)
+    assert [key for key, _ in page] == ['key_10', 'key_12', 'key_14', 'key_16']
+    # a new scan sorts the keys again
+    assert [key for key, _ in cache.scan('key_', None, count=6)][-2:] == ['key_09', 'key_10']
+
+def test_touch_and_expire():
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    observed = []
+    cache.add_observer(lambda operation, key, entry: observed.append((operation, key, entry.ttl)))
+    cache.set_entry('key_a', '1', ttl=1, tags=('tag',))
+    etag = cache.get_entry('key_a').etag
+    assert cache.expire('key_a', 100) == True
+    assert 99 < cache.get_ttl('key_a') <= 100
+    assert cache.expire('key_a', 0) == True
+    assert cache.get_ttl('key_a') == inf
+    assert cache.expire('key_a', 1) == True
+    sleep(0.5)
+    assert cache.touch('key_a') == True
+    assert cache.get_ttl('key_a') > 0.9
+    entry = cache.get_entry('key_a')
+    assert entry.etag == etag and entry.tags == ('tag',) and entry.json_str == '1'
+    # only the deadline changes are notified, the shortened one as an expire
+    assert observed == [
+        ('set', 'key_a', 1), ('extend', 'key_a', 100), ('extend', 'key_a', 0),
+        ('expire', 'key_a', 1), ('extend', 'key_a', 1)
+    ]
+    assert cache.touch('key_b') == False
+    assert cache.expire('key_b', 10) == False
+    sleep(1.1)
+    assert cache.touch('key_a') == False
+    # the old deadlines of the entry are stale records of the expiry index
+    assert cache.reclaim_expired(10) == 1
+    assert len(cache) == 0
+
+def test_sliding_expiration():
+    cache = Cache(10, 60, EvictionStrategies.REJECT, sliding_expiration=True)
+    cache.set_entry('key_a', '1', ttl=1)
+    cache.set_entry('key_b', '1', ttl=1)
+    first = cache.get_entry('key_a')
+    # a read right after the write does not copy the entry
+    assert cache.get_entry('key_a') is first
+    for _ in range(4):
+        sleep(0.4)
+        assert cache.get_entry('key_a') is not None
+    assert cache.get_entry('key_b') is None
+    assert cache.get_ttl('key_a') > 0.5
@@ -0,0 +1,94 @@
+import json
+import random
+import threading
+from time import monotonic, sleep
+from .main import EvictionStrategies, Cache, entry_size
+from .concurrent import ConcurrentCache
+
+def test_contructor():
+    cache = ConcurrentCache(10, 5, EvictionStrategies.REJECT, segments=4)
+    assert cache.max_slots == 10
+    assert cache.default_ttl == 5
+    assert sum(segment.max_slots for segment in cache.segments) == 10
+
+def test_contructor_more_segments_than_slots():
+    cache = ConcurrentCache(2, 5, EvictionStrategies.REJECT, segments=16)
+    assert len(cache.segments) == 2
+
+def test_set_get_delete():
+    cache = ConcurrentCache(100, 5, EvictionStrategies.REJECT, segments=4)
+    assert cache.set_entry('key_a', json.dumps({"data": "hello"})) == True
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "hello"})
+    assert cache.delete_entry('key_a') == True
+    assert cache.get_entry('key_a') == None
+
+def hammer(cache, threads=16, operations=2000):
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(operations):
+                key = f'key_{rng.randrange(500)}'
+                operation = rng.random()
+                if operation < 0.5:
+                    entry = cache.get_entry(key)
+                    # an expired entry must never be returned
+                    assert entry is None or monotonic() <= entry.expires_at + 0.01
+                elif operation < 0.9:
+                    cache.set_entry(key, json.dumps({"data": key}), rng.choice((1, 60)))
+                else:
+                    cache.delete_entry(key)
+                assert len(cache) <= cache.max_slots
+                assert not cache.max_bytes or cache.used_bytes <= cache.max_bytes
+        except AssertionError as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    assert errors == []
+
+def test_stress_cache():
+    for strategy in EvictionStrategies:
+        hammer(Cache(100, 5, strategy, max_bytes=20000))
+
+def test_stress_concurrent_cache():
+    for strategy in EvictionStrategies:
+        cache = ConcurrentCache(100, 5, strategy, max_bytes=20000, segments=8)
+        hammer(cache)
+        # the byte accounting of every segment matches its entries
+        for segment in cache.segments:
+            assert segment.used_bytes == sum(
+                entry_size(key, entry) for key, entry in segment._container.items()
+            )
+
+def test_stress_with_sweeper():
+    cache = ConcurrentCache(1000, 5, EvictionStrategies.LRU, segments=8)
+    cache.start_sweeper(0.01)
+    hammer(cache, threads=8, operations=2000)
+    sleep(1.2)
+    cache.stop_sweeper()
+    # every short lived entry has been reclaimed by now
+    assert all(entry.ttl == 60 for segment in cache.segments for entry in segment._container.values())
+
+def test_bulk_operations():
+    cache = ConcurrentCache(100, 5, EvictionStrategies.REJECT, segments=4)
+    keys = [f'key_{i}' for i in range(20)]
+    assert all(cache.set_entries({key: key for key in keys}).values())
+    entries = cache.get_entries(keys + ['missing'])
+    assert list(entries) == keys + ['missing']
+    assert entries['key_3'].json_str == 'key_3' and entries['missing'] == None
+    assert all(cache.delete_entries(keys).values())
+    assert len(cache) == 0
+
+def test_tags_and_prefix_scan():
+    cache = ConcurrentCache(100, 5, EvictionStrategies.REJECT, segments=4, prefix_index=True)
+    cache.set_entries({f'key_{i:02}': str(i) for i in range(20)}, tags=('even',))
+    assert [key for key, _ in cache.scan('key_', 'key_04', count=3)] == ['key_05', 'key_06', 'key_07']
+    assert cache.delete_tag('even') == 20
+    cache.set_entries({f'key_{i:02}': str(i) for i in range(20)})
+    assert cache.delete_prefix('key_1') == 10
+    assert len(cache) == 10
@@ -0,0 +1,48 @@
+import threading
+from .main import EvictionStrategies, Cache
+from .feed import InvalidationFeed
+
+def test_changes():
+    cache = Cache(2, 60, EvictionStrategies.OLDEST_FIRST)
+    feed = InvalidationFeed(cache, size=3)
+    feed.start()
+    assert feed.changes() == (0, [])
+    cache.set_entry('key_a', '1')
+    cache.set_entry('key_b', '2')
+    cache.delete_entry('key_a')
+    assert feed.changes(0) == (3, ['key_a', 'key_b', 'key_a'])
+    assert feed.changes(2) == (3, ['key_a'])
+    assert feed.changes(3) == (3, [])
+    # the eviction of key_b is a change too
+    cache.set_entry('key_c', '3')
+    cache.set_entry('key_d', '4')
+    assert feed.changes(3) == (6, ['key_c', 'key_b', 'key_d'])
+    # the first changes are no longer kept, and the future ones never were
+    assert feed.changes(2) == (6, None)
+    assert feed.changes(7) == (6, None)
+    feed.stop()
+    cache.set_entry('key_e', '5')
+    assert feed.changes(6) == (6, [])
+
+def test_deadline_changes():
+    cache = Cache(2, 60, EvictionStrategies.REJECT)
+    feed = InvalidationFeed(cache)
+    feed.start()
+    cache.set_entry('key_a', '1', ttl=10)
+    # the copies of the clients expire before an extended entry
+    cache.touch('key_a')
+    cache.expire('key_a', 100)
+    assert feed.changes(0) == (1, ['key_a'])
+    cache.expire('key_a', 1)
+    assert feed.changes(1) == (2, ['key_a'])
+    feed.stop()
+
+def test_long_polling():
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    feed = InvalidationFeed(cache)
+    feed.start()
+    writer = threading.Timer(0.1, cache.set_entry, ('key_a', '1'))
+    writer.start()
+    assert feed.changes(0, timeout=5) == (1, ['key_a'])
+    assert feed.changes(1, timeout=0.05) == (1, [])
+    writer.join()
@@ -0,0 +1,42 @@
+import random
+from .index import PrefixIndex, TagIndex
+
+def test_prefix_index_matches_sorted_keys():
+    rng = random.Random(7)
+    index = PrefixIndex()
+    keys = set()
+    for _ in range(5000):
+        key = ''.join(rng.choice('abc:') for _ in range(rng.randint(0, 6)))
+        if rng.random() < 0.3:
+            index.remove(key)
+            keys.discard(key)
+        else:
+            index.add(key)
+            keys.add(key)
+    assert len(index) == len(keys)
+    for prefix in ('', 'a', 'ab', 'c:a', 'abcabc', 'zz'):
+        expected = sorted(key for key in keys if key.startswith(prefix))
+        assert list(index.iter_keys(prefix)) == expected
+        for after in ('', 'b', 'a:c', 'c:a', expected[len(expected) // 2] if expected else 'x'):
+            assert list(index.iter_keys(prefix, after)) == [key for key in expected if key > after]
+
+def test_prefix_index_merges_nodes():
+    index = PrefixIndex()
+    for key in ('tenant:1:a', 'tenant:1:b', 'tenant:2:a'):
+        index.add(key)
+    index.remove('tenant:1:a')
+    index.remove('tenant:1:b')
+    index.remove('tenant:3')
+    assert list(index.iter_keys('tenant:')) == ['tenant:2:a']
+    (node,) = index._root.children.values()
+    assert node.label == 'tenant:2:a' and not node.children
+
+def test_tag_index():
+    index = TagIndex()
+    index.add('key_a', ('red', 'blue'))
+    index.add('key_b', ('red',))
+    assert sorted(index.keys('red')) == ['key_a', 'key_b']
+    index.remove('key_a', ('red', 'blue'))
+    assert index.keys('red') == ['key_b']
+    assert index.keys('blue') == []
+    assert len(index) == 1
@@ -0,0 +1,102 @@
+import json
+import threading
+import pytest
+from time import sleep
+from .main import EvictionStrategies, Cache
+from .concurrent import ConcurrentCache
+from .loader import ReadThroughCache
+
+def counting_loader(calls, delay=0):
+    def load(key):
+        calls.append(key)
+        sleep(delay)
+        return json.dumps({"data": key})
+    return load
+
+def test_read_through():
+    calls = []
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT))
+    cache.add_loader('user:', counting_loader(calls), ttl=30)
+    assert cache.get_entry('user:1').json_str == json.dumps({"data": "user:1"})
+    assert cache.get_entry('user:1').json_str == json.dumps({"data": "user:1"})
+    assert calls == ['user:1']
+    assert 29 < cache.get_ttl('user:1') <= 30
+    # keys without a loader are only looked up
+    assert cache.get_entry('item:1') is None
+    rv = cache.get_entries(['user:2', 'item:1'])
+    assert rv['user:2'].json_str == json.dumps({"data": "user:2"}) and rv['item:1'] is None
+
+def test_longest_prefix_loader():
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT))
+    cache.add_loader('', lambda key: '"any"')
+    cache.add_loader('user:', lambda key: '"user"')
+    assert cache.get_entry('user:1').json_str == '"user"'
+    assert cache.get_entry('item:1').json_str == '"any"'
+
+def test_single_flight():
+    calls = []
+    cache = ReadThroughCache(ConcurrentCache(10, 60, EvictionStrategies.REJECT, segments=2))
+    cache.add_loader('user:', counting_loader(calls, delay=0.2))
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_entry('user:1')))
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ['user:1']
+    assert len(results) == 20
+    assert all(entry.json_str == json.dumps({"data": "user:1"}) for entry in results)
+
+def test_failed_load():
+    def load(key):
+        raise ConnectionError('origin is down')
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT))
+    cache.add_loader('user:', load)
+    with pytest.raises(ConnectionError):
+        cache.get_entry('user:1')
+    assert len(cache) == 0
+
+def test_stale_while_revalidate():
+    calls = []
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT, stale_grace=5))
+    cache.add_loader('user:', counting_loader(calls, delay=0.2), ttl=30)
+    cache.set_entry('user:1', b'"old"', ttl=1)
+    sleep(1.1)
+    # the expired entry is kept by the sweeper during the grace period
+    assert cache.reclaim_expired(10) == 0
+    assert cache.get_entry('user:1').json_str == b'"old"'
+    assert cache.get_entry('user:1').json_str == b'"old"'
+    sleep(0.3)
+    assert calls == ['user:1']
+    assert cache.get_entry('user:1').json_str == json.dumps({"data": "user:1"})
+
+def test_early_refresh():
+    calls = []
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT), beta=1e9)
+    cache.add_loader('user:', counting_loader(calls, delay=0.05), ttl=2)
+    entry = cache.get_entry('user:1')
+    assert entry.delta >= 0.05
+    # the entry is close enough to its expiry for the compute time and beta
+    assert cache.get_entry('user:1') is not None
+    sleep(0.2)
+    assert calls == ['user:1', 'user:1']
+
+def test_stats_count_each_read_once():
+    calls = []
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT, stale_grace=5))
+    cache.add_loader('user:', counting_loader(calls), ttl=30)
+    # a load is a miss, and the next read a hit
+    cache.get_entry('user:1')
+    cache.get_entry('user:1')
+    # a stale entry without a loader is a miss
+    cache.set_entry('item:1', '1', ttl=1)
+    cache._container['item:1'].expires_at -= 2
+    assert cache.get_entry('item:1') is None
+    rv = cache.get_entries(['user:1', 'user:2', 'item:2'])
+    assert rv['user:2'].json_str == json.dumps({"data": "user:2"}) and rv['item:2'] is None
+    stats = cache.stats
+    assert (stats['hits'], stats['stale_hits'], stats['misses']) == (2, 0, 4)
+    assert calls == ['user:1', 'user:2']
@@ -0,0 +1,73 @@
+import json
+from time import sleep, time
+from .main import EvictionStrategies, Cache
+from .concurrent import ConcurrentCache
+from .persistence import (
+    SNAPSHOT_MAGIC_V1, RECORD_V1, write_snapshot, load_snapshot, SnapshotWriter
+)
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=30)
+    cache.set_entry('key_b', b'[1, 2]', ttl=10)
+    assert write_snapshot(cache, path) == 2
+
+    restored = ConcurrentCache(10, 60, EvictionStrategies.REJECT, segments=2)
+    assert load_snapshot(restored, path) == 2
+    assert restored.get_entry('key_a').json_str == json.dumps({"data": "key_a"}).encode()
+    assert restored.get_entry('key_b').json_str == b'[1, 2]'
+    # the absolute expiry time is kept
+    assert abs(restored.get_ttl('key_a') - cache.get_ttl('key_a')) < 0.1
+
+def test_snapshot_keeps_tags_and_delta(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    cache.set_entry('key_a', b'1', delta=0.25, tags=('tenant_1', 'users'))
+    cache.set_entry('key_b', b'2')
+    write_snapshot(cache, path)
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert load_snapshot(restored, path) == 2
+    assert restored.get_entry('key_a').tags == ('tenant_1', 'users')
+    assert restored.get_entry('key_a').delta == 0.25
+    assert restored.get_entry('key_b').tags == ()
+    assert restored.delete_tag('users') == 1
+
+def test_load_snapshot_of_version_1(tmp_path):
+    path = tmp_path / 'snapshot'
+    path.write_bytes(SNAPSHOT_MAGIC_V1 + RECORD_V1.pack(5, 1, time() + 30) + b'key_a1')
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert load_snapshot(restored, str(path)) == 1
+    assert restored.get_entry('key_a').json_str == b'1'
+    assert 29 < restored.get_ttl('key_a') <= 30
+
+def test_snapshot_skips_expired_entries(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=1)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=30)
+    write_snapshot(cache, path)
+    sleep(1.1)
+
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert load_snapshot(restored, path) == 1
+    assert restored.get_entry('key_a') == None
+
+def test_load_missing_snapshot(tmp_path):
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    assert load_snapshot(cache, str(tmp_path / 'missing')) == 0
+
+def test_snapshot_writer(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    cache = Cache(10, 60, EvictionStrategies.REJECT)
+    writer = SnapshotWriter(cache, path, 0.1)
+    writer.start()
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}))
+    sleep(0.3)
+    assert writer.last_count == 1
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}))
+    # a last snapshot is written when the writer stops
+    writer.stop()
+    restored = Cache(10, 60, EvictionStrategies.REJECT)
+    assert load_snapshot(restored, path) == 2
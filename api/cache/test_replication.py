@@ -0,0 +1,154 @@
+import socket
+from math import inf
+from time import monotonic, sleep
+from .main import EvictionStrategies, Cache
+from .concurrent import ConcurrentCache
+from .shared import SharedMemoryCache
+from .replication import ReplicationServer, ReplicaClient
+
+def wait_until(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, 'timed out'
+        sleep(0.01)
+
+def start(primary, replica):
+    server = ReplicationServer(primary, heartbeat_interval=0.05)
+    server.start()
+    client = ReplicaClient(replica, *server.address, reconnect_delay=0.05)
+    client.start()
+    wait_until(lambda: client.synced)
+    return server, client
+
+def test_snapshot_then_changes():
+    primary = Cache(10, 60, EvictionStrategies.OLDEST_FIRST)
+    primary.set_entry('key_a', b'{"data": "a"}', ttl=30)
+    primary.set_entry('key_b', b'[1]', ttl=0)
+    primary.set_entry('key_never', b'[1]', expires_at=inf)
+    replica = ConcurrentCache(40, 60, EvictionStrategies.REJECT, segments=2)
+    server, client = start(primary, replica)
+    try:
+        assert replica.get_entry('key_a').json_str == b'{"data": "a"}'
+        assert abs(replica.get_ttl('key_a') - primary.get_ttl('key_a')) < 0.1
+        assert replica.get_ttl('key_never') == inf
+
+        primary.set_entry('key_c', b'{}', ttl=10)
+        primary.delete_entry('key_a')
+        wait_until(lambda: replica.get_entry('key_c') is not None and len(replica) == 3)
+        assert replica.get_entry('key_a') is None
+        assert abs(replica.get_ttl('key_c') - primary.get_ttl('key_c')) < 0.1
+
+        # evictions are sent as deletes
+        for i in range(10):
+            primary.set_entry(f'key_{i}', b'1')
+        wait_until(lambda: sorted(key for key, _ in replica.items()) == sorted(key for key, _ in primary.items()))
+    finally:
+        client.stop()
+        server.stop()
+
+def test_tags_and_delta_are_replicated():
+    primary = Cache(10, 60, EvictionStrategies.REJECT)
+    primary.set_entry('key_a', b'1', tags=('tenant_1',))
+    replica = Cache(10, 60, EvictionStrategies.REJECT)
+    server, client = start(primary, replica)
+    try:
+        primary.set_entry('key_b', b'2', delta=0.25, tags=('tenant_1', 'users'))
+        wait_until(lambda: replica.get_entry('key_b') is not None)
+        assert replica.get_entry('key_a').tags == ('tenant_1',)
+        assert replica.get_entry('key_b').tags == ('tenant_1', 'users')
+        assert replica.get_entry('key_b').delta == 0.25
+        assert replica.delete_tag('tenant_1') == 2
+    finally:
+        client.stop()
+        server.stop()
+
+def test_deadline_changes_are_replicated():
+    primary = Cache(10, 60, EvictionStrategies.REJECT)
+    primary.set_entry('key_a', b'1', ttl=30)
+    primary.set_entry('key_b', b'2', ttl=30)
+    replica = Cache(10, 60, EvictionStrategies.REJECT)
+    server, client = start(primary, replica)
+    try:
+        applied = client.applied
+        primary.expire('key_a', 100)
+        primary.expire('key_b', 0)
+        wait_until(lambda: client.applied == applied + 2)
+        assert abs(replica.get_ttl('key_a') - primary.get_ttl('key_a')) < 0.1
+        assert replica.get_ttl('key_b') == inf
+    finally:
+        client.stop()
+        server.stop()
+
+def test_deadline_changes_on_a_shared_memory_replica(tmp_path):
+    primary = Cache(10, 60, EvictionStrategies.REJECT)
+    primary.set_entry('key_a', b'1', ttl=30)
+    replica = SharedMemoryCache(str(tmp_path / 'cache'), 10, 60, max_bytes=1024 * 1024)
+    server, client = start(primary, replica)
+    try:
+        applied = client.applied
+        primary.expire('key_a', 100)
+        primary.touch('key_a')
+        primary.set_entry('key_b', b'2')
+        wait_until(lambda: client.applied == applied + 3)
+        assert client.is_alive()
+        assert abs(replica.get_ttl('key_a') - primary.get_ttl('key_a')) < 0.1
+        assert replica.get_entry('key_b').json_str == b'2'
+    finally:
+        client.stop()
+        server.stop()
+        replica.close()
+
+def test_shared_memory_primary_is_refused(tmp_path):
+    primary = SharedMemoryCache(str(tmp_path / 'cache'), 10, 60, max_bytes=1024 * 1024)
+    server = ReplicationServer(primary)
+    server.start()
+    try:
+        with socket.create_connection(server.address, timeout=5) as connection:
+            # the stream is closed and forgotten
+            assert connection.recv(1) == b''
+        wait_until(lambda: server.status()['replicas'] == [])
+    finally:
+        server.stop()
+        primary.close()
+
+def test_status():
+    primary = Cache(10, 60, EvictionStrategies.REJECT)
+    replica = Cache(10, 60, EvictionStrategies.REJECT)
+    server, client = start(primary, replica)
+    try:
+        primary.set_entry('key_a', b'1')
+        wait_until(lambda: client.applied == 1)
+        wait_until(lambda: server.status()['replicas'][0]['sent'] == 1)
+        status = client.status()
+        assert status['role'] == 'replica'
+        assert status['connected'] and status['synced']
+        assert status['lag_operations'] == 0
+        assert 0 <= status['lag_seconds'] < 1
+        assert status['last_heartbeat_seconds_ago'] < 1
+        replicas = server.status()['replicas']
+        assert len(replicas) == 1
+        assert replicas[0]['synced'] and replicas[0]['pending'] == 0
+        assert replicas[0]['lag_seconds'] == 0
+    finally:
+        client.stop()
+        server.stop()
+
+def test_resync_after_reconnection():
+    primary = Cache(10, 60, EvictionStrategies.REJECT)
+    replica = Cache(10, 60, EvictionStrategies.REJECT)
+    primary.set_entry('key_a', b'1')
+    primary.set_entry('key_b', b'2')
+    server, client = start(primary, replica)
+    client.stop()
+    server.stop()
+    wait_until(lambda: not primary._observers)
+
+    # the changes made while the replica is disconnected come with the new snapshot
+    primary.delete_entry('key_a')
+    primary.set_entry('key_c', b'3')
+    server, client = start(primary, replica)
+    try:
+        assert sorted(key for key, _ in replica.items()) == ['key_b', 'key_c']
+    finally:
+        client.stop()
+        server.stop()
@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+import pytest
+from time import sleep
+from .main import EvictionStrategies
+from .shared import SharedMemoryCache
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'cache')
+
+def test_set_get_delete(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    assert cache.set_entry('key_a', json.dumps({"data": "hello"})) == True
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "hello"}).encode()
+    assert cache.set_entry('key_a', json.dumps({"data": "Howdy!"})) == True
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "Howdy!"}).encode()
+    assert len(cache) == 1
+    assert cache.delete_entry('key_a') == True
+    assert cache.get_entry('key_a') == None
+    assert cache.delete_entry('key_a') == False
+    assert cache.used_bytes == 0
+
+def test_expiry(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), 1)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), 1)
+    sleep(1.1)
+    assert cache.get_entry('key_a') == None
+    # expired entries are reclaimed when the cache is full
+    assert cache.set_entry('key_c', json.dumps({"data": "key_c"})) == True
+    assert len(cache) == 1
+
+def test_reject_policy(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=0)
+    assert cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=0) == False
+
+def test_oldest_first_policy(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.OLDEST_FIRST, 4096)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=0)
+    cache.set_entry('key_b', json.dumps({"data": "key_b"}), ttl=0)
+    cache.set_entry('key_c', json.dumps({"data": "key_c"}), ttl=0)
+    assert cache.get_entry('key_a') == None
+    assert cache.get_entry('key_c') != None
+
+def test_newest_first_policy_when_arena_is_full(path):
+    cache = SharedMemoryCache(path, 100, 5, EvictionStrategies.NEWEST_FIRST, 256)
+    for key in ('key_a', 'key_b', 'key_c', 'key_d'):
+        assert cache.set_entry(key, json.dumps({"data": key}), ttl=0) == True
+    assert cache.set_entry('key_e', json.dumps({"data": "key_e"}), ttl=0) == True
+    assert cache.get_entry('key_d') == None
+    assert cache.get_entry('key_e') != None
+    assert cache.used_bytes <= cache.max_bytes
+
+def test_unsupported_policy(path):
+    with pytest.raises(ValueError):
+        SharedMemoryCache(path, 2, 5, EvictionStrategies.LRU)
+
+def test_many_entries(path):
+    cache = SharedMemoryCache(path, 1000, 5, EvictionStrategies.OLDEST_FIRST, 1024 * 1024)
+    for i in range(2000):
+        cache.set_entry(f'key_{i}', json.dumps({"data": i}))
+        if i % 3 == 0:
+            cache.delete_entry(f'key_{i}')
+    assert len(cache) <= 1000
+    assert cache.get_entry('key_1999').json_str == json.dumps({"data": 1999}).encode()
+
+def set_from_child(path, key):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    cache.set_entry(key, json.dumps({"data": key}))
+
+def test_processes_share_the_dataset(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    context = multiprocessing.get_context('fork')
+    process = context.Process(target=set_from_child, args=(path, 'key_a'))
+    process.start()
+    process.join()
+    assert cache.get_entry('key_a').json_str == json.dumps({"data": "key_a"}).encode()
+
+def test_bulk_operations(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    rv = cache.set_entries({'key_a': '1', 'key_b': '2', 'key_c': '3'})
+    assert rv == {'key_a': True, 'key_b': True, 'key_c': False}
+    rv = cache.get_entries(['key_a', 'key_c'])
+    assert rv['key_a'].json_str == b'1' and rv['key_c'] == None
+    assert cache.delete_entries(['key_a', 'key_c']) == {'key_a': True, 'key_c': False}
+
+def test_get_ttl(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), ttl=10)
+    assert 9 < cache.get_ttl('key_a') <= 10
+    assert cache.get_ttl('key_b') == None
+
+def test_touch_and_expire(path):
+    cache = SharedMemoryCache(path, 2, 5, EvictionStrategies.REJECT, 4096)
+    cache.set_entry('key_a', json.dumps({"data": "key_a"}), 1)
+    assert cache.expire('key_a', 100) == True
+    assert 99 < cache.get_ttl('key_a') <= 100
+    assert cache.get_entry('key_a').ttl == 100
+    assert cache.expire('key_a', 0) == True
+    assert cache.get_ttl('key_a') == float('inf')
+    assert cache.expire('key_a', 1) == True
+    sleep(0.5)
+    assert cache.touch('key_a') == True
+    assert cache.get_ttl('key_a') > 0.9
+    assert cache.touch('key_b') == False
+    sleep(1.1)
+    assert cache.touch('key_a') == False
+    assert cache.reclaim_expired(10) == 1
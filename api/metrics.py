@@ -0,0 +1,162 @@
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from werkzeug.exceptions import HTTPException
+
+# The upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+
+
+class RequestMetrics:
+    """A class used to record the latency and the status of the requests
+
+    Each thread records its requests in its own histograms, so recording
+    takes no lock and threads do not write to the same memory. The
+    histograms of all the threads are summed when they are read.
+
+    Methods:
+        observe(handler, status, seconds):
+            records a request
+        histograms():
+            returns the summed bucket counts, sum and count of each handler
+        responses():
+            returns the number of responses by handler and status
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    # A private method returning the histograms and response counters of
+    # the current thread, creating them on its first request
+    def _thread_metrics(self):
+        try:
+            return self._local.metrics
+        except AttributeError:
+            metrics = self._local.metrics = ({}, {})
+            with self._lock:
+                self._threads.append(metrics)
+            return metrics
+
+    def observe(self, handler, status, seconds):
+        histograms, responses = self._thread_metrics()
+        histogram = histograms.get(handler)
+        if histogram is None:
+            # the bucket counts, then the sum of the latencies
+            histogram = histograms[handler] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+        responses[handler, status] = responses.get((handler, status), 0) + 1
+
+    def histograms(self):
+        """Returns a dict of the (bucket counts, sum, count) of each handler.
+        The last bucket count is the number of requests above the last bound
+        """
+        with self._lock:
+            threads = list(self._threads)
+        summed = {}
+        for histograms, _ in threads:
+            for handler, histogram in list(histograms.items()):
+                total = summed.setdefault(handler, [0] * len(histogram[:-1]) + [0.0])
+                for i, value in enumerate(histogram):
+                    total[i] += value
+        return {
+            handler: (histogram[:-1], histogram[-1], sum(histogram[:-1]))
+            for handler, histogram in summed.items()
+        }
+
+    def responses(self):
+        """Returns a dict of the number of responses by (handler, status)"""
+        with self._lock:
+            threads = list(self._threads)
+        summed = {}
+        for _, responses in threads:
+            for labels, count in list(responses.items()):
+                summed[labels] = summed.get(labels, 0) + count
+        return summed
+
+
+# The metrics of the requests of the API
+request_metrics = RequestMetrics()
+
+
+def timed(handler):
+    """Decorates a method of a resource to record the latency and the status
+    of its requests under the name of handler
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            status = 500
+            try:
+                result = method(*args, **kwargs)
+                status = result[1] if isinstance(result, tuple) else getattr(result, 'status_code', 200)
+                return result
+            except HTTPException as error:
+                status = error.code
+                raise
+            finally:
+                request_metrics.observe(handler, status, perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def render_metrics(cache):
+    """Returns the metrics of the cache and of the requests in the Prometheus
+    text exposition format
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            lines.append(f'{name}{labels} {value}')
+
+    stats = cache.stats
+    for counter, help_text in (
+        ('hits', 'Lookups finding an entry'),
+        ('stale_hits', 'Lookups finding an expired entry served within the stale grace'),
+        ('misses', 'Lookups finding no entry'),
+        ('sets', 'Entries inserted or replaced'),
+        ('rejections', 'Entries rejected for lack of room'),
+        ('deletes', 'Entries deleted'),
+        ('evictions', 'Entries evicted by the eviction policy'),
+        ('expired', 'Expired entries reclaimed'),
+    ):
+        metric(f'cache_{counter}_total', 'counter', help_text, [('', stats[counter])])
+    compression_stats = cache.compression_stats
+    for counter, name, help_text in (
+        ('compressed', 'cache_compressed_values_total', 'Values stored compressed'),
+        ('uncompressed', 'cache_uncompressed_values_total', 'Values left uncompressed as they did not shrink'),
+        ('bytes_in', 'cache_compression_bytes_in_total', 'Bytes of the compressed values before compression'),
+        ('bytes_out', 'cache_compression_bytes_out_total', 'Bytes of the compressed values after compression'),
+    ):
+        metric(name, 'counter', help_text, [('', compression_stats[counter])])
+    metric('cache_entries', 'gauge', 'Entries in the cache', [('', len(cache))])
+    metric('cache_max_slots', 'gauge', 'Max number of entries', [('', cache.max_slots)])
+    metric('cache_used_bytes', 'gauge', 'Bytes used by the entries', [('', cache.used_bytes)])
+    metric('cache_max_bytes', 'gauge', 'Max number of bytes, 0 for no limit', [('', cache.max_bytes)])
+
+    metric(
+        'cache_http_responses_total', 'counter', 'HTTP responses by handler and status',
+        [
+            (f'{{handler="{handler}",status="{status}"}}', count)
+            for (handler, status), count in sorted(request_metrics.responses().items())
+        ]
+    )
+    samples = []
+    for handler, (counts, total, count) in sorted(request_metrics.histograms().items()):
+        cumulative = 0
+        for bound, bucket_count in zip(request_metrics.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            samples.append((f'_bucket{{handler="{handler}",le="{bound}"}}', cumulative))
+        samples.append((f'_sum{{handler="{handler}"}}', total))
+        samples.append((f'_count{{handler="{handler}"}}', count))
+    metric('cache_http_request_duration_seconds', 'histogram', 'HTTP request latency', samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import threading
+from math import inf
+from .cache import AsyncCache
+
+
+class RespError(Exception):
+    """An error sent to the client as a RESP error reply"""
+
+
+class RespServer:
+    """An asyncio TCP server speaking a subset of the Redis protocol (RESP)
+
+    It lets Redis clients use the cache without the HTTP overhead. The
+    supported commands are PING, GET, SET key value [EX seconds], DEL,
+    MGET, MSET, TTL, EXPIRE and PERSIST, plus COMMAND and QUIT for the
+    clients sending them on connection. Values must be valid JSON
+    documents, as with the HTTP API. SET without EX uses the default time
+    to live of the cache. Both the arrays of bulk strings sent by clients
+    and inline commands are accepted, and pipelined commands are answered
+    in order. The write commands of a read-only server, a replica, get a
+    READONLY error. An MSET that does not fit is rolled back: the keys it
+    set are deleted, as the previous values were replaced, and an OOM
+    error is sent. The reads of a ReadThroughCache run off the event loop,
+    see AsyncCache.
+
+    Methods:
+        start(host, port):
+            starts listening and returns the asyncio server
+        handle_connection(reader, writer):
+            serves the commands of one connection
+    """
+    def __init__(self, cache, read_only=False):
+        """
+        Parameters:
+            cache : Cache, ConcurrentCache, SharedMemoryCache or ReadThroughCache
+                The cache served
+            read_only : bool
+                Whether the write commands are rejected
+        """
+        self.cache = AsyncCache(cache)
+        self._commands = {
+            b'PING': self.ping, b'GET': self.get, b'SET': self.set,
+            b'DEL': self.delete, b'MGET': self.mget, b'MSET': self.mset,
+            b'TTL': self.ttl, b'EXPIRE': self.expire, b'PERSIST': self.persist,
+            b'COMMAND': self.command,
+        }
+        if read_only:
+            for name in (b'SET', b'DEL', b'MSET', b'EXPIRE', b'PERSIST'):
+                self._commands[name] = self.read_only
+
+    async def start(self, host='0.0.0.0', port=6379, reuse_port=False):
+        return await asyncio.start_server(
+            self.handle_connection, host, port, reuse_port=reuse_port
+        )
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    arguments = await read_command(reader)
+                except RespError as error:
+                    writer.write(encode_error(error))
+                    break
+                if arguments is None:
+                    break
+                if not arguments:
+                    continue
+                name = arguments[0].upper()
+                if name == b'QUIT':
+                    writer.write(b'+OK\r\n')
+                    break
+                try:
+                    command = self._commands.get(name)
+                    if command is None:
+                        raise RespError(f"ERR unknown command '{name.decode('latin-1')}'")
+                    writer.write(await command(arguments[1:]))
+                except RespError as error:
+                    writer.write(encode_error(error))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def ping(self, arguments):
+        if arguments:
+            return encode_bulk(arguments[0])
+        return b'+PONG\r\n'
+
+    async def get(self, arguments):
+        check_arity(arguments, 1, 'get')
+        entry = await self.cache.get_entry(decode_key(arguments[0]))
+        return encode_bulk(entry.json_str if entry else None)
+
+    async def set(self, arguments):
+        if len(arguments) not in (2, 4):
+            raise RespError("ERR syntax error")
+        ttl = None
+        if len(arguments) == 4:
+            if arguments[2].upper() != b'EX':
+                raise RespError("ERR syntax error")
+            ttl = parse_integer(arguments[3])
+            if ttl <= 0:
+                raise RespError("ERR invalid expire time in 'set' command")
+        value = validate_json(arguments[1])
+        if not await self.cache.set_entry(decode_key(arguments[0]), value, ttl):
+            raise RespError("OOM The server has no storage")
+        return b'+OK\r\n'
+
+    async def delete(self, arguments):
+        if not arguments:
+            raise RespError("ERR wrong number of arguments for 'del' command")
+        deleted = await self.cache.delete_entries([decode_key(key) for key in arguments])
+        return encode_integer(sum(deleted.values()))
+
+    async def mget(self, arguments):
+        if not arguments:
+            raise RespError("ERR wrong number of arguments for 'mget' command")
+        keys = [decode_key(key) for key in arguments]
+        entries = await self.cache.get_entries(keys)
+        replies = [encode_bulk(entries[key].json_str if entries[key] else None) for key in keys]
+        return b'*%d\r\n' % len(keys) + b''.join(replies)
+
+    async def mset(self, arguments):
+        if not arguments or len(arguments) % 2:
+            raise RespError("ERR wrong number of arguments for 'mset' command")
+        entries = {
+            decode_key(arguments[i]): validate_json(arguments[i + 1])
+            for i in range(0, len(arguments), 2)
+        }
+        cached = await self.cache.set_entries(entries)
+        if not all(cached.values()):
+            # MSET is all or nothing: the keys already set are deleted, so
+            # the failed command leaves none of its values in the cache
+            await self.cache.delete_entries([key for key, done in cached.items() if done])
+            raise RespError("OOM The server has no storage")
+        return b'+OK\r\n'
+
+    async def ttl(self, arguments):
+        check_arity(arguments, 1, 'ttl')
+        remaining = await self.cache.get_ttl(decode_key(arguments[0]))
+        if remaining is None:
+            return encode_integer(-2)
+        if remaining == inf:
+            return encode_integer(-1)
+        return encode_integer(round(remaining))
+
+    async def expire(self, arguments):
+        check_arity(arguments, 2, 'expire')
+        key = decode_key(arguments[0])
+        ttl = parse_integer(arguments[1])
+        # as with Redis, a key expiring now is deleted
+        if ttl <= 0:
+            return encode_integer(int(await self.cache.delete_entry(key)))
+        return encode_integer(int(await self.cache.expire(key, ttl)))
+
+    async def persist(self, arguments):
+        check_arity(arguments, 1, 'persist')
+        key = decode_key(arguments[0])
+        if await self.cache.get_ttl(key) in (None, inf):
+            return encode_integer(0)
+        return encode_integer(int(await self.cache.expire(key, 0)))
+
+    async def command(self, arguments):
+        return b'*0\r\n'
+
+    async def read_only(self, arguments):
+        raise RespError("READONLY You can't write against a read only replica.")
+
+
+def start_resp_server(cache, host, port, read_only=False):
+    """Serves cache with a RespServer on its own event loop, in a daemon
+    thread, and returns the thread. The port is shared with SO_REUSEPORT
+    so every gunicorn worker can listen on it
+    """
+    started = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(RespServer(cache, read_only).start(host, port, reuse_port=True))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, name='resp-server', daemon=True)
+    thread.start()
+    started.wait(5)
+    return thread
+
+
+# Reads a command and returns its arguments as bytes, or None when the
+# connection is closed
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.endswith(b'\r\n'):
+        raise RespError("ERR Protocol error: unterminated line")
+    if line[:1] != b'*':
+        # an inline command
+        return line.split()
+    count = parse_integer(line[1:-2])
+    arguments = []
+    for _ in range(count):
+        header = await reader.readline()
+        if header[:1] != b'$':
+            raise RespError("ERR Protocol error: expected '$'")
+        length = parse_integer(header[1:-2])
+        arguments.append((await reader.readexactly(length + 2))[:-2])
+    return arguments
+
+
+def check_arity(arguments, count, name):
+    if len(arguments) != count:
+        raise RespError(f"ERR wrong number of arguments for '{name}' command")
+
+
+def parse_integer(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise RespError("ERR value is not an integer or out of range")
+
+
+def decode_key(key):
+    try:
+        return key.decode('utf-8')
+    except UnicodeDecodeError:
+        raise RespError("ERR keys must be UTF-8 strings")
+
+
+def validate_json(value):
+    try:
+        json.loads(value.decode('utf-8'))
+    except ValueError:
+        raise RespError("ERR value is not a valid JSON document")
+    return value
+
+
+def encode_bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def encode_integer(value):
+    return b':%d\r\n' % value
+
+
+def encode_error(error):
+    return b'-%s\r\n' % str(error).encode('utf-8')
@@ -0,0 +1,122 @@
+"""Measures the throughput, the latency and the memory of the cache operations
+
+Every eviction strategy is measured at several sizes under three workloads,
+each run as a look-aside client would, with a write after every miss:
+    uniform: keys drawn uniformly from twice as many keys as slots
+    zipf: keys drawn from a Zipfian distribution over ten times as many
+        keys as slots
+    expired: a cache full of expired entries receiving new keys, so every
+        write reclaims an expired entry
+The memory per entry of a full cache, container and indexes included, is
+measured for every strategy and size too.
+
+Usage:
+    python -m benchmarks.bench_cache_ops [--sizes 1000,100000] [--operations 200000]
+        [--output results.json]
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+from time import monotonic, perf_counter_ns
+from api.cache import EvictionStrategies, Cache
+from .bench_hit_ratio import zipf_keys
+from .results import percentiles, write_results
+
+WORKLOADS = ('uniform', 'zipf', 'expired')
+
+
+def workload_keys(workload, slots, operations, seed=0):
+    """Returns the keys of the operations of a workload"""
+    if workload == 'zipf':
+        return zipf_keys(10 * slots, 0.99, operations, seed)
+    if workload == 'uniform':
+        rng = random.Random(seed)
+        return [f'key_{rng.randrange(2 * slots)}' for _ in range(operations)]
+    return [f'new_key_{i}' for i in range(operations)]
+
+
+def run_workload(strategy, slots, workload, keys):
+    cache = Cache(slots, 3600, strategy)
+    payload = json.dumps({"data": "hello"})
+    if workload == 'expired':
+        expired = monotonic() - 1
+        for i in range(slots):
+            cache.set_entry(f'key_{i}', payload, expires_at=expired)
+
+    latencies = []
+    hits = 0
+    get_entry, set_entry = cache.get_entry, cache.set_entry
+    started = perf_counter_ns()
+    for key in keys:
+        start = perf_counter_ns()
+        if get_entry(key):
+            hits += 1
+        else:
+            set_entry(key, payload)
+        latencies.append(perf_counter_ns() - start)
+    elapsed = (perf_counter_ns() - started) / 1e9
+
+    summary = {name: value / 1000 for name, value in percentiles(latencies).items()}
+    return {
+        'strategy': strategy.value,
+        'slots': slots,
+        'workload': workload,
+        'operations': len(keys),
+        'ops_per_second': len(keys) / elapsed,
+        'hit_ratio': hits / len(keys),
+        'latency_us': summary,
+        'stats': cache.stats,
+    }
+
+
+def bytes_per_entry(strategy, slots):
+    payload = json.dumps({"data": "hello"})
+    gc.collect()
+    tracemalloc.start()
+    cache = Cache(slots, 3600, strategy)
+    for i in range(slots):
+        cache.set_entry(f'key_{i}', payload)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+    return used / slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--operations', type=int, default=200000)
+    parser.add_argument('--workloads', default=','.join(WORKLOADS))
+    parser.add_argument('--output', default='', help='the path of the JSON results')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    workloads = args.workloads.split(',')
+
+    results = []
+    for slots in sizes:
+        for workload in workloads:
+            keys = workload_keys(workload, slots, args.operations)
+            for strategy in EvictionStrategies:
+                result = run_workload(strategy, slots, workload, keys)
+                results.append(result)
+                latency = result['latency_us']
+                print(
+                    f'{strategy.value:<12} slots={slots:<8} {workload:<8} '
+                    f'{result["ops_per_second"]:>10,.0f} ops/s  hit ratio {result["hit_ratio"]:6.2%}  '
+                    f'p50 {latency["p50"]:6.2f} us  p99 {latency["p99"]:7.2f} us'
+                )
+        for strategy in EvictionStrategies:
+            memory = bytes_per_entry(strategy, slots)
+            results.append({
+                'strategy': strategy.value, 'slots': slots, 'workload': 'memory',
+                'bytes_per_entry': memory,
+            })
+            print(f'{strategy.value:<12} slots={slots:<8} memory   {memory:8.1f} bytes/entry')
+
+    write_results(args.output, 'cache_ops', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Measures the hit ratio of the eviction strategies under a Zipfian workload
+
+Every read that misses is followed by a write of the key, as a look-aside
+client would do.
+
+Usage:
+    python -m benchmarks.bench_hit_ratio [--keys 100000] [--slots 1000] [--skew 0.99]
+        [--output results.json]
+"""
+import argparse
+import json
+import random
+from bisect import bisect
+from itertools import accumulate
+from api.cache import EvictionStrategies, Cache
+from .results import write_results
+
+
+def zipf_keys(keys, skew, operations, seed=0):
+    """Returns a list of operations keys drawn from a Zipfian distribution"""
+    rng = random.Random(seed)
+    cumulative_weights = list(accumulate(1 / (rank ** skew) for rank in range(1, keys + 1)))
+    total = cumulative_weights[-1]
+    return [f'key_{bisect(cumulative_weights, rng.random() * total)}' for _ in range(operations)]
+
+
+def hit_ratio(strategy, slots, workload):
+    cache = Cache(slots, 3600, strategy)
+    payload = json.dumps({"data": "hello"})
+    hits = 0
+    for key in workload:
+        if cache.get_entry(key):
+            hits += 1
+        else:
+            cache.set_entry(key, payload)
+    return hits / len(workload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--slots', type=int, default=1000)
+    parser.add_argument('--skew', type=float, default=0.99)
+    parser.add_argument('--operations', type=int, default=500000)
+    parser.add_argument('--output', default='', help='the path of the JSON results')
+    args = parser.parse_args()
+
+    workload = zipf_keys(args.keys, args.skew, args.operations)
+    results = []
+    for strategy in EvictionStrategies:
+        ratio = hit_ratio(strategy, args.slots, workload)
+        print(f'{strategy.value:<14} hit ratio {ratio:6.2%}')
+        results.append({'strategy': strategy.value, 'hit_ratio': ratio})
+
+    write_results(args.output, 'hit_ratio', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Load-tests the HTTP API
+
+Client threads send GET requests, and a PUT after every 404 as a
+look-aside client would, for keys drawn from a Zipfian distribution. Each
+thread keeps its connection alive. The server is one of:
+    inprocess: the Flask app served by werkzeug in a thread of this process
+    gunicorn: gunicorn serving the app in a subprocess
+    url: a server already running at --url
+
+The started servers use the benchmark configuration by default: the
+production one with a slot for each of the --keys keys, so the requests
+measure the cache rather than 507 responses of a full cache. The run fails
+when most responses are not 2xx.
+
+Usage:
+    python -m benchmarks.bench_http [--servers inprocess,gunicorn] [--threads 8]
+        [--requests 20000] [--output results.json]
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+from time import perf_counter, perf_counter_ns, sleep
+from urllib.parse import urlsplit
+from .bench_hit_ratio import zipf_keys
+from .results import percentiles, write_results
+
+# The max share of the responses that may not be 2xx
+MAX_ERROR_SHARE = 0.5
+
+
+def free_port():
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        return listener.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=30):
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise RuntimeError(f'the server at {host}:{port} did not start')
+
+
+def benchmark_config(keys):
+    """Registers the benchmark configuration, the production one with a
+    slot for each key, and returns its name
+    """
+    from instance.config import config
+    config['benchmark'] = type('BenchmarkConfig', (config['production'],), {'NUMBER_OF_SLOTS': keys})
+    return 'benchmark'
+
+
+def benchmark_app():
+    """Returns the app with the benchmark configuration sized by the
+    BENCHMARK_KEYS environment variable, for gunicorn
+    """
+    from api import create_app
+    return create_app(benchmark_config(int(os.environ['BENCHMARK_KEYS'])))
+
+
+def start_inprocess(config_name, keys):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from api import create_app
+
+    class RequestHandler(WSGIRequestHandler):
+        # keeps the connections alive and does not log the requests
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    if config_name == 'benchmark':
+        benchmark_config(keys)
+    port = free_port()
+    server = make_server(
+        '127.0.0.1', port, create_app(config_name), threaded=True, request_handler=RequestHandler
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{port}', server.shutdown
+
+
+def start_gunicorn(config_name, keys, workers, threads):
+    port = free_port()
+    app = 'benchmarks.bench_http:benchmark_app()' if config_name == 'benchmark' else 'wsgi:app'
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', app, '--bind', f'127.0.0.1:{port}',
+            f'--workers={workers}', f'--threads={threads}', '--log-level=warning',
+        ],
+        env=dict(os.environ, APP_ENV=config_name, BENCHMARK_KEYS=str(keys)),
+    )
+    try:
+        wait_for_port('127.0.0.1', port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return f'http://127.0.0.1:{port}', lambda: (process.terminate(), process.wait())
+
+
+def client(url, keys, payload, latencies, statuses):
+    address = urlsplit(url)
+    connection = http.client.HTTPConnection(address.hostname, address.port)
+    for key in keys:
+        start = perf_counter_ns()
+        connection.request('GET', f'/object/{key}')
+        response = connection.getresponse()
+        response.read()
+        if response.status == 404:
+            connection.request('PUT', f'/object/{key}', payload, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+        latencies.append(perf_counter_ns() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+    connection.close()
+
+
+def load_test(url, threads, requests, keys):
+    workload = zipf_keys(keys, 0.99, requests)
+    payload = json.dumps({"data": "hello" * 20})
+    latencies = [[] for _ in range(threads)]
+    statuses = [{} for _ in range(threads)]
+    clients = [
+        threading.Thread(target=client, args=(url, workload[i::threads], payload, latencies[i], statuses[i]))
+        for i in range(threads)
+    ]
+    started = perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    all_latencies = [latency for thread_latencies in latencies for latency in thread_latencies]
+    status_counts = {}
+    for thread_statuses in statuses:
+        for status, count in thread_statuses.items():
+            status_counts[str(status)] = status_counts.get(str(status), 0) + count
+    return {
+        'requests': len(all_latencies),
+        'requests_per_second': len(all_latencies) / elapsed,
+        'latency_ms': {name: value / 1e6 for name, value in percentiles(all_latencies).items()},
+        'statuses': status_counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--servers', default='inprocess,gunicorn')
+    parser.add_argument('--url', default='', help='the URL of the server of --servers url')
+    parser.add_argument(
+        '--config', default='benchmark',
+        help='the configuration of the started servers, benchmark for production with --keys slots'
+    )
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--gunicorn-workers', type=int, default=1)
+    parser.add_argument('--gunicorn-threads', type=int, default=8)
+    parser.add_argument('--output', default='', help='the path of the JSON results')
+    args = parser.parse_args()
+
+    results = []
+    failed = []
+    for server in args.servers.split(','):
+        if server == 'inprocess':
+            url, stop = start_inprocess(args.config, args.keys)
+        elif server == 'gunicorn':
+            if importlib.util.find_spec('gunicorn') is None:
+                print('gunicorn is not installed, skipped')
+                continue
+            url, stop = start_gunicorn(args.config, args.keys, args.gunicorn_workers, args.gunicorn_threads)
+        else:
+            url, stop = args.url, lambda: None
+        try:
+            result = load_test(url, args.threads, args.requests, args.keys)
+        finally:
+            stop()
+        result['server'] = server
+        results.append(result)
+        latency = result['latency_ms']
+        print(
+            f'{server:<10} {result["requests_per_second"]:>8,.0f} req/s  '
+            f'p50 {latency["p50"]:6.2f} ms  p99 {latency["p99"]:7.2f} ms  {result["statuses"]}'
+        )
+        errors = sum(count for status, count in result['statuses'].items() if not status.startswith('2'))
+        if errors > MAX_ERROR_SHARE * result['requests']:
+            print(f'{server}: {errors} of {result["requests"]} responses are not 2xx', file=sys.stderr)
+            failed.append(server)
+
+    write_results(args.output, 'http', vars(args), results)
+    if failed:
+        sys.exit(f'the results of {", ".join(failed)} measure errors, check --config and --keys')
+
+
+if __name__ == '__main__':
+    main()
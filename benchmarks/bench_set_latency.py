@@ -0,0 +1,50 @@
+"""Measures the latency of set_entry on a full cache
+
+Every set inserts a new key into a full cache, so each call goes through
+the eviction strategy. The latency should stay flat as max_slots grows.
+
+Usage:
+    python -m benchmarks.bench_set_latency [--max-exponent 7] [--operations 10000]
+        [--output results.json]
+"""
+import argparse
+import json
+from time import perf_counter
+from api.cache import EvictionStrategies, Cache
+from .results import write_results
+
+
+def bench_set_latency(max_slots, strategy, operations):
+    cache = Cache(max_slots, 3600, strategy)
+    payload = json.dumps({"data": "hello"})
+    for i in range(max_slots):
+        cache.set_entry(f'key_{i}', payload, 0)
+
+    start = perf_counter()
+    for i in range(operations):
+        cache.set_entry(f'new_key_{i}', payload, 0)
+    elapsed = perf_counter() - start
+    return elapsed / operations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--min-exponent', type=int, default=3)
+    parser.add_argument('--max-exponent', type=int, default=6)
+    parser.add_argument('--operations', type=int, default=10000)
+    parser.add_argument('--output', default='', help='the path of the JSON results')
+    args = parser.parse_args()
+
+    results = []
+    for strategy in (EvictionStrategies.OLDEST_FIRST, EvictionStrategies.NEWEST_FIRST):
+        for exponent in range(args.min_exponent, args.max_exponent + 1):
+            max_slots = 10 ** exponent
+            latency = bench_set_latency(max_slots, strategy, args.operations)
+            print(f'{strategy.value:<14} max_slots=1e{exponent:<3} {latency:8.2f} us/set')
+            results.append({'strategy': strategy.value, 'slots': max_slots, 'latency_us': latency})
+
+    write_results(args.output, 'set_latency', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
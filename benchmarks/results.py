@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmarks to summarize and save their results
+
+The results are written as JSON, with the commit and the environment they
+were measured on, so runs on different commits can be compared.
+"""
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+
+def percentiles(latencies, points=(50, 90, 99, 99.9)):
+    """Returns a dict of the percentiles of a list of latencies, by name"""
+    ordered = sorted(latencies)
+    if not ordered:
+        return {}
+    return {
+        f'p{point:g}': ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))]
+        for point in points
+    }
+
+
+def git_commit():
+    """Returns the commit of the working tree, or None outside of git"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, parameters, results):
+    """Writes the results of a benchmark to path as JSON. Nothing is
+    written if path is empty
+
+    Parameters:
+        path : str
+            The path of the JSON file
+        benchmark : str
+            The name of the benchmark
+        parameters : dict
+            The parameters of the run
+        results : list
+            The measures, one dict per case
+    """
+    if not path:
+        return
+    document = {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'results': results,
+    }
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2)
+        output.write('\n')
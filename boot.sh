@@ -1,3 +1,15 @@
 #!/usr/bin/env bash
 
-gunicorn wsgi:app --bind 0.0.0.0:8080 --log-level=debug --workers=1
\ No newline at end of file
+# SERVER_MODE=asyncio serves the /object/{key} API from a single asyncio
+# process instead of gunicorn
+if [ "${SERVER_MODE}" = "asyncio" ]; then
+    exec python aioserver.py
+fi
+
+# With more than 1 thread, gunicorn uses the gthread worker. Set
+# CACHE_SEGMENTS in the config to reduce the contention on the cache.
+# The near-caching clients of INVALIDATION_FEED_SIZE only long poll the
+# feed with more than 1 thread, and poll it every second otherwise.
+# With more than 1 worker, set SHARED_MEMORY_PATH in the config so the
+# workers share one cache
+gunicorn wsgi:app --bind 0.0.0.0:8080 --log-level=debug --workers=${GUNICORN_WORKERS:-1} --threads=${GUNICORN_THREADS:-1}
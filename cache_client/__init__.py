@@ -0,0 +1,4 @@
+from .ring import HashRing
+from .pool import ConnectionPool
+from .client import CacheClientError, CacheClient, ClusterClient
+from .near import NearCacheClient
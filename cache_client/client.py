@@ -0,0 +1,199 @@
+import http.client
+import json
+from urllib.parse import quote, urlsplit
+from .pool import ConnectionPool
+from .ring import HashRing
+
+
+class CacheClientError(Exception):
+    """Raised when a node answers with an unexpected status or cannot be reached"""
+
+
+class CacheClient:
+    """A client of the HTTP API of one cache node
+
+    The requests use the kept alive connections of a ConnectionPool. The
+    objects are sent and returned as JSON-serializable Python objects.
+
+    Methods:
+        get(key):
+            returns the object stored at key, or None
+        set(key, obj, ttl=None):
+            stores obj at key and returns True, or False if the node has no storage
+        delete(key):
+            deletes the object stored at key and returns True, or False if it is not found
+        get_many(keys), set_many(objects, ttl=None), delete_many(keys):
+            the same for many keys, in one request, returning a dict by key
+    """
+    def __init__(self, url, timeout=5, pool_size=10):
+        """
+        Parameters:
+            url : str
+                The URL of the node, as http://host:port
+            timeout : float
+                The timeout of the requests in seconds
+            pool_size : int
+                The max number of idle connections kept
+        """
+        address = urlsplit(url)
+        self.url = url
+        self._pool = ConnectionPool(address.hostname, address.port or 80, pool_size, timeout)
+
+    def get(self, key):
+        status, body, _ = self._request('GET', object_path(key))
+        if status == 404:
+            return None
+        check_status(status, body, 200)
+        return json.loads(body)
+
+    def set(self, key, obj, ttl=None):
+        path = object_path(key) if ttl is None else f'{object_path(key)}?ttl={int(ttl)}'
+        status, body, _ = self._request('PUT', path, json.dumps(obj))
+        if status == 507:
+            return False
+        check_status(status, body, 200)
+        return True
+
+    def delete(self, key):
+        status, body, _ = self._request('DELETE', object_path(key))
+        if status == 404:
+            return False
+        check_status(status, body, 200)
+        return True
+
+    def get_many(self, keys):
+        results = self._batch('/objects/mget', {"keys": list(keys)})
+        return {
+            key: result.get('value') if result['status'] == 200 else None
+            for key, result in results.items()
+        }
+
+    def set_many(self, objects, ttl=None):
+        path = '/objects/mset' if ttl is None else f'/objects/mset?ttl={int(ttl)}'
+        results = self._batch(path, {"objects": objects})
+        return {key: result['status'] == 200 for key, result in results.items()}
+
+    def delete_many(self, keys):
+        results = self._batch('/objects/mdelete', {"keys": list(keys)})
+        return {key: result['status'] == 200 for key, result in results.items()}
+
+    def close(self):
+        """Closes the idle connections"""
+        self._pool.close()
+
+    # A private method sending a batch request and returning its results
+    def _batch(self, path, payload):
+        status, body, _ = self._request('POST', path, json.dumps(payload))
+        check_status(status, body, 200)
+        return json.loads(body)['results']
+
+    # A private method sending a request on a pooled connection and
+    # returning the status, the body and the headers of the response. A
+    # request failing on a connection closed by the node is sent again once
+    # on a new connection
+    def _request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            try:
+                with self._pool.connection(fresh=attempt > 0) as connection:
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    return response.status, response.read(), response.headers
+            except (http.client.HTTPException, OSError) as error:
+                if attempt:
+                    raise CacheClientError(f'{self.url} cannot be reached: {error}') from error
+
+
+class ClusterClient:
+    """A client of a cluster of cache nodes partitioned by consistent hashing
+
+    Every key is stored on one node, chosen on a HashRing of the node URLs,
+    so the cluster holds the sum of the capacities of its nodes. Adding or
+    removing a node moves about 1/N of the keys to other nodes, where they
+    are missing until they are set again. The batch operations send one
+    request per node.
+
+    It has the same methods as CacheClient, and:
+        add_node(url), remove_node(url):
+            adds or removes a node of the cluster
+        node(key):
+            returns the CacheClient of the node of key
+    """
+    def __init__(self, urls, vnodes=160, timeout=5):
+        """
+        Parameters:
+            urls : iterable of str
+                The URLs of the nodes
+            vnodes : int
+                The number of points of every node on the ring
+            timeout : float
+                The timeout of the requests in seconds
+        """
+        self._timeout = timeout
+        self._clients = {}
+        self._ring = HashRing(vnodes=vnodes)
+        for url in urls:
+            self.add_node(url)
+
+    @property
+    def nodes(self):
+        return self._ring.nodes
+
+    def add_node(self, url):
+        self._clients.setdefault(url, CacheClient(url, self._timeout))
+        self._ring.add_node(url)
+
+    def remove_node(self, url):
+        self._ring.remove_node(url)
+        client = self._clients.pop(url, None)
+        if client is not None:
+            client.close()
+
+    def node(self, key):
+        url = self._ring.get_node(key)
+        if url is None:
+            raise CacheClientError('the cluster has no node')
+        return self._clients[url]
+
+    def get(self, key):
+        return self.node(key).get(key)
+
+    def set(self, key, obj, ttl=None):
+        return self.node(key).set(key, obj, ttl)
+
+    def delete(self, key):
+        return self.node(key).delete(key)
+
+    def get_many(self, keys):
+        results = {}
+        for client, node_keys in self._group(keys).items():
+            results.update(client.get_many(node_keys))
+        return {key: results[key] for key in keys}
+
+    def set_many(self, objects, ttl=None):
+        results = {}
+        for client, node_keys in self._group(objects).items():
+            results.update(client.set_many({key: objects[key] for key in node_keys}, ttl))
+        return {key: results[key] for key in objects}
+
+    def delete_many(self, keys):
+        results = {}
+        for client, node_keys in self._group(keys).items():
+            results.update(client.delete_many(node_keys))
+        return {key: results[key] for key in keys}
+
+    # Groups keys by node, so every node gets one request
+    def _group(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.node(key), []).append(key)
+        return groups
+
+
+def object_path(key):
+    return f'/object/{quote(key, safe="")}'
+
+
+def check_status(status, body, expected):
+    if status != expected:
+        raise CacheClientError(f'unexpected status {status}: {body[:200]!r}')
@@ -0,0 +1,207 @@
+import http.client
+import json
+import socket
+import threading
+from collections import OrderedDict
+from time import monotonic
+from urllib.parse import urlsplit
+from .client import CacheClient, object_path, check_status
+
+
+class NearCacheClient(CacheClient):
+    """A CacheClient keeping local copies of the objects it reads (near cache)
+
+    The objects read with get are kept in a bounded local cache (L1), the
+    least recently used first evicted, until their remaining time to live on
+    the node, or max_ttl, is over. A background thread follows the
+    invalidation feed of the node (INVALIDATION_FEED_SIZE must be set) and
+    drops the copies of the keys changed by any client, so the copies are
+    at most as stale as the delay of the feed. An object is only kept if no
+    change of its key was received since the node read it. The local cache
+    is not used while the feed is not followed, and is emptied when the
+    feed is lost.
+
+    It has the same methods as CacheClient, and:
+        local_stats():
+            returns the number of hits and misses of the local cache and its
+            number of objects
+        stop():
+            stops following the feed and empties the local cache
+    """
+    def __init__(self, url, max_entries=10000, max_ttl=60, timeout=5, pool_size=10, poll_timeout=20):
+        """
+        Parameters:
+            url, timeout, pool_size :
+                See CacheClient
+            max_entries : int
+                The max number of objects of the local cache
+            max_ttl : float
+                The max number of seconds an object is kept locally
+            poll_timeout : float
+                The max number of seconds a request of the feed waits for a
+                change. A single-threaded node does not wait, and the
+                requests are sent every poll_interval seconds it returns
+        """
+        super().__init__(url, timeout, pool_size)
+        address = urlsplit(url)
+        self._address = (address.hostname, address.port or 80)
+        self._timeout = timeout
+        self._max_entries = max_entries
+        self._max_ttl = max_ttl
+        self._poll_timeout = poll_timeout
+        self._lock = threading.Lock()
+        # the objects, as (JSON bytes, deadline) by key
+        self._local = OrderedDict()
+        # the sequence numbers of the last changes of the recently changed
+        # keys, and the largest sequence number forgotten
+        self._changed = OrderedDict()
+        self._forgotten = 0
+        self._epoch = None
+        self._sequence = None
+        self._hits = self._misses = 0
+        self._stopped = threading.Event()
+        self._feed_connection = None
+        self._follower = threading.Thread(target=self._follow, name='cache-near-feed', daemon=True)
+        self._follower.start()
+
+    def get(self, key):
+        with self._lock:
+            following = self._sequence is not None
+            if following:
+                local = self._local.get(key)
+                if local is not None and monotonic() < local[1]:
+                    self._local.move_to_end(key)
+                    self._hits += 1
+                    return json.loads(local[0])
+                self._misses += 1
+            epoch = self._epoch
+        status, body, headers = self._request('GET', object_path(key))
+        if status == 404:
+            return None
+        check_status(status, body, 200)
+        sequence = headers.get('X-Cache-Sequence')
+        if following and sequence is not None:
+            self._keep(key, body, headers.get('X-Cache-TTL'), int(sequence), epoch)
+        return json.loads(body)
+
+    def get_many(self, keys):
+        results = {}
+        with self._lock:
+            if self._sequence is not None:
+                now = monotonic()
+                for key in keys:
+                    local = self._local.get(key)
+                    if local is not None and now < local[1]:
+                        self._local.move_to_end(key)
+                        results[key] = local[0]
+                self._hits += len(results)
+                self._misses += len(keys) - len(results)
+        results = {key: json.loads(body) for key, body in results.items()}
+        missing = [key for key in keys if key not in results]
+        if missing:
+            results.update(super().get_many(missing))
+        return {key: results[key] for key in keys}
+
+    def set(self, key, obj, ttl=None):
+        self._drop([key])
+        return super().set(key, obj, ttl)
+
+    def delete(self, key):
+        self._drop([key])
+        return super().delete(key)
+
+    def set_many(self, objects, ttl=None):
+        self._drop(objects)
+        return super().set_many(objects, ttl)
+
+    def delete_many(self, keys):
+        self._drop(keys)
+        return super().delete_many(keys)
+
+    def local_stats(self):
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'entries': len(self._local)}
+
+    def stop(self):
+        self._stopped.set()
+        connection = self._feed_connection
+        if connection is not None and connection.sock is not None:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._follower.join()
+        self._reset(None, None)
+
+    # A private method keeping a copy of the object of key read at the
+    # sequence number of the feed sequence, unless the key changed since
+    def _keep(self, key, body, ttl, sequence, epoch):
+        ttl = min(float(ttl), self._max_ttl) if ttl is not None else self._max_ttl
+        with self._lock:
+            if self._epoch != epoch or self._sequence is None:
+                return
+            if self._changed.get(key, self._forgotten) > sequence:
+                return
+            self._local[key] = (body, monotonic() + ttl)
+            self._local.move_to_end(key)
+            if len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    # A private method dropping the copies of keys written by this client
+    def _drop(self, keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    # A private method emptying the local cache when the feed starts over
+    def _reset(self, epoch, sequence):
+        with self._lock:
+            self._local.clear()
+            self._changed.clear()
+            self._forgotten = 0
+            self._epoch = epoch
+            self._sequence = sequence
+
+    # A private method applying the changes of the feed after after
+    def _apply(self, after, sequence, keys):
+        with self._lock:
+            for offset, key in enumerate(keys):
+                self._local.pop(key, None)
+                self._changed[key] = after + 1 + offset
+                self._changed.move_to_end(key)
+            while len(self._changed) > self._max_entries:
+                _, forgotten = self._changed.popitem(last=False)
+                self._forgotten = max(self._forgotten, forgotten)
+            self._sequence = sequence
+
+    # The loop of the thread following the feed with long polling requests
+    # on a connection of its own
+    def _follow(self):
+        while not self._stopped.is_set():
+            connection = http.client.HTTPConnection(
+                *self._address, timeout=self._poll_timeout + self._timeout
+            )
+            self._feed_connection = connection
+            try:
+                while not self._stopped.is_set():
+                    after = self._sequence
+                    path = '/invalidations' if after is None else (
+                        f'/invalidations?after={after}&timeout={self._poll_timeout}'
+                    )
+                    connection.request('GET', path)
+                    response = connection.getresponse()
+                    body = response.read()
+                    check_status(response.status, body, 200)
+                    feed = json.loads(body)
+                    if after is None or feed['epoch'] != self._epoch or feed.get('reset'):
+                        self._reset(feed['epoch'], feed['sequence'])
+                    else:
+                        self._apply(after, feed['sequence'], feed['keys'])
+                    if 'poll_interval' in feed:
+                        self._stopped.wait(feed['poll_interval'])
+            except Exception:
+                # the copies cannot be kept without the feed
+                self._reset(None, None)
+                self._stopped.wait(1)
+            finally:
+                connection.close()
@@ -0,0 +1,62 @@
+import http.client
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """A pool of kept alive HTTP connections to one node
+
+    A connection is taken from the pool for one request and given back
+    after it, so a few connections serve many threads. The last connection
+    given back is the first taken, so the idle ones are closed by the node
+    first. At most size idle connections are kept, the others are closed.
+
+    Methods:
+        connection(fresh=False):
+            a context manager lending a connection, a new one if fresh is
+            True. The connection is closed instead of given back if the
+            block raises an exception
+        close():
+            closes the idle connections
+    """
+    def __init__(self, host, port, size=10, timeout=5):
+        """
+        Parameters:
+            host, port : str, int
+                The address of the node
+            size : int
+                The max number of idle connections kept
+            timeout : float
+                The timeout of the requests in seconds
+        """
+        self._host = host
+        self._port = port
+        self._size = size
+        self._timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, fresh=False):
+        connection = None
+        if not fresh:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
@@ -0,0 +1,64 @@
+from bisect import bisect, insort
+from hashlib import blake2b
+
+
+def ring_hash(value):
+    """Returns the position of a string on the ring, a 64 bits integer"""
+    return int.from_bytes(blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """A consistent-hash ring mapping keys to nodes
+
+    Every node is placed on the ring at a number of points (virtual nodes),
+    and a key belongs to the node of the first point after the hash of the
+    key. Adding or removing one of N nodes only moves the keys of its
+    points, about 1/N of the keys, and the virtual nodes spread the keys
+    evenly between the nodes.
+
+    Methods:
+        add_node(node), remove_node(node):
+            adds or removes a node of the ring
+        get_node(key):
+            returns the node of key
+    """
+    def __init__(self, nodes=(), vnodes=160):
+        """
+        Parameters:
+            nodes : iterable of str
+                The nodes of the ring
+            vnodes : int
+                The number of points of every node on the ring
+        """
+        self.vnodes = vnodes
+        self._points = []
+        self._nodes = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self):
+        return list(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add_node(self, node):
+        if node in self._nodes:
+            return
+        points = [(ring_hash(f'{node}#{i}'), node) for i in range(self.vnodes)]
+        self._nodes[node] = points
+        for point in points:
+            insort(self._points, point)
+
+    def remove_node(self, node):
+        points = set(self._nodes.pop(node, ()))
+        if points:
+            self._points = [point for point in self._points if point not in points]
+
+    def get_node(self, key):
+        """Returns the node of key, or None if the ring is empty"""
+        if not self._points:
+            return None
+        index = bisect(self._points, (ring_hash(key),))
+        return self._points[index % len(self._points)][1]
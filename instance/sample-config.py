@@ -2,7 +2,79 @@ class Config(object):
     """Parent configuration class."""
     DEBUG = False
     NUMBER_OF_SLOTS = 10
+    # The max number of bytes used by the cached entries, with their keys,
+    # objects and bookkeeping, 0 means only the number of slots is limited
+    MAX_BYTES = 0
+    # The number of lock-striped segments of the cache. Use more than 1
+    # segment when gunicorn serves requests from many threads
+    CACHE_SEGMENTS = 1
+    # The path of a file, ideally in /dev/shm, holding a cache shared by
+    # all the gunicorn workers. MAX_BYTES is the size of its arena (64 MB
+    # if it is 0). An empty path keeps the cache in the process memory
+    SHARED_MEMORY_PATH = ''
+    # Values of COMPRESSION_THRESHOLD bytes or more are stored compressed
+    # with COMPRESSION_CODEC, one of gzip, zlib, lzma or zstd (if the
+    # zstandard package is installed). 0 disables compression. It is not
+    # supported with SHARED_MEMORY_PATH
+    COMPRESSION_THRESHOLD = 0
+    COMPRESSION_CODEC = 'gzip'
+    # The loaders of the keys missing from the cache, by key prefix, as
+    # 'module:function' paths. A function is called with the key and returns
+    # the JSON document to cache or None. Concurrent misses of a key make a
+    # single call. Expired entries are kept STALE_GRACE more seconds and
+    # served while they are reloaded in the background
+    READ_THROUGH_LOADERS = {}
+    STALE_GRACE = 0
+    # The path of the snapshot of the cache, written every SNAPSHOT_INTERVAL
+    # seconds and on exit, and loaded on start. An empty path disables it
+    SNAPSHOT_PATH = ''
+    SNAPSHOT_INTERVAL = 300
+    # The path of a log of the changes of the cache, replayed on start. It is
+    # synced at most every AOF_FSYNC_INTERVAL seconds (0 syncs every batch of
+    # changes) and rewritten from the cache when it doubles in size beyond
+    # AOF_COMPACT_MIN_SIZE bytes. An empty path disables it. It is not
+    # supported with SHARED_MEMORY_PATH
+    AOF_PATH = ''
+    AOF_FSYNC_INTERVAL = 1
+    AOF_COMPACT_MIN_SIZE = 64 * 1024 * 1024
+    # Whether the keys are indexed by prefix, so the prefix scans and
+    # invalidations visit the matching keys only. It slows down the inserts
+    PREFIX_INDEX = False
+    # The number of changed keys kept for the invalidation feed of the
+    # near-caching clients, 0 disables it. It is not supported with
+    # SHARED_MEMORY_PATH. The clients only wait for the changes (long
+    # polling) on servers with more than 1 thread, and poll every second
+    # otherwise
+    INVALIDATION_FEED_SIZE = 0
+    # The port of the Redis protocol (RESP) listener, 0 disables it
+    RESP_HOST = '0.0.0.0'
+    RESP_PORT = 0
+    # The port streaming the changes of the cache to the replicas, 0
+    # disables it. It is not supported with SHARED_MEMORY_PATH
+    REPLICATION_HOST = '0.0.0.0'
+    REPLICATION_PORT = 0
+    # The host:port of the REPLICATION_PORT of a primary, to run as a
+    # read-only replica of it. An empty string disables it
+    REPLICA_OF = ''
     TIME_TO_LIVE = 60 
+    # Whether reading an entry restarts its time to live, so entries expire
+    # TIME_TO_LIVE seconds after their last read. It is not supported with
+    # SHARED_MEMORY_PATH
+    SLIDING_EXPIRATION = False
+    # The max fraction of the time to live removed at random from each
+    # entry, so entries written together do not expire together
+    TTL_JITTER = 0
+    # The beta of the early refresh (XFetch) of the entries close to their
+    # expiry, by the loaders and by the clients reading the X-Cache-Refresh
+    # header. 0 disables it, 1 is the usual value
+    XFETCH_BETA = 0
+    # Background reclaiming of expired entries. The sweeper runs every
+    # EXPIRY_SWEEP_INTERVAL seconds (0 disables it) and removes at most
+    # EXPIRY_SWEEP_SAMPLES entries per cycle within EXPIRY_SWEEP_BUDGET_MS
+    EXPIRY_SWEEP_INTERVAL = 0
+    EXPIRY_SWEEP_SAMPLES = 20
+    EXPIRY_SWEEP_BUDGET_MS = 5
+    # One of REJECT, OLDEST_FIRST, NEWEST_FIRST, LRU, LFU, W_TINYLFU
     EVICTION_POLICY = 'REJECT'
 
 class DevelopmentConfig(Config):
@@ -22,14 +94,21 @@ class TestingNewesFirstConfig(TestingConfig):
     """Configurations for Testing."""
     EVICTION_POLICY = 'NEWEST_FIRST'
 
+class TestingClusterConfig(TestingConfig):
+    """Configurations for Testing the nodes of a cluster."""
+    NUMBER_OF_SLOTS = 1000
+    INVALIDATION_FEED_SIZE = 1000
+
 class ProductionConfig(Config):
     """Configurations for Production."""
     TESTING = False
+    EXPIRY_SWEEP_INTERVAL = 1
 
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'testing-oldest-first': TestingOldesFirstConfig,
     'testing-newest-first': TestingNewesFirstConfig,
+    'testing-cluster': TestingClusterConfig,
     'production': ProductionConfig,
 }
@@ -0,0 +1,115 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+from contextlib import contextmanager
+from time import sleep, monotonic
+import pytest
+from api.aio import AsyncCacheServer, check_config
+from api.cache import EvictionStrategies, Cache, ReadThroughCache
+
+
+@contextmanager
+def serving(cache):
+    loop = asyncio.new_event_loop()
+    server = AsyncCacheServer(cache)
+    listener = loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield listener.sockets[0].getsockname()[1]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        listener.close()
+        loop.run_until_complete(cancel_connections())
+        loop.close()
+
+@pytest.fixture
+def port():
+    with serving(Cache(2, 60, EvictionStrategies.REJECT)) as port:
+        yield port
+
+async def cancel_connections():
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def request(connection, method, path, obj=None):
+    body = json.dumps(obj) if obj is not None else None
+    connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+    rv = connection.getresponse()
+    return rv.status, json.loads(rv.read())
+
+def test_object_api(port):
+    # every request goes through the same kept alive connection
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    assert request(connection, 'POST', '/object/key_a', {"data": "Hello"}) == (200, {"message": "success"})
+    assert request(connection, 'GET', '/object/key_a') == (200, {"data": "Hello"})
+    assert request(connection, 'PUT', '/object/key_a?ttl=5', {"data": "Howdy!"}) == (200, {"message": "success"})
+    assert request(connection, 'GET', '/object/key_a') == (200, {"data": "Howdy!"})
+    assert request(connection, 'DELETE', '/object/key_a') == (200, {"message": "success"})
+    assert request(connection, 'GET', '/object/key_a') == (404, {"message": "Object at key_a is not found or expired"})
+    assert request(connection, 'DELETE', '/object/key_a') == (404, {"message": "Object at key_a is not found or expired"})
+    connection.close()
+
+def test_no_storage(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    request(connection, 'POST', '/object/key_a', 1)
+    request(connection, 'POST', '/object/key_b', 2)
+    assert request(connection, 'POST', '/object/key_c', 3) == (507, {"message": "The server has no storage"})
+    connection.close()
+
+def test_bad_requests(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    assert request(connection, 'POST', '/object/key_a?ttl=abc', 1)[0] == 400
+    connection.request('POST', '/object/key_a', body='{not json')
+    rv = connection.getresponse()
+    rv.read()
+    assert rv.status == 400
+    assert request(connection, 'GET', '/unknown')[0] == 404
+    assert request(connection, 'PATCH', '/object/key_a', 1)[0] == 405
+    connection.close()
+
+def test_pipelined_requests(port):
+    body = b'{"data": "Hello"}'
+    requests = (
+        b'POST /object/key_a HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body) +
+        b'GET /object/key_a HTTP/1.1\r\n\r\n' +
+        b'GET /object/key_b HTTP/1.1\r\nConnection: close\r\n\r\n'
+    )
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(requests)
+        data = b''
+        while chunk := sock.recv(65536):
+            data += chunk
+    responses = data.split(b'HTTP/1.1 ')[1:]
+    assert [r.split(b' ', 1)[0] for r in responses] == [b'200', b'200', b'404']
+    assert responses[1].endswith(body)
+
+def test_check_config():
+    check_config({'NUMBER_OF_SLOTS': 10, 'REPLICATION_PORT': 0})
+    with pytest.raises(ValueError):
+        check_config({'REPLICA_OF': '127.0.0.1:6380'})
+    with pytest.raises(ValueError):
+        check_config({'INVALIDATION_FEED_SIZE': 1000})
+
+def test_loads_do_not_block_the_loop():
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT))
+    cache.add_loader('slow_', lambda key: sleep(1) or '{"data": "loaded"}')
+    with serving(cache) as port:
+        loading = http.client.HTTPConnection('127.0.0.1', port)
+        loading.request('GET', '/object/slow_a')
+        sleep(0.1)
+        # the other connections are served while the origin is called
+        started = monotonic()
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        assert request(connection, 'POST', '/object/key_a', 1) == (200, {"message": "success"})
+        assert request(connection, 'GET', '/object/key_a') == (200, 1)
+        assert monotonic() - started < 0.5
+        rv = loading.getresponse()
+        assert (rv.status, json.loads(rv.read())) == (200, {"data": "loaded"})
+        loading.close()
+        connection.close()
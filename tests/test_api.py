@@ -1,7 +1,9 @@
 
+import gzip
+import json
 import pytest
-from time import sleep
-from api import create_app
+from time import sleep, monotonic
+from api import create_app, create_cache
 
 
 @pytest.fixture
@@ -110,4 +112,240 @@ def test_newest_first_policy(oldest_first_client):
     assert rv.status_code == 200
 
     rv = client.get('/object/key_a')
-    assert rv.status_code == 404
\ No newline at end of file
+    assert rv.status_code == 404
+
+def test_set_invalid_json(client):
+    rv = client.post("/object/key_a", data="{not json", content_type="application/json")
+    assert rv.status_code == 400
+
+    rv = client.get("/object/key_a")
+    assert rv.status_code == 404
+
+def test_get_returns_raw_json(client):
+    client.post("/object/key_a", data='{"data": [1, 2]}', content_type="application/json")
+    rv = client.get("/object/key_a")
+    assert rv.status_code == 200
+    assert rv.mimetype == "application/json"
+    assert rv.data == b'{"data": [1, 2]}'
+
+def test_batch_set_get_delete(client):
+    rv = client.post("/objects/mset", json={"objects": {"key_a": {"data": "a"}, "key_b": [1, 2]}})
+    assert rv.status_code == 200
+    assert rv.get_json() == {"results": {"key_a": {"status": 200}, "key_b": {"status": 200}}}
+
+    rv = client.post("/objects/mget", json={"keys": ["key_a", "key_b", "key_c"]})
+    assert rv.status_code == 200
+    assert rv.get_json() == {"results": {
+        "key_a": {"status": 200, "value": {"data": "a"}},
+        "key_b": {"status": 200, "value": [1, 2]},
+        "key_c": {"status": 404},
+    }}
+
+    rv = client.post("/objects/mdelete", json={"keys": ["key_a", "key_c"]})
+    assert rv.status_code == 200
+    assert rv.get_json() == {"results": {"key_a": {"status": 200}, "key_c": {"status": 404}}}
+
+def test_batch_set_no_storage(client):
+    rv = client.post("/objects/mset", json={"objects": {"key_a": 1, "key_b": 2, "key_c": 3}})
+    assert rv.get_json()["results"]["key_c"] == {"status": 507}
+
+def test_batch_invalid_body(client):
+    rv = client.post("/objects/mget", json={"keys": "key_a"})
+    assert rv.status_code == 400
+    rv = client.post("/objects/mdelete", data="{", content_type="application/json")
+    assert rv.status_code == 400
+
+def test_compressed_get(client):
+    from api.api import CacheApi
+    from api.cache import Cache, EvictionStrategies
+    CacheApi.initialize_cache(Cache(2, 60, EvictionStrategies.REJECT, compression_threshold=100))
+    obj = {"data": ["hello"] * 1000}
+    set_entry(client, 'key_a', obj)
+
+    rv = client.get("/object/key_a")
+    assert rv.headers.get('Content-Encoding') is None
+    assert rv.get_json() == obj
+
+    rv = client.get("/object/key_a", headers={'Accept-Encoding': 'gzip, deflate'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in rv.headers['Vary']
+    assert json.loads(gzip.decompress(rv.data)) == obj
+
+def test_conditional_get(client):
+    set_entry(client, 'key_a', {"data": "Hello"})
+    rv = client.get("/object/key_a")
+    etag = rv.headers['ETag']
+
+    rv = client.get("/object/key_a", headers={'If-None-Match': etag})
+    assert rv.status_code == 304
+    assert rv.data == b''
+    rv = client.get("/object/key_a", headers={'If-None-Match': '"0000000000000000"'})
+    assert rv.status_code == 200
+
+    set_entry(client, 'key_a', {"data": "Howdy!"})
+    rv = client.get("/object/key_a", headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] != etag
+
+def test_compare_and_set(client):
+    set_entry(client, 'key_a', {"data": "Hello"})
+    etag = client.get("/object/key_a").headers['ETag']
+
+    rv = client.put("/object/key_a", json={"data": "Howdy!"}, headers={'If-Match': etag})
+    assert rv.status_code == 200
+    rv = client.put("/object/key_a", json={"data": "Hey"}, headers={'If-Match': etag})
+    assert rv.status_code == 412
+    assert client.get("/object/key_a").get_json() == {"data": "Howdy!"}
+    rv = client.put("/object/key_b", json={"data": "Hey"}, headers={'If-Match': '*'})
+    assert rv.status_code == 412
+
+def test_refresh_hint(client):
+    from api.api import CacheApi
+    CacheApi.refresh_beta = 1
+    try:
+        client.post("/object/key_a?ttl=1&delta=100", json={"data": "Hello"})
+        client.post("/object/key_b?ttl=100", json={"data": "Hello"})
+        hints = [client.get("/object/key_a").headers.get('X-Cache-Refresh') for _ in range(20)]
+        assert hints.count('1') > 10
+        assert client.get("/object/key_b").headers.get('X-Cache-Refresh') is None
+    finally:
+        CacheApi.refresh_beta = 0
+
+def test_metrics(client):
+    set_entry(client, 'key_a', {"data": "Hello"})
+    client.get("/object/key_a")
+    client.get("/object/key_b")
+    rv = client.get("/metrics")
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/plain'
+    lines = rv.data.decode('utf-8').splitlines()
+    assert 'cache_hits_total 1' in lines
+    assert 'cache_misses_total 1' in lines
+    assert 'cache_entries 1' in lines
+    assert 'cache_compressed_values_total 0' in lines
+    assert any(line.startswith('cache_http_responses_total{handler="get",status="404"}') for line in lines)
+    assert any(line.startswith('cache_http_request_duration_seconds_bucket{handler="post",le="+Inf"}') for line in lines)
+
+def test_read_only_replica(client):
+    from api.api import CacheApi
+    set_entry(client, 'key_a', {"data": "Hello"})
+    CacheApi.read_only = True
+    try:
+        assert set_entry(client, 'key_b', {"data": "Hello"}).status_code == 403
+        assert client.delete("/object/key_a").status_code == 403
+        assert client.post("/objects/mset", json={"objects": {"key_b": 1}}).status_code == 403
+        assert client.post("/objects/mdelete", json={"keys": ["key_a"]}).status_code == 403
+        assert client.get("/object/key_a").status_code == 200
+    finally:
+        CacheApi.read_only = False
+    assert client.get("/replication").get_json() == {"role": "none"}
+
+def test_tags_and_prefix_invalidation(client):
+    client.post("/object/tenant_1:a?tags=tenant_1,users", json={"data": "a"})
+    client.put("/object/tenant_1:b?tags=tenant_1", json={"data": "b"})
+    rv = client.post("/objects/invalidate", json={"tags": ["tenant_1"]})
+    assert rv.get_json() == {"deleted": 2}
+    assert client.get("/object/tenant_1:a").status_code == 404
+    client.post("/objects/mset?tags=tenant_2", json={"objects": {"tenant_2:a": 1}})
+    rv = client.post("/objects/invalidate", json={"prefixes": ["tenant_2:"]})
+    assert rv.get_json() == {"deleted": 1}
+    assert client.post("/objects/invalidate", json={"tags": "tenant_1"}).status_code == 400
+
+def test_body_fields_are_not_parameters(client):
+    document = {"tags": "tenant_1", "delta": 5, "ttl": 1}
+    client.post("/object/key_a", json=document)
+    client.post("/objects/mset", json={"objects": {"key_b": 1}, "tags": "tenant_1", "ttl": 1})
+    rv = client.get("/object/key_a")
+    assert rv.get_json() == document
+    assert float(rv.headers['X-Cache-TTL']) > 1
+    assert 'X-Cache-Refresh' not in rv.headers
+    rv = client.post("/objects/invalidate", json={"tags": ["tenant_1"]})
+    assert rv.get_json() == {"deleted": 0}
+    assert client.get("/object/key_b").get_json() == 1
+
+def test_prefix_scan(client):
+    client.post("/object/key_a", json={"data": "a"})
+    client.post("/object/key_b", json={"data": "b"})
+    rv = client.get("/objects/scan?prefix=key_&count=1")
+    assert rv.get_json() == {"keys": ["key_a"], "cursor": "key_a"}
+    rv = client.get("/objects/scan?prefix=key_&count=1&cursor=key_a")
+    assert rv.get_json() == {"keys": ["key_b"], "cursor": "key_b"}
+    rv = client.get("/objects/scan?prefix=key_&count=1&cursor=key_b")
+    assert rv.get_json() == {"keys": [], "cursor": None}
+
+def test_ttl_header_and_invalidation_feed(client):
+    from api.api import CacheApi
+    from api.cache.feed import InvalidationFeed
+    assert client.get("/invalidations").status_code == 404
+    set_entry(client, 'key_a', {"data": "Hello"}, ttl=30)
+    rv = client.get("/object/key_a")
+    assert 29 < float(rv.headers['X-Cache-TTL']) <= 30
+    assert 'X-Cache-Sequence' not in rv.headers
+
+    CacheApi.feed = InvalidationFeed(CacheApi.cache)
+    CacheApi.feed.start()
+    try:
+        rv = client.get("/invalidations").get_json()
+        assert rv['sequence'] == 0 and rv['keys'] == []
+        epoch = rv['epoch']
+        client.delete("/object/key_a")
+        set_entry(client, 'key_b', {"data": "Hello"})
+        assert client.get("/object/key_b").headers['X-Cache-Sequence'] == '2'
+        threaded = {'wsgi.multithread': True}
+        rv = client.get("/invalidations?after=0&timeout=1", environ_overrides=threaded).get_json()
+        assert rv == {"epoch": epoch, "sequence": 2, "keys": ["key_a", "key_b"]}
+        rv = client.get("/invalidations?after=5", environ_overrides=threaded).get_json()
+        assert rv == {"epoch": epoch, "sequence": 2, "reset": True}
+
+        # a single-threaded server does not wait and sets the poll interval
+        started = monotonic()
+        rv = client.get("/invalidations?after=2&timeout=5").get_json()
+        assert monotonic() - started < 1
+        assert rv == {"epoch": epoch, "sequence": 2, "keys": [], "poll_interval": 1}
+    finally:
+        CacheApi.feed.stop()
+        CacheApi.feed = None
+
+def test_ttl_touch_and_expire(client):
+    set_entry(client, 'key_a', {"data": "Hello"}, ttl=1)
+    assert 0 < client.get("/object/key_a/ttl").get_json()['ttl'] <= 1
+    assert client.put("/object/key_a/ttl?ttl=100").status_code == 200
+    assert 99 < client.get("/object/key_a/ttl").get_json()['ttl'] <= 100
+    assert client.put("/object/key_a/ttl?ttl=0").status_code == 200
+    assert client.get("/object/key_a/ttl").get_json() == {"ttl": None}
+    assert client.put("/object/key_a/ttl").status_code == 400
+    assert client.put("/object/key_a/ttl?ttl=-1").status_code == 400
+    assert client.post("/object/key_a/touch").status_code == 200
+    assert client.get("/object/key_a").get_json() == {"data": "Hello"}
+    assert client.get("/object/key_b/ttl").status_code == 404
+    assert client.post("/object/key_b/touch").status_code == 404
+    assert client.put("/object/key_b/ttl?ttl=10").status_code == 404
+
+def test_shared_memory_rejects_observer_options(tmp_path):
+    config = {
+        'NUMBER_OF_SLOTS': 10, 'TIME_TO_LIVE': 60, 'EVICTION_POLICY': 'REJECT',
+        'SHARED_MEMORY_PATH': str(tmp_path / 'cache'),
+    }
+    for option in (
+        'AOF_PATH', 'REPLICATION_PORT', 'INVALIDATION_FEED_SIZE', 'COMPRESSION_THRESHOLD',
+        'STALE_GRACE', 'TTL_JITTER', 'PREFIX_INDEX', 'SLIDING_EXPIRATION',
+    ):
+        with pytest.raises(ValueError):
+            create_cache(dict(config, **{option: 1}))
+    with pytest.raises(ValueError):
+        create_cache(dict(config, CACHE_SEGMENTS=4))
+    create_cache(dict(config, CACHE_SEGMENTS=1, STALE_GRACE=0)).close()
+
+def test_tags_on_a_shared_memory_cache(client, tmp_path):
+    from api.api import CacheApi
+    from api.cache import SharedMemoryCache
+    cache = CacheApi.cache
+    CacheApi.cache = SharedMemoryCache(str(tmp_path / 'cache'), 10, 60)
+    try:
+        assert client.post("/object/key_a?tags=tenant_1", json=1).status_code == 400
+        assert client.post("/objects/mset?tags=tenant_1", json={"objects": {"key_a": 1}}).status_code == 400
+        assert client.post("/objects/invalidate", json={"tags": ["tenant_1"]}).status_code == 400
+        assert client.post("/object/key_a", json=1).status_code == 200
+    finally:
+        CacheApi.cache.close()
+        CacheApi.cache = cache
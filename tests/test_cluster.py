@@ -0,0 +1,180 @@
+import os
+import socket
+import subprocess
+import sys
+from time import sleep, monotonic
+import pytest
+from cache_client import HashRing, CacheClient, ClusterClient, NearCacheClient
+
+# Serves the app on a port with the testing-cluster config, which has a
+# cache large enough for the tests and an invalidation feed, with a thread
+# by request or with a single thread
+NODE_SCRIPT = """
+import sys
+from werkzeug.serving import run_simple
+from api import create_app
+app = create_app('testing-cluster')
+run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=sys.argv[2] == 'threaded')
+"""
+
+def start_node(port, threading):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, '-c', NODE_SCRIPT, str(port), threading], cwd=root,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def free_port():
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        return listener.getsockname()[1]
+
+def wait_until(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, 'timed out'
+        sleep(0.01)
+
+def wait_for_port(port, timeout=30):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise RuntimeError(f'the node on port {port} did not start')
+
+@pytest.fixture(scope='module')
+def nodes():
+    ports = [free_port() for _ in range(3)]
+    processes = [start_node(port, 'threaded') for port in ports]
+    try:
+        for port in ports:
+            wait_for_port(port)
+        yield [f'http://127.0.0.1:{port}' for port in ports]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+def test_ring_balance():
+    ring = HashRing([f'node_{i}' for i in range(4)])
+    keys = [f'key_{i}' for i in range(20000)]
+    counts = {}
+    for key in keys:
+        node = ring.get_node(key)
+        counts[node] = counts.get(node, 0) + 1
+    assert all(0.2 < count / len(keys) < 0.3 for count in counts.values())
+
+def test_ring_moves_one_nth_of_the_keys():
+    ring = HashRing([f'node_{i}' for i in range(4)])
+    keys = [f'key_{i}' for i in range(20000)]
+    before = {key: ring.get_node(key) for key in keys}
+
+    ring.add_node('node_4')
+    moved = [key for key in keys if ring.get_node(key) != before[key]]
+    assert 0.15 < len(moved) / len(keys) < 0.25
+    # the moved keys all go to the new node
+    assert all(ring.get_node(key) == 'node_4' for key in moved)
+
+    ring.remove_node('node_4')
+    assert all(ring.get_node(key) == before[key] for key in keys)
+    ring.remove_node('node_0')
+    moved = [key for key in keys if ring.get_node(key) != before[key]]
+    assert all(before[key] == 'node_0' for key in moved)
+
+def test_cluster_client(nodes):
+    cluster = ClusterClient(nodes)
+    keys = [f'key_{i}' for i in range(30)]
+    for key in keys:
+        assert cluster.set(key, {"data": key}) == True
+    for key in keys:
+        assert cluster.get(key) == {"data": key}
+    # every key is stored on its node only
+    for url in nodes:
+        client = CacheClient(url)
+        for key in keys:
+            expected = {"data": key} if cluster.node(key).url == url else None
+            assert client.get(key) == expected
+    assert len({cluster.node(key).url for key in keys}) == 3
+
+    assert cluster.delete('key_0') == True
+    assert cluster.delete('key_0') == False
+    assert cluster.get('key_0') is None
+
+def test_cluster_batch_operations(nodes):
+    cluster = ClusterClient(nodes)
+    objects = {f'batch_{i}': {"value": i} for i in range(20)}
+    assert cluster.set_many(objects, ttl=30) == {key: True for key in objects}
+    rv = cluster.get_many(list(objects) + ['missing'])
+    assert rv == dict(objects, missing=None)
+    assert cluster.delete_many(['batch_0', 'missing']) == {'batch_0': True, 'missing': False}
+
+def test_cluster_add_node(nodes):
+    cluster = ClusterClient(nodes[:2])
+    keys = [f'grow_{i}' for i in range(60)]
+    cluster.set_many({key: 1 for key in keys})
+    cluster.add_node(nodes[2])
+    found = cluster.get_many(keys)
+    # only the keys moved to the new node are missing
+    missing = [key for key in keys if found[key] is None]
+    assert all(cluster.node(key).url == nodes[2] for key in missing)
+    assert 0 < len(missing) < len(keys) / 2
+
+def test_near_cache_client(nodes):
+    near = NearCacheClient(nodes[0], max_entries=2, poll_timeout=1)
+    other = CacheClient(nodes[0])
+    try:
+        wait_until(lambda: near._sequence is not None)
+        near.set('near_a', {"data": "a"})
+        assert near.get('near_a') == {"data": "a"}
+        assert near.get('near_a') == {"data": "a"}
+        assert near.local_stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+        # a change by another client drops the local copy
+        other.set('near_a', {"data": "b"})
+        wait_until(lambda: near.get('near_a') == {"data": "b"})
+        other.delete('near_a')
+        wait_until(lambda: near.get('near_a') is None)
+
+        # the copies expire with the objects
+        near.set('near_b', {"data": "b"}, ttl=1)
+        assert near.get('near_b') == {"data": "b"}
+        assert near.get_many(['near_b', 'near_c']) == {'near_b': {"data": "b"}, 'near_c': None}
+        sleep(1.1)
+        assert near.get('near_b') is None
+
+        # the least recently used copies are evicted
+        near.set_many({f'near_{i}': i for i in range(3)})
+        assert [near.get(f'near_{i}') for i in range(3)] == [0, 1, 2]
+        assert near.local_stats()['entries'] == 2
+    finally:
+        near.stop()
+    assert near.local_stats()['entries'] == 0
+
+def test_near_cache_client_on_a_single_thread():
+    port = free_port()
+    process = start_node(port, 'single')
+    try:
+        wait_for_port(port)
+        url = f'http://127.0.0.1:{port}'
+        near = NearCacheClient(url, poll_timeout=20)
+        other = CacheClient(url, timeout=2)
+        try:
+            wait_until(lambda: near._sequence is not None)
+            # the feed does not hold the only thread of the server, so the
+            # other requests are served and the changes arrive every second
+            started = monotonic()
+            for i in range(5):
+                other.set('single_a', i)
+            assert monotonic() - started < 2
+            near.set('single_a', {"data": "a"})
+            assert near.get('single_a') == {"data": "a"}
+            other.set('single_a', {"data": "b"})
+            wait_until(lambda: near.get('single_a') == {"data": "b"})
+        finally:
+            near.stop()
+    finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,110 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+from time import sleep, monotonic
+import pytest
+from cache_client import CacheClient, CacheClientError
+
+# Serves the app on a port with the testing-cluster config, as a primary
+# streaming its changes on a replication port or as a replica of a primary
+NODE_SCRIPT = """
+import sys
+from werkzeug.serving import run_simple
+from api import create_app
+from instance.config import config
+config['testing-cluster'].REPLICATION_HOST = '127.0.0.1'
+config['testing-cluster'].REPLICATION_PORT = int(sys.argv[2])
+config['testing-cluster'].REPLICA_OF = sys.argv[3]
+app = create_app('testing-cluster')
+run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)
+"""
+
+def free_port():
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        return listener.getsockname()[1]
+
+def wait_until(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, 'timed out'
+        sleep(0.01)
+
+def wait_for_port(port, timeout=30):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise RuntimeError(f'the node on port {port} did not start')
+
+def request(port, method, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        connection.request(method, path)
+        rv = connection.getresponse()
+        return rv.status, json.loads(rv.read())
+    finally:
+        connection.close()
+
+@pytest.fixture(scope='module')
+def nodes():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    primary_port, replica_port, replication_port = free_port(), free_port(), free_port()
+    arguments = [
+        (primary_port, replication_port, ''),
+        (replica_port, 0, f'127.0.0.1:{replication_port}'),
+    ]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-c', NODE_SCRIPT, *map(str, node_arguments)], cwd=root,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for node_arguments in arguments
+    ]
+    try:
+        wait_for_port(primary_port)
+        wait_for_port(replica_port)
+        wait_until(lambda: request(replica_port, 'GET', '/replication')[1]['synced'], timeout=30)
+        yield primary_port, replica_port
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+def test_replica_applies_the_changes(nodes):
+    primary_port, replica_port = nodes
+    primary = CacheClient(f'http://127.0.0.1:{primary_port}')
+    replica = CacheClient(f'http://127.0.0.1:{replica_port}')
+    primary.set('key_a', {"data": "a"}, ttl=30)
+    primary.set('key_b', {"data": "b"})
+    wait_until(lambda: replica.get('key_a') == {"data": "a"})
+    primary.delete('key_b')
+    assert request(primary_port, 'PUT', '/object/key_a/ttl?ttl=0')[0] == 200
+    wait_until(lambda: replica.get('key_b') is None)
+    wait_until(lambda: request(replica_port, 'GET', '/object/key_a/ttl')[1]['ttl'] is None)
+
+    with pytest.raises(CacheClientError):
+        replica.set('key_c', 1)
+
+def test_replica_lag(nodes):
+    primary_port, replica_port = nodes
+    primary = CacheClient(f'http://127.0.0.1:{primary_port}')
+    primary.set_many({f'lag_{i}': i for i in range(100)})
+    # the lag is measured on the primary, and is gone once the replica
+    # applied every operation queued before the last heartbeat
+    def caught_up():
+        status = request(replica_port, 'GET', '/replication')[1]
+        return status['lag_operations'] == 0 and status['applied'] >= 100
+    wait_until(caught_up)
+    status = request(replica_port, 'GET', '/replication')[1]
+    assert status['role'] == 'replica' and status['connected'] and status['synced']
+    assert status['lag_seconds'] == 0
+    assert status['last_heartbeat_seconds_ago'] < 1
+    replicas = request(primary_port, 'GET', '/replication')[1]['replicas']
+    assert len(replicas) == 1 and replicas[0]['pending'] == 0
@@ -0,0 +1,127 @@
+import asyncio
+import socket
+import threading
+from contextlib import contextmanager
+from time import sleep, monotonic
+import pytest
+from api.resp import RespServer
+from api.cache import EvictionStrategies, Cache, ReadThroughCache
+
+
+@contextmanager
+def serving(cache):
+    loop = asyncio.new_event_loop()
+    server = RespServer(cache)
+    listener = loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield listener.sockets[0].getsockname()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        listener.close()
+        loop.run_until_complete(cancel_connections())
+        loop.close()
+
+@pytest.fixture
+def connection():
+    with serving(Cache(2, 60, EvictionStrategies.REJECT)) as address:
+        sock = socket.create_connection(address)
+        yield sock.makefile('rwb')
+        sock.close()
+
+async def cancel_connections():
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def send(connection, *arguments):
+    connection.write(b'*%d\r\n' % len(arguments))
+    for argument in arguments:
+        connection.write(b'$%d\r\n%s\r\n' % (len(argument), argument))
+    connection.flush()
+
+def reply(connection):
+    line = connection.readline()
+    kind, rest = line[:1], line[1:-2]
+    if kind in (b'+', b'-'):
+        return line[:-2].decode()
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        return None if rest == b'-1' else connection.read(int(rest) + 2)[:-2]
+    if kind == b'*':
+        return [reply(connection) for _ in range(int(rest))]
+
+def call(connection, *arguments):
+    send(connection, *arguments)
+    return reply(connection)
+
+def test_ping(connection):
+    assert call(connection, b'PING') == '+PONG'
+    assert call(connection, b'PING', b'hello') == b'hello'
+
+def test_set_get_del(connection):
+    assert call(connection, b'SET', b'key_a', b'{"data": "Hello"}') == '+OK'
+    assert call(connection, b'GET', b'key_a') == b'{"data": "Hello"}'
+    assert call(connection, b'DEL', b'key_a', b'key_b') == 1
+    assert call(connection, b'GET', b'key_a') == None
+
+def test_set_with_ex_and_ttl(connection):
+    assert call(connection, b'SET', b'key_a', b'1', b'EX', b'10') == '+OK'
+    assert call(connection, b'TTL', b'key_a') == 10
+    assert call(connection, b'TTL', b'key_b') == -2
+    assert call(connection, b'SET', b'key_a', b'1', b'EX', b'abc').startswith('-ERR')
+
+def test_expire_and_persist(connection):
+    assert call(connection, b'SET', b'key_a', b'1', b'EX', b'10') == '+OK'
+    assert call(connection, b'EXPIRE', b'key_a', b'100') == 1
+    assert call(connection, b'TTL', b'key_a') == 100
+    assert call(connection, b'PERSIST', b'key_a') == 1
+    assert call(connection, b'TTL', b'key_a') == -1
+    assert call(connection, b'PERSIST', b'key_a') == 0
+    assert call(connection, b'EXPIRE', b'key_b', b'10') == 0
+    assert call(connection, b'EXPIRE', b'key_a', b'0') == 1
+    assert call(connection, b'GET', b'key_a') == None
+
+def test_mset_mget(connection):
+    assert call(connection, b'MSET', b'key_a', b'1', b'key_b', b'[2]') == '+OK'
+    assert call(connection, b'MGET', b'key_a', b'key_b', b'key_c') == [b'1', b'[2]', None]
+    assert call(connection, b'SET', b'key_c', b'3').startswith('-OOM')
+
+def test_mset_is_rolled_back(connection):
+    assert call(connection, b'SET', b'key_a', b'1') == '+OK'
+    assert call(connection, b'MSET', b'key_b', b'2', b'key_c', b'3').startswith('-OOM')
+    # none of the keys of the failed MSET is left
+    assert call(connection, b'MGET', b'key_a', b'key_b', b'key_c') == [b'1', None, None]
+
+def test_errors(connection):
+    assert call(connection, b'SET', b'key_a', b'not json').startswith('-ERR')
+    assert call(connection, b'GET').startswith('-ERR')
+    assert call(connection, b'FLUSHALL').startswith('-ERR unknown command')
+
+def test_pipelined_and_inline_commands(connection):
+    connection.write(b'PING\r\n')
+    send(connection, b'SET', b'key_a', b'1')
+    send(connection, b'GET', b'key_a')
+    connection.flush()
+    assert [reply(connection) for _ in range(3)] == ['+PONG', '+OK', b'1']
+
+def test_loads_do_not_block_the_loop():
+    cache = ReadThroughCache(Cache(10, 60, EvictionStrategies.REJECT))
+    cache.add_loader('slow_', lambda key: sleep(1) or '{"data": "loaded"}')
+    with serving(cache) as address:
+        loading = socket.create_connection(address).makefile('rwb')
+        other = socket.create_connection(address).makefile('rwb')
+        send(loading, b'GET', b'slow_a')
+        sleep(0.1)
+        # the other connections are served while the origin is called
+        started = monotonic()
+        assert call(other, b'SET', b'key_a', b'1') == '+OK'
+        assert call(other, b'MGET', b'key_a') == [b'1']
+        assert monotonic() - started < 0.5
+        assert reply(loading) == b'{"data": "loaded"}'
+        loading.close()
+        other.close()